@@ -0,0 +1,250 @@
+"""
+Async HTTP API for the try-on service
+
+    python api_server.py --host 0.0.0.0 --port 8080
+
+Endpoints:
+- GET  /healthz                          service, queue and warm-up status
+- GET  /catalog/{category}?page=&per_page=  one page of catalog items
+- GET  /search?q=&category=&page=&per_page=&<facet>=<value>  text search with facets
+- GET  /similar?path=&k=                 catalog items that look like a catalog item
+- GET  /samples                          sample user photos
+- POST /uploads/{user_image|item}        raw image bytes (or multipart "file")
+- POST /jobs                             {"user_image", "items", "prompt", "tier"} -> {"job_id"}
+- GET  /jobs/{job_id}                    job status
+- GET  /jobs/{job_id}/result             generated image
+- POST /variants                         {"user_image", "items", "prompt"} -> renders by tier
+- GET  /files?path=&rendition=            catalog, upload or result image (or a
+                                         strip/preview/full display rendition)
+- PUT  /sessions/{session_id}/references {"paths"}: protect files from the sweeper
+- GET  /metrics                          Prometheus metrics (when metrics_enabled)
+
+Blocking work (index reads, image decoding, hashing) runs on the default
+thread pool so the event loop keeps serving other requests.
+"""
+import argparse
+import asyncio
+
+import startup_profile
+# Time the server's imports and setup when TRYON_PROFILE_STARTUP is set
+startup_profile.install()
+
+from aiohttp import web
+
+import metrics
+from catalog_search import FACET_FIELDS
+from jobs import JOB_DONE
+from tryon import TIER_DRAFT, load_config
+from tryon_service import SERVED_ROOTS, TryOnService, check_path, get_tryon_service
+from upload_store import MAX_UPLOAD_BYTES, UploadError
+
+# Query parameters accepted as facet filters by /search
+SEARCH_FACETS = ("type",) + FACET_FIELDS
+
+# Application key holding the TryOnService
+SERVICE_KEY = web.AppKey("service", TryOnService)
+
+
+def _error(status, message):
+    return web.json_response({"error": message}, status=status)
+
+
+async def healthz(request):
+    service = request.app[SERVICE_KEY]
+    return web.json_response(await asyncio.to_thread(service.health))
+
+
+async def catalog(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        page = int(request.query.get("page", 1))
+        per_page = min(max(1, int(request.query.get("per_page", 6))), 100)
+        data = await asyncio.to_thread(service.catalog_page, request.match_info["category"], page, per_page)
+    except ValueError as e:
+        return _error(400, str(e))
+    return web.json_response(data)
+
+
+async def search(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        page = int(request.query.get("page", 1))
+        per_page = min(max(1, int(request.query.get("per_page", 6))), 100)
+        # Facets may be repeated (?color=black&color=navy)
+        filters = {field: request.query.getall(field) for field in SEARCH_FACETS if field in request.query}
+        data = await asyncio.to_thread(
+            service.search, request.query.get("q", ""), request.query.get("category") or None,
+            filters, page, per_page
+        )
+    except ValueError as e:
+        return _error(400, str(e))
+    return web.json_response(data)
+
+
+async def similar(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        k = int(request.query.get("k", 6))
+        items = await asyncio.to_thread(service.similar_items, request.query.get("path", ""), k)
+    except ValueError as e:
+        return _error(400, str(e))
+    return web.json_response({"items": items})
+
+
+async def samples(request):
+    service = request.app[SERVICE_KEY]
+    return web.json_response({"paths": await asyncio.to_thread(service.sample_images)})
+
+
+async def upload(request):
+    service = request.app[SERVICE_KEY]
+    if request.content_type.startswith("multipart/"):
+        form = await request.post()
+        field = form.get("file")
+        if field is None or not hasattr(field, "file"):
+            return _error(400, "Missing 'file' field")
+        data = field.file.read()
+    else:
+        data = await request.read()
+    if not data:
+        return _error(400, "Empty upload")
+    try:
+        path = await asyncio.to_thread(service.save_upload, data, request.match_info["kind"])
+    except UploadError as e:
+        return _error(400, str(e))
+    except ValueError as e:
+        return _error(404, str(e))
+    return web.json_response({"path": path}, status=201)
+
+
+async def submit_job(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        body = await request.json()
+        job_id = await asyncio.to_thread(
+            service.submit, body["user_image"], list(body["items"]), body.get("prompt", ""),
+            body.get("tier", TIER_DRAFT)
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return _error(400, f"Invalid job: {e}")
+    return web.json_response({"job_id": job_id}, status=202, headers={"Location": f"/jobs/{job_id}"})
+
+
+async def variants(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        body = await request.json()
+        data = await asyncio.to_thread(
+            service.variants, body["user_image"], list(body["items"]), body.get("prompt", "")
+        )
+    except (KeyError, TypeError, ValueError) as e:
+        return _error(400, f"Invalid request: {e}")
+    return web.json_response(data)
+
+
+async def get_job(request):
+    service = request.app[SERVICE_KEY]
+    job = await asyncio.to_thread(service.job, request.match_info["job_id"])
+    if job is None:
+        return _error(404, "Unknown or expired job")
+    return web.json_response(job)
+
+
+async def get_result(request):
+    service = request.app[SERVICE_KEY]
+    job = await asyncio.to_thread(service.job, request.match_info["job_id"])
+    if job is None:
+        return _error(404, "Unknown or expired job")
+    if job["status"] != JOB_DONE:
+        return _error(409, f"Job is {job['status']}")
+    return web.FileResponse(job["result"])
+
+
+async def get_file(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        path = check_path(request.query.get("path", ""), SERVED_ROOTS)
+    except ValueError as e:
+        return _error(404, str(e))
+    rendition = request.query.get("rendition")
+    if rendition:
+        try:
+            # Rendering a missing rendition decodes the original
+            path = await asyncio.to_thread(service.rendition, path, rendition)
+        except ValueError as e:
+            return _error(400, str(e))
+    return web.FileResponse(path)
+
+
+async def put_references(request):
+    service = request.app[SERVICE_KEY]
+    try:
+        body = await request.json()
+        await asyncio.to_thread(
+            service.reference, request.match_info["session_id"], list(body.get("paths", []))
+        )
+    except (AttributeError, TypeError, ValueError) as e:
+        return _error(400, f"Invalid references: {e}")
+    return web.json_response({"ok": True})
+
+
+async def get_metrics(request):
+    return web.Response(text=metrics.render_prometheus(), content_type="text/plain", charset="utf-8")
+
+
+async def _start_service(app):
+    # The deployment router is otherwise set up by the first job or health
+    # request; build it before serving, off the event loop
+    service = app[SERVICE_KEY]
+    await asyncio.to_thread(lambda: service.router)
+
+
+def create_app(config):
+    """
+    Build the aiohttp application
+
+    Parameters:
+    - config: Configuration dictionary from tryon.load_config()
+
+    Returns:
+    - aiohttp.web.Application
+    """
+    # Room for the largest accepted upload plus multipart overhead
+    app = web.Application(client_max_size=MAX_UPLOAD_BYTES + 1024 * 1024)
+    app[SERVICE_KEY] = get_tryon_service(config)
+    app.on_startup.append(_start_service)
+    app.add_routes([
+        web.get("/healthz", healthz),
+        web.get("/catalog/{category}", catalog),
+        web.get("/search", search),
+        web.get("/similar", similar),
+        web.get("/samples", samples),
+        web.post("/uploads/{kind}", upload),
+        web.post("/jobs", submit_job),
+        web.get("/jobs/{job_id}", get_job),
+        web.get("/jobs/{job_id}/result", get_result),
+        web.post("/variants", variants),
+        web.get("/files", get_file),
+        web.put("/sessions/{session_id}/references", put_references),
+        web.get("/metrics", get_metrics),
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Try-on HTTP API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--config", help="Path to config.json (default: next to this script)")
+    args = parser.parse_args()
+
+    with startup_profile.step("config"):
+        config = load_config(args.config)
+    with startup_profile.step("service"):
+        app = create_app(config)
+    startup_profile.print_report("service ready")
+    web.run_app(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,16 @@
 import os
 import streamlit as st
-import base64
-from PIL import Image
-from io import BytesIO
-import json
-import requests
-from openai import AzureOpenAI
+import startup_profile
+# Time the app's own imports and setup when TRYON_PROFILE_STARTUP is set
+startup_profile.install()
 import time
 import uuid
-from utils import (display_image, get_catalog_items, save_uploaded_file, 
-                  load_image_as_base64, get_catalog_items_with_thumbnails,
-                  preload_catalog_images)
+from jobs import JOB_DONE, JOB_FAILED
+from tryon import TIER_DRAFT, TIER_HD, estimated_cost, get_config, tier_quality
+from tryon_client import TryOnAPIError, get_tryon_client
+from tryon_service import STAGE_QUEUED, STAGE_WAITING_UPSTREAM, STAGE_GENERATING
+from catalog_warmup import WARMUP_RUNNING, WARMUP_FAILED
+from upload_store import UploadError
 
 # Set page configuration
 st.set_page_config(
@@ -29,105 +29,25 @@ if 'accessories_page' not in st.session_state:
 if 'selected_items' not in st.session_state:
     st.session_state.selected_items = []
 
-# Preload catalog images in the background for faster loading
-preload_catalog_images()
+if 'pending_jobs' not in st.session_state:
+    st.session_state.pending_jobs = []
 
-# Load environment variables for Azure OpenAI
-def load_config():
-    try:
-        # Use absolute path to config.json
-        config_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
-        with open(config_path, "r") as config_file:
-            return json.load(config_file)
-    except FileNotFoundError:
-        # Check for template file and provide guidance
-        template_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.template.json")
-        if os.path.exists(template_path):
-            print("⚠️ config.json not found! Please copy config.template.json to config.json and update with your credentials.")
-            
-        # Use environment variables as fallback
-        return {
-            "imagegen_aoai_resource": os.getenv("imagegen_aoai_resource", ""),
-            "imagegen_aoai_endpoint": os.getenv("imagegen_aoai_endpoint", ""),
-            "imagegen_aoai_deployment": os.getenv("imagegen_aoai_deployment", ""),
-            "imagegen_aoai_api_key": os.getenv("imagegen_aoai_api_key", "")
-        }
+# Inputs and tier of each submitted job, so a draft can be re-rendered in HD
+if 'job_requests' not in st.session_state:
+    st.session_state.job_requests = {}
 
-# Load configuration
-config = load_config()
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
 
-# Initialize Azure OpenAI client
-def get_aoai_client():
-    return AzureOpenAI(
-        azure_endpoint=config["imagegen_aoai_endpoint"],
-        api_version="2025-04-01-preview",
-        api_key=config["imagegen_aoai_api_key"]
-    )
+# Load configuration (parsed once per process, not on every rerun)
+with startup_profile.step("config"):
+    config = get_config()
 
-# Function to generate try-on images
-def generate_try_on_image(user_image_path, item_images, prompt_addon=""):
-    # Prepare URL for image edits
-    url = f"https://{config['imagegen_aoai_resource']}.openai.azure.com/openai/deployments/{config['imagegen_aoai_deployment']}/images/edits?api-version=2025-04-01-preview"
-    
-    # Prepare headers with API key
-    headers = {
-        "api-key": config["imagegen_aoai_api_key"]
-    }
-    
-    # Prepare the files
-    files = []
-    try:
-        files.append(("image[]", open(user_image_path, "rb")))
-        for item_path in item_images:
-            files.append(("image[]", open(item_path, "rb")))
-        
-        # Base prompt for try-on
-        base_prompt = """
-        Generate a high-quality, photorealistic image of the first person wearing the clothing/accessories shown in the other reference images. 
-        Maintain the exact facial features, skin tone, hairstyle, and body type of the first person. 
-        Only change their outfit to match the provided catalog items while keeping their identity intact.
-        The image should look natural and realistic, with appropriate lighting and background.
-        """
-        
-        if prompt_addon:
-            base_prompt += f"\n{prompt_addon}"
-        
-        data = {
-            "prompt": base_prompt,
-            "n": 1,
-            "size": "1024x1536",  # Portrait orientation
-            "quality": "high",
-        }
-        
-        with st.spinner("Generating your virtual try-on image... Please wait, this may take a moment."):
-            response = requests.post(url, headers=headers, files=files, data=data)
-            response.raise_for_status()
-            
-            # Get the image data
-            result = response.json()
-            b64_image = result["data"][0]["b64_json"]
-            
-            # Save the generated image
-            image_filename = f"generated_{str(uuid.uuid4())[:8]}.png"
-            # Make sure the directory exists
-            os.makedirs("generated_images", exist_ok=True)
-            image_path = os.path.join("generated_images", image_filename)
-            
-            # Decode and save the image
-            image_data = base64.b64decode(b64_image)
-            image = Image.open(BytesIO(image_data))
-            image.save(image_path)
-            
-            return image_path, b64_image
-            
-    except Exception as e:
-        st.error(f"Error in image generation: {str(e)}")
-        raise
-    finally:
-        # Ensure all file handles are closed
-        for _, file_obj in files:
-            if hasattr(file_obj, 'close'):
-                file_obj.close()
+# Catalog, uploads and try-on jobs: the in-process service (which warms up
+# the catalog and runs the shared job queue once per process), or the
+# remote API when tryon_api_url is set
+with startup_profile.step("tryon client"):
+    tryon = get_tryon_client(config)
 
 # Helper function to show pagination controls
 def pagination_controls(category_type):
@@ -143,8 +63,8 @@ def pagination_controls(category_type):
     current_page = getattr(st.session_state, page_key)
     
     # Get catalog data to determine total pages
-    catalog_data = get_catalog_items_with_thumbnails(
-        f"catalog/{category_type}", 
+    catalog_data = tryon.catalog_page(
+        category_type, 
         current_page, 
         6  # items per page
     )
@@ -181,6 +101,223 @@ def toggle_item_selection(item_path):
     else:
         st.session_state.selected_items.append(item_path)
 
+# Seconds between reruns while a try-on job is in flight
+JOB_POLL_INTERVAL = 1.0
+
+# Longest the UI waits for the catalog warm-up before rendering anyway
+FIRST_PAGE_WAIT_SECONDS = 10
+
+# Helper function to poll try-on jobs submitted by this session
+def poll_try_on_jobs():
+    """
+    Show the status of this session's pending try-on jobs and collect results
+    
+    Returns:
+    - True if any job is still queued or running
+    """
+    still_pending = []
+    for job_id in st.session_state.pending_jobs:
+        job = tryon.job(job_id)
+        if job is None:
+            # The job expired or the process restarted
+            continue
+        
+        if job["status"] == JOB_DONE:
+            # Only a file reference is kept in session state
+            st.session_state.result_path = job["result"]
+            st.session_state.result_request = st.session_state.job_requests.pop(job_id, None)
+            st.session_state.pop("expired_request", None)
+            st.success("Try-on image generated successfully!")
+        elif job["status"] == JOB_FAILED:
+            st.session_state.job_requests.pop(job_id, None)
+            st.error(f"Error generating try-on image: {job['error']}")
+        else:
+            if job["stage"] == STAGE_QUEUED:
+                st.info(f"Your try-on is queued (position {job['position']})...")
+            elif job["stage"] == STAGE_WAITING_UPSTREAM:
+                st.info(f"Waiting for the image service (position {job['position']})...")
+            elif job["stage"] == STAGE_GENERATING:
+                elapsed = int(time.time() - job["started_at"])
+                st.info(f"Generating your virtual try-on image... ({elapsed}s elapsed)")
+                # Partial images stream in while the final image is refined
+                if job.get("preview"):
+                    st.image(tryon.image_source(job["preview"]), caption="Preview (refining...)", use_column_width=True)
+            still_pending.append(job_id)
+    
+    st.session_state.pending_jobs = still_pending
+    return bool(still_pending)
+
+# Helper function to submit a try-on job for this session
+def submit_try_on(user_image_path, item_paths, prompt_addon, tier):
+    """
+    Queue a try-on and remember its inputs so the result can be re-rendered
+    
+    Parameters:
+    - user_image_path: Path of the user's photo
+    - item_paths: Paths of the selected items
+    - prompt_addon: Extra prompt instructions
+    - tier: TIER_DRAFT or TIER_HD
+    """
+    try:
+        job_id = tryon.submit(user_image_path, item_paths, prompt_addon, tier=tier)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    except TryOnAPIError as e:
+        st.error(f"The try-on service is unavailable, please try again: {e}")
+        return
+    st.session_state.pending_jobs.append(job_id)
+    st.session_state.job_requests[job_id] = {
+        "user_image": user_image_path,
+        "items": list(item_paths),
+        "prompt": prompt_addon,
+        "tier": tier,
+    }
+
+# Helper function to switch a result between its draft and HD renders
+def tier_controls(request, pending):
+    """
+    Show the tier of the current result and a way to get the other tier
+    
+    Parameters:
+    - request: Inputs and tier of the displayed result (see submit_try_on)
+    - pending: True while jobs are in flight (the HD button is disabled)
+    """
+    try:
+        variants = tryon.variants(request["user_image"], request["items"], request["prompt"])
+    except ValueError:
+        # An input was swept or removed; the result can't be re-rendered
+        return
+    except TryOnAPIError as e:
+        st.error(f"The try-on service is unavailable, please try again: {e}")
+        return
+    
+    if request["tier"] == TIER_DRAFT:
+        st.caption("Draft preview")
+        if variants.get(TIER_HD):
+            # Rendered in HD before: switch without another generation
+            if st.button("Show HD Version"):
+                st.session_state.result_path = variants[TIER_HD]
+                st.session_state.result_request = dict(request, tier=TIER_HD)
+                st.rerun()
+        else:
+            cost = estimated_cost(tier_quality(config, TIER_HD))
+            if st.button(f"Render in HD (~${cost:.2f})", type="primary", disabled=pending):
+                submit_try_on(request["user_image"], request["items"], request["prompt"], TIER_HD)
+                st.rerun()
+    else:
+        st.caption("HD render")
+        if variants.get(TIER_DRAFT) and st.button("Show Draft"):
+            st.session_state.result_path = variants[TIER_DRAFT]
+            st.session_state.result_request = dict(request, tier=TIER_DRAFT)
+            st.rerun()
+
+# Facets offered as filters next to the search box
+SEARCH_FACETS = [("type", "Type"), ("color", "Color"), ("category", "Category"), ("brand", "Brand")]
+
+# Helper function to search the whole catalog by name and facets
+def search_panel():
+    """
+    Show a catalog search box with facet filters and paged results
+    """
+    query = st.text_input("🔍 Search the catalog", placeholder="e.g. black jacket", key="search_query")
+    filters = {
+        field: st.session_state.get(f"search_{field}", [])
+        for field, _ in SEARCH_FACETS
+    }
+    if not query and not any(filters.values()):
+        st.session_state.search_page = 1
+        return
+    
+    # A new query starts again from the first page
+    if st.session_state.get('search_last') != (query, repr(filters)):
+        st.session_state.search_last = (query, repr(filters))
+        st.session_state.search_page = 1
+    
+    results = tryon.search(query, None, filters, st.session_state.get('search_page', 1), 6)
+    
+    # Facet values of the matching items, with counts
+    facet_cols = st.columns(len(SEARCH_FACETS))
+    for (field, label), col in zip(SEARCH_FACETS, facet_cols):
+        counts = results["facets"].get(field, {})
+        options = sorted(set(counts) | set(filters[field]))
+        if options:
+            col.multiselect(
+                label, options, key=f"search_{field}",
+                format_func=lambda value, counts=counts: f"{value} ({counts.get(value, 0)})"
+            )
+    
+    pagination = results["pagination"]
+    st.caption(f"{pagination['total_items']} items found")
+    cols = st.columns(3)
+    for idx, item in enumerate(results["items"]):
+        with cols[idx % 3]:
+            thumbnail_path = item.get("thumbnail_path", item["path"])
+            st.image(tryon.image_source(thumbnail_path), caption=item["name"], use_column_width=True)
+            
+            is_selected = item["path"] in st.session_state.selected_items
+            button_label = "✓ Selected" if is_selected else "Select"
+            button_type = "primary" if is_selected else "secondary"
+            if st.button(button_label, key=f"search_btn_{idx}", type=button_type):
+                toggle_item_selection(item["path"])
+                st.rerun()
+    
+    if pagination["total_pages"] > 1:
+        prev_col, page_col, next_col = st.columns([1, 3, 1])
+        if pagination["current_page"] > 1 and prev_col.button("← Prev", key="prev_search"):
+            st.session_state.search_page = pagination["current_page"] - 1
+            st.rerun()
+        page_col.write(f"Page {pagination['current_page']} of {pagination['total_pages']}")
+        if pagination["current_page"] < pagination["total_pages"] and next_col.button("Next →", key="next_search"):
+            st.session_state.search_page = pagination["current_page"] + 1
+            st.rerun()
+
+# Number of items shown by "Similar"
+SIMILAR_ITEMS_COUNT = 6
+
+# Helper function to show items that look like a chosen catalog item
+def similar_items_panel():
+    """
+    Show catalog items visually similar to st.session_state.similar_to
+    """
+    item_path = st.session_state.get('similar_to')
+    if not item_path:
+        return
+    
+    header, close = st.columns([4, 1])
+    header.markdown(f"### Similar to {os.path.splitext(os.path.basename(item_path))[0].replace('_', ' ').title()}")
+    if close.button("Close", key="close_similar"):
+        st.session_state.similar_to = None
+        st.rerun()
+    
+    try:
+        similar = tryon.similar_items(item_path, SIMILAR_ITEMS_COUNT)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    except TryOnAPIError as e:
+        st.error(f"The try-on service is unavailable, please try again: {e}")
+        return
+    if not similar:
+        st.info("Similar items will be available once the catalog has been indexed.")
+        return
+    
+    cols = st.columns(3)
+    for idx, item in enumerate(similar):
+        with cols[idx % 3]:
+            thumbnail_path = item.get("thumbnail_path", item["path"])
+            st.image(tryon.image_source(thumbnail_path), caption=item["name"], use_column_width=True)
+            
+            is_selected = item["path"] in st.session_state.selected_items
+            button_label = "✓ Selected" if is_selected else "Select"
+            button_type = "primary" if is_selected else "secondary"
+            if st.button(button_label, key=f"similar_btn_{idx}", type=button_type):
+                toggle_item_selection(item["path"])
+                st.rerun()
+            if st.button("More like this", key=f"similar_more_{idx}"):
+                st.session_state.similar_to = item["path"]
+                st.rerun()
+
 # Main app UI
 def main():
     st.title("🧥 Virtual Try-On Experience")
@@ -193,26 +330,22 @@ def main():
     with st.sidebar.expander("📷 Your Profile Photo", expanded=True):
         user_image = st.file_uploader("Upload your photo", type=["jpg", "jpeg", "png"])
         if user_image:
-            user_image_path = save_uploaded_file(user_image, "uploads/user_images")
-            st.success(f"Image uploaded successfully!")
-            st.sidebar.image(user_image_path, caption="Your Profile Photo", use_column_width=True)
-            st.session_state.user_image_path = user_image_path
+            try:
+                # Re-saving the same photo on a rerun returns the stored copy
+                user_image_path = tryon.save_upload(user_image.getbuffer(), "user_image")
+            except UploadError as e:
+                st.error(str(e))
+            else:
+                st.success(f"Image uploaded successfully!")
+                st.sidebar.image(tryon.image_source(user_image_path, "preview"), caption="Your Profile Photo", use_column_width=True)
+                st.session_state.user_image_path = user_image_path
         elif 'sample_user_image' not in st.session_state:
             # Use a default image if no user image is provided
             st.sidebar.warning("Please upload your photo or use a sample")
             if st.sidebar.button("Use Sample Photo"):
-                # Look for any image in the user_images folder to use as sample
-                sample_images_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads", "user_images")
-                sample_images = []
-                
-                # Try to create the directory if it doesn't exist
-                os.makedirs(sample_images_dir, exist_ok=True)
-                
-                if os.path.exists(sample_images_dir):
-                    for filename in os.listdir(sample_images_dir):
-                        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-                            sample_images.append(os.path.join(sample_images_dir, filename))
-                
+                # Prefer the protected sample set, which the storage sweeper
+                # never removes
+                sample_images = tryon.sample_images()
                 if sample_images:
                     # Use the first image found as sample
                     sample_path = sample_images[0]
@@ -222,6 +355,20 @@ def main():
                 else:
                     st.sidebar.error("No sample images found. Please upload an image first.")
 
+    # Report catalog warm-up progress until it finishes
+    warmup_status = tryon.warmup_status()
+    if warmup_status["state"] == WARMUP_RUNNING:
+        st.sidebar.progress(
+            warmup_status["progress"],
+            text=f"Preparing catalog... {warmup_status['done']}/{warmup_status['total']} images"
+        )
+    elif warmup_status["state"] == WARMUP_FAILED:
+        st.sidebar.warning(f"Catalog preparation failed: {warmup_status['error']}")
+    
+    # Render as soon as the first catalog page is ready
+    if not warmup_status["first_page_ready"]:
+        tryon.wait_for_first_page(FIRST_PAGE_WAIT_SECONDS)
+    
     # Show selected items count in sidebar
     if st.session_state.selected_items:
         st.sidebar.success(f"{len(st.session_state.selected_items)} items selected for try-on")
@@ -232,14 +379,20 @@ def main():
     with col1:
         st.markdown("## Select items to try on")
         
+        # Search by name, color, category or brand instead of paging
+        search_panel()
+        
+        # Items similar to one picked with "Similar" (any page, any category)
+        similar_items_panel()
+        
         # Categories tabs
         tab1, tab2, tab3 = st.tabs(["Clothing", "Accessories", "Upload Your Item"])
         
         with tab1:
             st.markdown("### Clothing Items")
             # Get paginated clothing items with thumbnails
-            clothing_data = get_catalog_items_with_thumbnails(
-                "catalog/clothing", 
+            clothing_data = tryon.catalog_page(
+                "clothing", 
                 st.session_state.clothing_page, 
                 6  # items per page
             )
@@ -256,7 +409,7 @@ def main():
                     with cols[idx % 3]:
                         # Use thumbnail for faster loading
                         thumbnail_path = item.get("thumbnail_path", item["path"])
-                        st.image(thumbnail_path, caption=item["name"], use_column_width=True)
+                        st.image(tryon.image_source(thumbnail_path), caption=item["name"], use_column_width=True)
                         
                         # Check if item is already selected
                         is_selected = item["path"] in st.session_state.selected_items
@@ -266,12 +419,16 @@ def main():
                         if st.button(button_label, key=f"clothing_btn_{idx}", type=button_type):
                             toggle_item_selection(item["path"])
                             st.rerun()
+                        
+                        if st.button("Similar", key=f"clothing_similar_{idx}"):
+                            st.session_state.similar_to = item["path"]
+                            st.rerun()
         
         with tab2:
             st.markdown("### Accessories")
             # Get paginated accessories items with thumbnails
-            accessories_data = get_catalog_items_with_thumbnails(
-                "catalog/accessories", 
+            accessories_data = tryon.catalog_page(
+                "accessories", 
                 st.session_state.accessories_page, 
                 6  # items per page
             )
@@ -288,7 +445,7 @@ def main():
                     with cols[idx % 3]:
                         # Use thumbnail for faster loading
                         thumbnail_path = item.get("thumbnail_path", item["path"])
-                        st.image(thumbnail_path, caption=item["name"], use_column_width=True)
+                        st.image(tryon.image_source(thumbnail_path), caption=item["name"], use_column_width=True)
                         
                         # Check if item is already selected
                         is_selected = item["path"] in st.session_state.selected_items
@@ -298,15 +455,25 @@ def main():
                         if st.button(button_label, key=f"accessory_btn_{idx}", type=button_type):
                             toggle_item_selection(item["path"])
                             st.rerun()
+                        
+                        if st.button("Similar", key=f"accessory_similar_{idx}"):
+                            st.session_state.similar_to = item["path"]
+                            st.rerun()
         
         with tab3:
             st.markdown("### Upload Your Own Item")
             custom_item = st.file_uploader("Upload clothing or accessories", type=["jpg", "jpeg", "png"])
             
+            custom_item_path = None
             if custom_item:
-                custom_item_path = save_uploaded_file(custom_item, "uploads/user_items")
+                try:
+                    custom_item_path = tryon.save_upload(custom_item.getbuffer(), "item")
+                except UploadError as e:
+                    st.error(str(e))
+            
+            if custom_item_path:
                 st.success("Item uploaded successfully!")
-                st.image(custom_item_path, caption="Your custom item", width=200)
+                st.image(tryon.image_source(custom_item_path, "strip"), caption="Your custom item", width=200)
                 
                 # Check if item is already selected
                 is_selected = custom_item_path in st.session_state.selected_items
@@ -331,23 +498,14 @@ def main():
             disabled=not st.session_state.selected_items or 'user_image_path' not in st.session_state
         ):
             if 'user_image_path' in st.session_state and st.session_state.selected_items:
-                try:
-                    # Generate the try-on image
-                    result_path, b64_image = generate_try_on_image(
-                        st.session_state.user_image_path, 
-                        st.session_state.selected_items,
-                        prompt_addon
-                    )
-                    
-                    # Store the result in session state
-                    st.session_state.result_path = result_path
-                    st.session_state.result_b64 = b64_image
-                    
-                    # Display a success message
-                    st.success("Try-on image generated successfully!")
-                    
-                except Exception as e:
-                    st.error(f"Error generating try-on image: {str(e)}")
+                # Submit a fast draft to the shared worker pool; the result
+                # column polls the job until it finishes and offers an HD render
+                submit_try_on(
+                    st.session_state.user_image_path, 
+                    list(st.session_state.selected_items),
+                    prompt_addon,
+                    TIER_DRAFT
+                )
             else:
                 st.warning("Please upload your photo and select at least one item to try on.")
     
@@ -361,34 +519,79 @@ def main():
             selected_cols = st.columns(3)
             for idx, item_path in enumerate(st.session_state.selected_items):
                 with selected_cols[idx % 3]:
-                    st.image(item_path, use_column_width=True)
+                    st.image(tryon.image_source(item_path, "strip"), use_column_width=True)
                     
                     if st.button("Remove", key=f"remove_{idx}"):
                         st.session_state.selected_items.remove(item_path)
                         st.rerun()
         
+        # Poll submitted try-on jobs
+        still_pending = poll_try_on_jobs()
+        
+        result_image = None
         if 'result_path' in st.session_state:
-            st.image(st.session_state.result_path, caption="Your Virtual Try-On", use_column_width=True)
+            try:
+                # A display-sized rendition; the original PNG is only sent for download
+                result_image = tryon.image_source(st.session_state.result_path, "preview")
+                result_data = tryon.read_file(st.session_state.result_path)
+            except ValueError:
+                # The result cache or the storage sweeper removed the image
+                # since it was generated; forget it instead of failing every rerun
+                st.session_state.expired_request = st.session_state.pop("result_request", None)
+                del st.session_state.result_path
+                result_image = None
+            except TryOnAPIError as e:
+                st.error(f"The try-on service is unavailable, please try again: {e}")
+                result_image = None
+        
+        if result_image is not None:
+            st.image(result_image, caption="Your Virtual Try-On", use_column_width=True)
+            
+            if st.session_state.get('result_request'):
+                tier_controls(st.session_state.result_request, still_pending)
             
             # Download button for the generated image
-            with open(st.session_state.result_path, "rb") as file:
-                btn = st.download_button(
-                    label="Download Image",
-                    data=file,
-                    file_name=os.path.basename(st.session_state.result_path),
-                    mime="image/png"
-                )
+            btn = st.download_button(
+                label="Download Image",
+                data=result_data,
+                file_name=os.path.basename(st.session_state.result_path),
+                mime="image/png"
+            )
                 
             # Share option
             st.markdown("### Share Your Look")
             st.markdown("Copy the link below to share your virtual try-on:")
             share_url = f"https://yourdomain.com/share?image={os.path.basename(st.session_state.result_path)}"
             st.code(share_url)
+        elif 'expired_request' in st.session_state:
+            st.warning("This try-on result has expired. Regenerate it to see it again.")
+            request = st.session_state.expired_request
+            if request and st.button("Regenerate", type="primary", disabled=still_pending):
+                del st.session_state.expired_request
+                submit_try_on(request["user_image"], request["items"], request["prompt"], request["tier"])
+                st.rerun()
         else:
             st.info("Your virtual try-on image will appear here after generation.")
             # Placeholder image
             st.image("https://via.placeholder.com/400x600?text=Try-On+Preview", caption="Preview Placeholder")
+    
+    # Keep this session's files safe from the storage sweeper
+    tryon.reference(
+        st.session_state.session_id,
+        [st.session_state.get("user_image_path"), st.session_state.get("result_path")]
+        + list(st.session_state.selected_items)
+    )
+    
+    # Keep rerunning while jobs are in flight so their status stays current
+    if still_pending:
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
 # Run the app
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        with startup_profile.step("first render"):
+            main()
+    finally:
+        # Printed once per process when TRYON_PROFILE_STARTUP is set
+        startup_profile.print_report("first render")
\ No newline at end of file
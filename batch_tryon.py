@@ -0,0 +1,322 @@
+"""
+Batch try-on generation from a JSONL manifest
+
+Each manifest line describes one job:
+
+    {"id": "look-001", "user_image": "uploads/user_images/person_1.png",
+     "items": ["catalog/clothing/red_dress.png"], "prompt": "Studio background"}
+
+"id" and "prompt" are optional. Results are written to <output>/<id>.png and
+every finished job is appended to <output>/status.jsonl, so an interrupted
+run picks up where it stopped when started again with the same output
+directory (and quality; a job done at another quality is rendered again):
+
+    python batch_tryon.py lookbook.jsonl --output lookbook --concurrency 4
+
+Use --mock to run against an in-process mock of the images/edits endpoint.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import cache_backend
+from content_hash import bytes_sha256
+from tryon import DEFAULT_QUALITY, estimated_cost, generate_try_on, load_config
+
+# Status manifest and run summary written to the output directory
+STATUS_FILENAME = "status.jsonl"
+SUMMARY_FILENAME = "summary.json"
+
+# Job states recorded in the status manifest
+BATCH_DONE = "done"
+BATCH_FAILED = "failed"
+
+
+def _job_id(job, quality):
+    # Stable ID derived from the job's contents and quality, so reruns resume
+    # correctly and renders at different qualities don't overwrite each other
+    payload = json.dumps(
+        {"user_image": job["user_image"], "items": job["items"], "prompt": job.get("prompt", ""),
+         "quality": quality},
+        sort_keys=True
+    )
+    return bytes_sha256(payload.encode("utf-8"))[:12]
+
+
+def load_manifest(manifest_path, quality=DEFAULT_QUALITY):
+    """
+    Read and validate a JSONL batch manifest
+
+    Parameters:
+    - manifest_path: Path to the manifest
+    - quality: Quality the jobs will be rendered at (part of generated IDs)
+
+    Returns:
+    - List of job dictionaries with id, user_image, items and prompt
+    """
+    jobs = []
+    seen = set()
+    with open(manifest_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{manifest_path}:{line_number}: invalid JSON ({e})")
+            if not job.get("user_image") or not job.get("items"):
+                raise ValueError(f"{manifest_path}:{line_number}: 'user_image' and 'items' are required")
+            if isinstance(job["items"], str):
+                job["items"] = [job["items"]]
+            job["prompt"] = job.get("prompt", "")
+            # IDs double as output filenames
+            job["id"] = re.sub(r"[^A-Za-z0-9._-]", "_", str(job.get("id") or _job_id(job, quality)))
+            if job["id"] in seen:
+                raise ValueError(f"{manifest_path}:{line_number}: duplicate job id '{job['id']}'")
+            seen.add(job["id"])
+            jobs.append(job)
+    return jobs
+
+
+def load_status(status_path):
+    """
+    Read the latest status record of every job from a status manifest
+
+    Parameters:
+    - status_path: Path to status.jsonl
+
+    Returns:
+    - Dictionary mapping job id -> last status record
+    """
+    records = {}
+    if not os.path.exists(status_path):
+        return records
+    with open(status_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line
+                continue
+            records[record["id"]] = record
+    return records
+
+
+class BatchRunner:
+    """
+    Runs manifest jobs with bounded concurrency and records their status
+
+    Upstream calls still go through the process-wide deployment router, so
+    each deployment's request rate and in-flight limits apply to batch runs too.
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+    - output_dir: Directory for results, status.jsonl and summary.json
+    - concurrency: Maximum number of jobs running at once
+    - quality: Image quality requested for every job
+    - report: Callable receiving one progress line per finished job
+    """
+
+    def __init__(self, config, output_dir, concurrency=4, quality=DEFAULT_QUALITY, report=print):
+        self.config = config
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.quality = quality
+        self.report = report
+        self.status_path = os.path.join(output_dir, STATUS_FILENAME)
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._started_at = time.time()
+        # Reuse results rendered by the app replicas (and share ours)
+        cache_backend.configure(config)
+
+    def pending_jobs(self, jobs):
+        """
+        Jobs that have not completed at this runner's quality in a previous run
+
+        Parameters:
+        - jobs: Jobs from load_manifest()
+
+        Returns:
+        - List of jobs still to run
+        """
+        status = load_status(self.status_path)
+        pending = []
+        for job in jobs:
+            record = status.get(job["id"])
+            if (record and record["status"] == BATCH_DONE and record.get("quality") == self.quality
+                    and os.path.exists(record["output"])):
+                continue
+            pending.append(job)
+        return pending
+
+    def run(self, jobs):
+        """
+        Run every pending job and write the status manifest and summary
+
+        Parameters:
+        - jobs: Jobs from load_manifest()
+
+        Returns:
+        - Summary dictionary (counts, throughput, estimated cost)
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        pending = self.pending_jobs(jobs)
+        self._counts = {
+            "total": len(jobs),
+            "skipped": len(jobs) - len(pending),
+            "pending": len(pending),
+            "done": 0,
+            "failed": 0,
+            "cached": 0,
+            "estimated_cost": 0.0,
+        }
+        self._started_at = time.time()
+        self.report(f"{len(jobs)} jobs, {self._counts['skipped']} already done, {len(pending)} to run")
+
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-tryon")
+        in_flight = set()
+        try:
+            for job in pending:
+                # Keep submissions bounded so huge manifests aren't queued at once
+                if len(in_flight) >= self.concurrency * 2:
+                    _, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                in_flight.add(executor.submit(self._run_job, job))
+            wait(in_flight)
+        except KeyboardInterrupt:
+            self.report("Interrupted; waiting for running jobs (rerun to resume)")
+            executor.shutdown(wait=True, cancel_futures=True)
+            raise
+        finally:
+            executor.shutdown(wait=True)
+            self._write_summary()
+        return self.summary()
+
+    def summary(self):
+        """
+        Counts, throughput and estimated cost of the current run
+        """
+        with self._lock:
+            summary = dict(self._counts)
+        elapsed = time.time() - self._started_at
+        finished = summary["done"] + summary["failed"]
+        summary["elapsed_seconds"] = elapsed
+        summary["images_per_minute"] = summary["done"] * 60 / elapsed if elapsed else 0.0
+        remaining = summary["pending"] - finished
+        summary["eta_seconds"] = remaining * elapsed / finished if finished else None
+        return summary
+
+    def _run_job(self, job):
+        started = time.time()
+        record = {
+            "id": job["id"], "user_image": job["user_image"], "items": job["items"], "prompt": job["prompt"],
+            "quality": self.quality,
+        }
+        try:
+            result = generate_try_on(
+                self.config, job["user_image"], job["items"], job["prompt"],
+                quality=self.quality, ticket=job["id"]
+            )
+            output_path = os.path.join(self.output_dir, f"{job['id']}.png")
+            self._copy_result(result["path"], output_path)
+            # Cached and coalesced results didn't cost an upstream call of their own
+            cost = 0.0 if result["cached"] or result["coalesced"] else estimated_cost(self.quality)
+            record.update(status=BATCH_DONE, output=output_path, cached=result["cached"], estimated_cost=cost)
+        except Exception as e:
+            record.update(status=BATCH_FAILED, error=str(e))
+        record["elapsed_seconds"] = time.time() - started
+        record["finished_at"] = time.time()
+        self._record(record)
+
+    def _copy_result(self, source_path, output_path):
+        # Write-then-rename so a crash never leaves a truncated result behind
+        tmp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, output_path)
+
+    def _record(self, record):
+        with self._lock:
+            with open(self.status_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if record["status"] == BATCH_DONE:
+                self._counts["done"] += 1
+                self._counts["cached"] += int(record["cached"])
+                self._counts["estimated_cost"] += record["estimated_cost"]
+            else:
+                self._counts["failed"] += 1
+
+        summary = self.summary()
+        finished = summary["done"] + summary["failed"]
+        if record["status"] == BATCH_DONE:
+            outcome = "cached" if record["cached"] else "ok"
+        else:
+            outcome = f"FAILED: {record['error']}"
+        eta = f", ETA {summary['eta_seconds']:.0f}s" if summary["eta_seconds"] is not None else ""
+        self.report(
+            f"[{finished}/{summary['pending']}] {record['id']} {outcome} ({record['elapsed_seconds']:.1f}s) | "
+            f"{summary['images_per_minute']:.1f} images/min, est. ${summary['estimated_cost']:.2f}{eta}"
+        )
+
+    def _write_summary(self):
+        summary = self.summary()
+        summary["quality"] = self.quality
+        summary["finished_at"] = time.time()
+        with open(os.path.join(self.output_dir, SUMMARY_FILENAME), "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+def run_batch(config, manifest_path, output_dir, concurrency=4, quality=DEFAULT_QUALITY, report=print):
+    """
+    Run a batch manifest end to end (see BatchRunner)
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+    - manifest_path: Path to the JSONL manifest
+    - output_dir: Directory for results and the status manifest
+    - concurrency: Maximum number of jobs running at once
+    - quality: Image quality requested for every job
+    - report: Callable receiving progress lines
+
+    Returns:
+    - Summary dictionary
+    """
+    jobs = load_manifest(manifest_path, quality)
+    runner = BatchRunner(config, output_dir, concurrency=concurrency, quality=quality, report=report)
+    return runner.run(jobs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate try-on images from a JSONL manifest")
+    parser.add_argument("manifest", help="JSONL file with one job per line")
+    parser.add_argument("--output", default="batch_output", help="Directory for results and status.jsonl")
+    parser.add_argument("--concurrency", type=int, default=4, help="Jobs running at once")
+    parser.add_argument("--quality", default=DEFAULT_QUALITY, choices=sorted(("low", "medium", "high")))
+    parser.add_argument("--config", help="Path to config.json (default: next to this script)")
+    parser.add_argument("--mock", action="store_true", help="Run against an in-process mock endpoint")
+    parser.add_argument("--mock-latency", type=float, default=0.5, help="Mock response latency in seconds")
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    if args.mock:
+        from mock_aoai_server import start_mock_server
+
+        _, edits_url = start_mock_server(latency=args.mock_latency, quiet=True)
+        # The mock has no quota, so only --concurrency bounds the run
+        config = dict(config, imagegen_aoai_edits_url=edits_url, imagegen_aoai_api_key="mock",
+                      imagegen_aoai_deployment="mock", imagegen_aoai_requests_per_minute=0,
+                      imagegen_aoai_max_in_flight=args.concurrency)
+
+    summary = run_batch(config, args.manifest, args.output, args.concurrency, args.quality)
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Cold-start benchmark: time from a fresh interpreter to the first catalog page
+
+Each run starts a new Python process that does what app.py does before its
+first render (minus Streamlit itself): import the app's modules, parse the
+config, create the try-on service and read the first page of every catalog
+category. "cold" runs start without a catalog index or thumbnails, as on a
+freshly scaled-out container; "warm" runs restart on a prepared volume.
+
+    python benchmarks/bench_cold_start.py --catalog-size 1000 --runs 5
+    python benchmarks/bench_cold_start.py --profile     # per-module import times
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Modules app.py imports, in its order
+APP_MODULES = ("startup_profile", "jobs", "tryon", "tryon_client", "tryon_service", "catalog_warmup", "upload_store")
+
+# Seconds a child waits for the first catalog page before giving up
+FIRST_PAGE_TIMEOUT = 120
+
+
+def child(config_path, profile):
+    # One cold start; prints a JSON line and exits without waiting for the
+    # background warm-up to finish
+    start = time.perf_counter()
+    sys.path.insert(0, ROOT_DIR)
+    import startup_profile
+
+    startup_profile.install(enabled=profile)
+    for name in APP_MODULES:
+        __import__(name)
+    imported = time.perf_counter()
+
+    from tryon import get_config
+    from tryon_client import get_tryon_client
+    from tryon_service import CATALOG_PATHS
+
+    with startup_profile.step("config"):
+        config = get_config(config_path)
+    with startup_profile.step("tryon client"):
+        tryon = get_tryon_client(config)
+    ready = time.perf_counter()
+
+    with startup_profile.step("first page"):
+        tryon.wait_for_first_page(FIRST_PAGE_TIMEOUT)
+        items = sum(len(tryon.catalog_page(category, 1, 6)["items"]) for category in CATALOG_PATHS)
+    first_page = time.perf_counter()
+
+    print(json.dumps({
+        "import_seconds": imported - start,
+        "init_seconds": ready - imported,
+        "first_page_seconds": first_page - ready,
+        "in_process_seconds": first_page - start,
+        "first_page_items": items,
+        "profile": startup_profile.report(),
+    }), flush=True)
+    os._exit(0)
+
+
+def _reset_caches(work_dir):
+    # What a new container starts without: the index, thumbnails and payloads
+    shutil.rmtree(os.path.join(work_dir, ".cache"), ignore_errors=True)
+    for category in os.listdir(os.path.join(work_dir, "catalog")):
+        shutil.rmtree(os.path.join(work_dir, "catalog", category, "thumbnails"), ignore_errors=True)
+
+
+def _start_once(work_dir, config_path, profile):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--config", config_path]
+    if profile:
+        command.append("--profile")
+    start = time.perf_counter()
+    output = subprocess.run(command, cwd=work_dir, capture_output=True, text=True, check=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    # Includes interpreter startup, which the child can't see
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def run(work_dir, catalog_size=200, runs=5, seed=0, image_size=(384, 512), profile=False):
+    """
+    Measure cold and warm starts
+
+    Parameters:
+    - work_dir: Directory for the synthetic catalog, caches and config
+    - catalog_size: Images per catalog category
+    - runs: Starts measured per scenario
+    - seed: Synthetic catalog seed
+    - image_size: (width, height) of the catalog images
+    - profile: Include the slowest imports of the last run
+
+    Returns:
+    - Dictionary of results per scenario
+    """
+    from synthetic_catalog import generate_catalog
+
+    for category in ("clothing", "accessories"):
+        generate_catalog(os.path.join(work_dir, "catalog", category), catalog_size, seed, image_size)
+    config_path = os.path.join(work_dir, "config.json")
+    with open(config_path, "w") as f:
+        json.dump({"imagegen_aoai_api_key": "benchmark", "storage_sweep_interval": 3600}, f)
+
+    results = {"catalog_size": catalog_size, "runs": runs}
+    for scenario in ("cold", "warm"):
+        samples = []
+        for _ in range(runs):
+            if scenario == "cold":
+                _reset_caches(work_dir)
+            samples.append(_start_once(work_dir, config_path, profile))
+        results[scenario] = {
+            key: statistics.median(sample[key] for sample in samples)
+            for key in ("process_seconds", "in_process_seconds", "import_seconds", "init_seconds",
+                        "first_page_seconds")
+        }
+        results[scenario]["first_page_items"] = samples[-1]["first_page_items"]
+        if profile and samples[-1]["profile"]:
+            results[scenario]["slowest_imports"] = {
+                entry["name"]: entry["cumulative"] for entry in samples[-1]["profile"]["modules"][:15]
+            }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure time to the first catalog page of a new process")
+    parser.add_argument("--catalog-size", type=int, default=200, help="Images per catalog category")
+    parser.add_argument("--runs", type=int, default=5, help="Starts per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", action="store_true", help="Report the slowest imports")
+    parser.add_argument("--work-dir", help="Keep generated inputs here (default: a temporary directory)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--config", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.config, args.profile)
+        return
+
+    work_dir = os.path.abspath(args.work_dir or tempfile.mkdtemp(prefix="bench_cold_start_"))
+    os.makedirs(work_dir, exist_ok=True)
+    print(json.dumps(run(work_dir, args.catalog_size, args.runs, args.seed, profile=args.profile), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Compare bytes on the wire and request latency for raw vs normalized uploads
+
+Runs against the local mock images/edits server, so no Azure credentials are
+needed. Upload time on a constrained link is estimated from --uplink-mbps.
+
+    python benchmarks/bench_upload_payload.py --uplink-mbps 20
+"""
+import argparse
+import json
+import mimetypes
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_prep import PayloadCache
+from mock_aoai_server import start_mock_server
+from upstream import ImageEditsClient
+
+
+def make_phone_photo(path, size=(3024, 4032)):
+    """
+    Write a synthetic phone-camera-sized photo with EXIF metadata
+
+    Parameters:
+    - path: Output path (.jpg)
+    - size: (width, height) in pixels
+    """
+    # Smooth gradients plus sensor-like noise, which compresses like a real photo
+    red = Image.linear_gradient("L").resize(size)
+    green = Image.linear_gradient("L").transpose(Image.Transpose.ROTATE_90).resize(size)
+    blue = Image.effect_noise(size, 40)
+    photo = Image.merge("RGB", (red, green, blue))
+    photo = Image.blend(photo, Image.effect_noise(size, 24).convert("RGB"), 0.2)
+    exif = Image.Exif()
+    exif[0x010F] = "BenchmarkCam"  # Make
+    exif[0x0112] = 1  # Orientation
+    photo.save(path, format="JPEG", quality=95, exif=exif)
+
+
+def raw_part(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    return ("image[]", (os.path.basename(path), data, mimetypes.guess_type(path)[0] or "image/png"))
+
+
+def time_requests(client, files, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        client.edit(files, {"prompt": "benchmark", "n": 1})
+        timings.append(time.perf_counter() - start)
+    return sorted(timings)[len(timings) // 2]
+
+
+def run(item_paths, uplink_mbps, repeats):
+    work_dir = tempfile.mkdtemp(prefix="bench_upload_")
+    photo_path = os.path.join(work_dir, "phone_photo.jpg")
+    make_phone_photo(photo_path)
+    inputs = [photo_path] + item_paths
+
+    server, url = start_mock_server(image_size=(64, 64))
+    client = ImageEditsClient(url, "benchmark")
+    try:
+        raw_files = [raw_part(path) for path in inputs]
+        raw_bytes = sum(len(part[1][1]) for part in raw_files)
+
+        cache = PayloadCache(cache_dir=os.path.join(work_dir, "payloads"))
+        start = time.perf_counter()
+        normalized_files = [("image[]", (os.path.basename(p), *cache.get(p)[:2])) for p in inputs]
+        cold_encode = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for path in inputs:
+            cache.get(path)
+        warm_encode = time.perf_counter() - start
+        normalized_bytes = sum(len(part[1][1]) for part in normalized_files)
+
+        bytes_per_second = uplink_mbps * 1_000_000 / 8
+        return {
+            "inputs": len(inputs),
+            "uplink_mbps": uplink_mbps,
+            "raw": {
+                "bytes": raw_bytes,
+                "est_upload_seconds": raw_bytes / bytes_per_second,
+                "local_request_seconds": time_requests(client, raw_files, repeats),
+            },
+            "normalized": {
+                "bytes": normalized_bytes,
+                "est_upload_seconds": normalized_bytes / bytes_per_second,
+                "local_request_seconds": time_requests(client, normalized_files, repeats),
+                "cold_encode_seconds": cold_encode,
+                "warm_encode_seconds": warm_encode,
+            },
+            "bytes_saved_ratio": 1 - normalized_bytes / raw_bytes,
+        }
+    finally:
+        client.close()
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark raw vs normalized upload payloads")
+    parser.add_argument("items", nargs="*", help="Catalog item images to include (default: first 3 clothing items)")
+    parser.add_argument("--uplink-mbps", type=float, default=20.0)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="Write results JSON to this file")
+    args = parser.parse_args()
+
+    item_paths = args.items
+    if not item_paths:
+        catalog_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "catalog", "clothing")
+        item_paths = sorted(
+            os.path.join(catalog_dir, name) for name in os.listdir(catalog_dir)
+            if name.lower().endswith((".png", ".jpg", ".jpeg"))
+        )[:3]
+
+    results = run(item_paths, args.uplink_mbps, args.repeats)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+Offline benchmark suite: catalog pages, thumbnails, upload encoding,
+end-to-end try-on latency/memory against the local mock endpoint and
+time to first page of a new process
+
+Every input is synthetic and seeded, so runs on the same machine are
+comparable. Results are written as JSON; pass --compare to diff against a
+previous run.
+
+    python benchmarks/run_benchmarks.py --catalog-size 1000
+    python benchmarks/run_benchmarks.py --catalog-size 1000 --compare benchmarks/results/before.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import PIL
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_cold_start
+from bench_upload_payload import make_phone_photo
+from catalog_index import CatalogIndex
+from image_prep import normalize_image_file
+from mock_aoai_server import start_mock_server
+from synthetic_catalog import generate_catalog, item_filename
+from thumbnails import ThumbnailEngine
+from tryon import generate_try_on
+from tryon_service import catalog_page
+from upload_store import UploadStore
+
+# Benchmark sections, in run order
+SECTIONS = ("thumbnails", "catalog", "upload", "end_to_end", "cold_start")
+
+# Default results directory
+RESULTS_DIR = os.path.join(ROOT_DIR, "benchmarks", "results")
+
+
+def summarize(samples):
+    """
+    Summary statistics (seconds) for a list of timings
+    """
+    ordered = sorted(samples)
+    return {
+        "n": len(ordered),
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "min": ordered[0],
+        "max": ordered[-1],
+        "mean": statistics.fmean(ordered),
+    }
+
+
+def timed(fn, repeats=1):
+    """
+    Run fn repeatedly and return (summary, last result)
+    """
+    samples = []
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples), result
+
+
+def bench_thumbnails(args):
+    # Cold builds on a fresh copy of the same images, serial and parallel
+    source = os.path.join("catalog", "thumbnail_sample")
+    generate_catalog(source, args.thumbnail_sample, args.seed, args.image_size)
+    results = {"images": args.thumbnail_sample}
+
+    for mode, parallel in (("serial", False), ("parallel", True)):
+        shutil.rmtree(os.path.join(source, "thumbnails"), ignore_errors=True)
+        engine = ThumbnailEngine()
+        start = time.perf_counter()
+        stats = engine.build_catalog(source, parallel=parallel)
+        elapsed = time.perf_counter() - start
+        results[mode] = {
+            "seconds": elapsed,
+            "images_per_second": stats["built"] / elapsed if elapsed else 0.0,
+            "built": stats["built"],
+            "failed": stats["failed"],
+        }
+
+    # Nothing changed: the manifest check alone
+    engine = ThumbnailEngine()
+    results["warm_rebuild"], _ = timed(lambda: engine.build_catalog(source), args.repeats)
+    return results
+
+
+def bench_catalog(args):
+    catalog = os.path.join("catalog", "clothing")
+    results = {"catalog_size": args.catalog_size}
+    results["generate"] = generate_catalog(catalog, args.catalog_size, args.seed, args.image_size)
+
+    # Cold index, then incremental refreshes
+    db_path = os.path.join(".cache", "bench_catalog_index.sqlite3")
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+    shutil.rmtree(os.path.join(catalog, "thumbnails"), ignore_errors=True)
+    index = CatalogIndex(db_path=db_path)
+
+    start = time.perf_counter()
+    index.refresh(catalog, force=True, light=True)
+    results["cold_light_refresh_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index.refresh(catalog, force=True)
+    results["cold_full_refresh_seconds"] = time.perf_counter() - start
+
+    results["warm_refresh"], _ = timed(lambda: index.refresh(catalog, force=True), args.repeats)
+
+    # One new SKU dropped into a large catalog
+    new_path = os.path.join(catalog, item_filename(args.catalog_size, args.seed))
+    shutil.copyfile(os.path.join(catalog, item_filename(0, args.seed)), new_path)
+    start = time.perf_counter()
+    index.refresh(catalog, force=True)
+    results["add_one_refresh_seconds"] = time.perf_counter() - start
+    os.remove(new_path)
+    index.refresh(catalog, force=True)
+
+    total_pages = index.page(catalog, 1, 6)["pagination"]["total_pages"]
+    for name, page in (("first", 1), ("middle", max(1, total_pages // 2)), ("last", total_pages)):
+        results[f"index_page_{name}"], _ = timed(lambda: index.page(catalog, page, 6), args.repeats)
+
+    # The UI's page call (index refresh check + thumbnail existence checks)
+    results["catalog_page"], _ = timed(lambda: catalog_page(catalog, 1, 6), args.repeats)
+    return results
+
+
+def bench_upload(args):
+    photo_path = os.path.join("bench_inputs", "phone_photo.jpg")
+    os.makedirs(os.path.dirname(photo_path), exist_ok=True)
+    make_phone_photo(photo_path)
+    with open(photo_path, "rb") as f:
+        data = f.read()
+
+    results = {"input_bytes": len(data)}
+    results["normalize"], (output, content_type, _) = timed(lambda: normalize_image_file(photo_path), args.repeats)
+    results["output_bytes"] = len(output)
+    results["output_type"] = content_type
+
+    store_dir = os.path.join("bench_inputs", "uploads")
+    shutil.rmtree(store_dir, ignore_errors=True)
+    store = UploadStore(store_dir)
+    results["store_cold"], _ = timed(lambda: store.save_bytes(data))
+    results["store_dedup"], _ = timed(lambda: store.save_bytes(data), args.repeats)
+    return results
+
+
+def bench_end_to_end(args):
+    user_image = os.path.join("bench_inputs", "phone_photo.jpg")
+    if not os.path.exists(user_image):
+        os.makedirs(os.path.dirname(user_image), exist_ok=True)
+        make_phone_photo(user_image)
+    items_dir = os.path.join("catalog", "e2e_items")
+    generate_catalog(items_dir, 3, args.seed, args.image_size)
+    items = [os.path.join(items_dir, item_filename(i, args.seed)) for i in range(3)]
+
+    server, url = start_mock_server(
+        latency=args.latency, error_rate=args.error_rate, payload_bytes=args.payload_bytes,
+        seed=args.seed, retry_after=0,
+    )
+    config = {
+        "imagegen_aoai_edits_url": url,
+        "imagegen_aoai_api_key": "benchmark",
+        "imagegen_aoai_deployment": "bench-mock",
+        # The mock has no quota; only the benchmark concurrency applies
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_aoai_max_in_flight": args.concurrency,
+        "imagegen_aoai_max_retries": 8,
+    }
+    run_id = time.time_ns()
+
+    def one(i):
+        start = time.perf_counter()
+        # A unique prompt per request defeats the result cache
+        generate_try_on(config, user_image, items, f"benchmark {run_id} {i}")
+        return time.perf_counter() - start
+
+    try:
+        one(-1)  # warm-up: payload cache, connection pool
+
+        # Peak Python allocations for a single request
+        tracemalloc.start()
+        one(-2)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(one, range(args.requests)))
+        wall = time.perf_counter() - start
+
+        cache_hit, _ = timed(lambda: generate_try_on(config, user_image, items, f"benchmark {run_id} 0"), args.repeats)
+        return {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "mock_latency": args.latency,
+            "mock_error_rate": args.error_rate,
+            "payload_bytes": args.payload_bytes,
+            "latency": summarize(latencies),
+            "throughput_per_second": args.requests / wall,
+            "overhead_median_seconds": statistics.median(latencies) - args.latency,
+            "cache_hit": cache_hit,
+            "peak_traced_bytes_per_request": peak,
+            "upstream_requests": server.stats["requests"],
+            "upstream_errors": server.stats["errors"],
+        }
+    finally:
+        server.shutdown()
+
+
+def bench_cold_start_section(args):
+    # Fresh processes in their own directory, so the other sections' caches
+    # don't make the "cold" starts warm
+    return bench_cold_start.run(
+        os.path.abspath("cold_start"), args.cold_start_catalog_size, args.repeats, args.seed, args.image_size
+    )
+
+
+def environment():
+    """
+    Machine and code version, recorded with every result
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+        "commit": commit,
+    }
+
+
+def flatten(results, prefix=""):
+    """
+    Numeric leaves of a results dictionary keyed by dotted path
+    """
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(old, new):
+    """
+    Print metrics present in both runs with their relative change
+    """
+    old_flat = flatten(old["results"])
+    new_flat = flatten(new["results"])
+    for key in sorted(old_flat.keys() & new_flat.keys()):
+        before, after = old_flat[key], new_flat[key]
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{key:60s} {before:14.6g} -> {after:14.6g}  {change}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the offline benchmark suite")
+    parser.add_argument("--sections", nargs="+", choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument("--catalog-size", type=int, default=1000, help="Images in the synthetic catalog")
+    parser.add_argument("--thumbnail-sample", type=int, default=100, help="Images thumbnailed serial vs parallel")
+    parser.add_argument("--image-size", type=int, nargs=2, default=(384, 512), metavar=("W", "H"))
+    parser.add_argument("--requests", type=int, default=20, help="End-to-end try-on requests")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock upstream latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Mock upstream error rate")
+    parser.add_argument("--payload-bytes", type=int, default=2_000_000, help="Size of the mock's returned PNG")
+    parser.add_argument("--cold-start-catalog-size", type=int, default=200,
+                        help="Images per category for the cold-start runs")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work-dir", help="Keep generated inputs here (default: a temporary directory)")
+    parser.add_argument("--output", help="Results JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Previous results JSON to compare against")
+    args = parser.parse_args()
+    args.image_size = tuple(args.image_size)
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="tryon_bench_")
+    os.makedirs(work_dir, exist_ok=True)
+    output = os.path.abspath(args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json"))
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    # Every relative path used by the app (caches, index, generated_images) lands here
+    os.chdir(work_dir)
+
+    runners = {
+        "thumbnails": bench_thumbnails,
+        "catalog": bench_catalog,
+        "upload": bench_upload,
+        "end_to_end": bench_end_to_end,
+        "cold_start": bench_cold_start_section,
+    }
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "environment": environment(),
+        "arguments": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "results": {},
+    }
+    for section in args.sections:
+        print(f"Running {section}...", flush=True)
+        start = time.perf_counter()
+        report["results"][section] = runners[section](args)
+        print(f"  done in {time.perf_counter() - start:.1f}s", flush=True)
+    # Linux reports kilobytes
+    report["results"]["max_rss_bytes"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report["results"], indent=2))
+    print(f"Results written to {output}")
+
+    if compare_path:
+        with open(compare_path) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
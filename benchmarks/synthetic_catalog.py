@@ -0,0 +1,137 @@
+"""
+Generate a synthetic catalog of garment-like product images
+
+Images are deterministic for a given seed and index, so two runs with the
+same arguments produce byte-identical catalogs. Existing files are kept,
+so growing a catalog from 1k to 10k images only renders the new ones.
+
+    python benchmarks/synthetic_catalog.py /tmp/catalog/clothing --count 10000
+"""
+import argparse
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageDraw
+
+# Default product image size (portrait, like the real catalog)
+DEFAULT_SIZE = (768, 1024)
+
+# Garment names combined into filenames, so names look like real SKUs
+COLORS = ("red", "blue", "black", "white", "green", "beige", "navy", "pink", "grey", "yellow")
+GARMENTS = ("dress", "shirt", "jacket", "sweater", "blouse", "skirt", "coat", "hoodie", "tshirt", "jeans")
+
+
+def item_filename(index, seed=0):
+    """
+    Filename of the index-th synthetic item (e.g. 000042_navy_coat.png)
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    return f"{index:06d}_{rng.choice(COLORS)}_{rng.choice(GARMENTS)}.png"
+
+
+def render_item(path, index, seed=0, size=DEFAULT_SIZE):
+    """
+    Render one synthetic product image: a garment silhouette with a pattern
+    on a transparent background
+
+    Parameters:
+    - path: Output PNG path
+    - index: Item number (selects shape, colors and pattern)
+    - seed: Catalog seed
+    - size: (width, height) in pixels
+    """
+    rng = random.Random(seed * 1_000_003 + index)
+    width, height = size
+    img = Image.new("RGBA", size, (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    color = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+    accent = tuple(rng.randrange(256) for _ in range(3)) + (255,)
+
+    # Torso, sleeves and a collar, with randomized proportions
+    shoulder = int(width * rng.uniform(0.15, 0.3))
+    hem = int(width * rng.uniform(0.05, 0.25))
+    body = [(shoulder, height * 0.15), (width - shoulder, height * 0.15),
+            (width - hem, height * 0.92), (hem, height * 0.92)]
+    draw.polygon(body, fill=color)
+    sleeve = int(height * rng.uniform(0.2, 0.45))
+    draw.polygon([(shoulder, height * 0.15), (shoulder - width * 0.12, height * 0.15 + sleeve),
+                  (shoulder + width * 0.02, height * 0.15 + sleeve)], fill=color)
+    draw.polygon([(width - shoulder, height * 0.15), (width - shoulder + width * 0.12, height * 0.15 + sleeve),
+                  (width - shoulder - width * 0.02, height * 0.15 + sleeve)], fill=color)
+    draw.ellipse([width * 0.4, height * 0.1, width * 0.6, height * 0.2], fill=(0, 0, 0, 0))
+    silhouette = img.getchannel("A")
+
+    # Stripes or dots give each item distinct texture (and realistic file sizes)
+    if rng.random() < 0.5:
+        step = rng.randrange(12, 48)
+        for y in range(int(height * 0.2), int(height * 0.9), step):
+            draw.line([(hem, y), (width - hem, y)], fill=accent, width=max(1, step // 4))
+    else:
+        for _ in range(rng.randrange(20, 120)):
+            x = rng.uniform(width * 0.25, width * 0.75)
+            y = rng.uniform(height * 0.2, height * 0.9)
+            r = rng.uniform(3, 14)
+            draw.ellipse([x - r, y - r, x + r, y + r], fill=accent)
+
+    # Keep everything outside the garment transparent
+    img.putalpha(silhouette)
+    img.save(path, format="PNG")
+
+
+def _render_chunk(job):
+    catalog_path, indices, seed, size = job
+    created = 0
+    for index in indices:
+        path = os.path.join(catalog_path, item_filename(index, seed))
+        if not os.path.exists(path):
+            render_item(path, index, seed, size)
+            created += 1
+    return created
+
+
+def generate_catalog(catalog_path, count, seed=0, size=DEFAULT_SIZE, max_workers=None):
+    """
+    Create a synthetic catalog directory with count images
+
+    Parameters:
+    - catalog_path: Directory to fill
+    - count: Number of images
+    - seed: Catalog seed (same seed, same images)
+    - size: (width, height) of each image
+    - max_workers: Processes used for rendering (default: CPU count)
+
+    Returns:
+    - Dictionary with count, created and elapsed seconds
+    """
+    os.makedirs(catalog_path, exist_ok=True)
+    start = time.perf_counter()
+    chunk = 64
+    jobs = [
+        (catalog_path, range(first, min(first + chunk, count)), seed, tuple(size))
+        for first in range(0, count, chunk)
+    ]
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            created = sum(executor.map(_render_chunk, jobs))
+    else:
+        created = sum(_render_chunk(job) for job in jobs)
+    return {"count": count, "created": created, "elapsed_seconds": time.perf_counter() - start}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic product catalog")
+    parser.add_argument("catalog_path", help="Directory to fill")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--width", type=int, default=DEFAULT_SIZE[0])
+    parser.add_argument("--height", type=int, default=DEFAULT_SIZE[1])
+    args = parser.parse_args()
+
+    result = generate_catalog(args.catalog_path, args.count, args.seed, (args.width, args.height))
+    print(f"{result['created']} of {result['count']} images created in {result['elapsed_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
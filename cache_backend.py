@@ -0,0 +1,487 @@
+"""
+Shared cache backends, so replicas reuse each other's work
+
+Every replica keeps its local caches (catalog thumbnails, the catalog index,
+normalized upload payloads, generated results). With "shared_cache_url" set,
+the thumbnails, the index's visual descriptors, payloads and results also
+read from and write to a store shared by all replicas, so a new replica
+fetches what another one already built instead of re-rendering thumbnails
+or re-generating results:
+
+    "shared_cache_url": "/mnt/shared/tryon-cache"     a directory on a shared volume
+    "shared_cache_url": "redis://cache-host:6379/0"   any Redis-protocol server
+
+Entries are grouped into namespaces, each with its own time-to-live
+(shared_cache_ttls overrides the defaults). The filesystem backend keeps
+within shared_cache_max_bytes by evicting least recently used entries; for
+Redis, set maxmemory and an allkeys-lru policy on the server (the local
+stand-in, mock_redis_server.py, does the same). A shared cache that is down
+or slow never fails a request: errors count as misses.
+
+Catalog listings are not shared: each replica's catalog index is a local
+SQLite file built by scanning its own catalog directories, because the
+listing is only valid for the files that replica can see. Its expensive
+parts (thumbnails and descriptors, by content hash) come from the shared
+cache; what a new replica still does itself is stat and hash each catalog
+file once.
+"""
+import hashlib
+import json
+import os
+import socket
+import struct
+import threading
+import time
+from urllib.parse import urlparse
+
+import metrics
+
+# Namespaces and their default time-to-live in seconds
+DEFAULT_TTLS = {
+    "thumbnails": 30 * 24 * 3600,   # catalog thumbnails, by source content hash
+    "descriptors": 30 * 24 * 3600,  # visual descriptors of catalog items
+    "payloads": 7 * 24 * 3600,      # normalized upload payloads
+    "results": 14 * 24 * 3600,      # generated try-on images
+    "families": 14 * 24 * 3600,     # render tiers of the same inputs
+}
+
+# Byte budget of the filesystem backend (2 GiB)
+DEFAULT_MAX_BYTES = 2 * 1024 * 1024 * 1024
+
+# Values larger than this are not shared (16 MiB)
+DEFAULT_MAX_VALUE_BYTES = 16 * 1024 * 1024
+
+# Seconds before a shared cache operation is abandoned
+DEFAULT_TIMEOUT = 2.0
+
+# Seconds a failing shared cache is skipped before it is tried again
+RETRY_INTERVAL = 30
+
+# Prefix of every key written to a Redis server
+REDIS_KEY_PREFIX = "tryon"
+
+_requests_total = metrics.counter(
+    "shared_cache_requests_total", "Shared cache operations by namespace and outcome", ("namespace", "result")
+)
+
+
+def pack(metadata, parts):
+    """
+    Bundle JSON metadata and named binary parts into one value
+
+    Parameters:
+    - metadata: JSON-serializable dictionary
+    - parts: Dictionary mapping part name to bytes
+
+    Returns:
+    - Bytes accepted by unpack()
+    """
+    header = json.dumps({"metadata": metadata, "parts": [[name, len(data)] for name, data in parts.items()]})
+    header = header.encode("utf-8")
+    return struct.pack(">I", len(header)) + header + b"".join(parts.values())
+
+
+def unpack(value):
+    """
+    Split a value built by pack()
+
+    Returns:
+    - (metadata, parts) tuple, or None if the value is malformed
+    """
+    try:
+        (header_length,) = struct.unpack_from(">I", value)
+        header = json.loads(value[4:4 + header_length].decode("utf-8"))
+        parts = {}
+        offset = 4 + header_length
+        for name, length in header["parts"]:
+            parts[name] = value[offset:offset + length]
+            offset += length
+        if offset != len(value):
+            return None
+        return header["metadata"], parts
+    except (struct.error, ValueError, KeyError, TypeError):
+        return None
+
+
+class FileSystemBackend:
+    """
+    Shared cache in a directory, e.g. on a volume mounted by every replica
+
+    Each entry is one file named after the hash of its key, holding its
+    expiry time and value, written atomically. Reads refresh the file's
+    mtime, and writes evict least recently used entries once the directory
+    grows past its byte budget.
+
+    Parameters:
+    - root: Cache directory
+    - max_bytes: Byte budget for all entries
+    """
+
+    def __init__(self, root, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        # Bytes written since the directory size was last measured (None: never)
+        self._unchecked_bytes = None
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        (expires_at,) = struct.unpack_from(">d", data)
+        if expires_at and expires_at < time.time():
+            self._remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data[8:]
+
+    def set(self, key, value, ttl=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(struct.pack(">d", time.time() + ttl if ttl else 0.0))
+            f.write(value)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._unchecked_bytes is not None:
+                self._unchecked_bytes += len(value) + 8
+            # Other replicas write here too, so the size is measured, not tracked
+            due = self._unchecked_bytes is None or self._unchecked_bytes > self.max_bytes // 10
+            if due:
+                self._unchecked_bytes = 0
+        if due:
+            self._evict()
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def _path(self, key):
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.root, digest[:2], digest)
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _evict(self):
+        entries = []
+        total = 0
+        now = time.time()
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if filename.endswith(".tmp"):
+                    # Left behind by an interrupted write
+                    if now - stat.st_mtime > 3600:
+                        self._remove(path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+
+class RedisError(Exception):
+    """
+    Raised when a Redis-protocol server returns an error reply
+    """
+
+
+class RedisBackend:
+    """
+    Shared cache on a Redis-protocol server (Redis, Valkey, KeyDB, ...)
+
+    A minimal RESP client over pooled sockets: GET, SET with PX expiry and
+    DEL are all the cache needs. Size limits are the server's maxmemory.
+
+    Parameters:
+    - host / port: Server address
+    - db: Database number (SELECT)
+    - password: Optional password (AUTH)
+    - username: Optional ACL user name, sent with the password
+    - timeout: Seconds for connecting and for each reply
+    """
+
+    def __init__(self, host="127.0.0.1", port=6379, db=0, password=None, username=None, timeout=DEFAULT_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.username = username
+        self.timeout = timeout
+        self._pool = []
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._command(b"GET", self._key(key))
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self._command(b"SET", self._key(key), value, b"PX", str(int(ttl * 1000)).encode("ascii"))
+        else:
+            self._command(b"SET", self._key(key), value)
+
+    def delete(self, key):
+        self._command(b"DEL", self._key(key))
+
+    def ping(self):
+        """
+        True if the server answers
+        """
+        return self._command(b"PING") == b"PONG"
+
+    def _key(self, key):
+        return f"{REDIS_KEY_PREFIX}:{key}".encode("utf-8")
+
+    def _command(self, *args):
+        connection = self._checkout()
+        try:
+            sock, reader = connection
+            sock.sendall(_encode_command(args))
+            reply = _read_reply(reader)
+        except BaseException:
+            # The connection may be mid-reply; never reuse it
+            connection[0].close()
+            raise
+        with self._lock:
+            self._pool.append(connection)
+        if isinstance(reply, RedisError):
+            raise reply
+        return reply
+
+    def _checkout(self):
+        with self._lock:
+            if self._pool:
+                return self._pool.pop()
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        connection = (sock, sock.makefile("rb"))
+        try:
+            if self.password and self.username:
+                self._handshake(connection, b"AUTH", self.username.encode("utf-8"), self.password.encode("utf-8"))
+            elif self.password:
+                self._handshake(connection, b"AUTH", self.password.encode("utf-8"))
+            if self.db:
+                self._handshake(connection, b"SELECT", str(self.db).encode("ascii"))
+        except BaseException:
+            sock.close()
+            raise
+        return connection
+
+    def _handshake(self, connection, *args):
+        sock, reader = connection
+        sock.sendall(_encode_command(args))
+        reply = _read_reply(reader)
+        if isinstance(reply, RedisError):
+            raise reply
+
+
+def _encode_command(args):
+    chunks = [b"*%d\r\n" % len(args)]
+    for arg in args:
+        chunks.append(b"$%d\r\n" % len(arg))
+        chunks.append(arg)
+        chunks.append(b"\r\n")
+    return b"".join(chunks)
+
+
+def _read_reply(reader):
+    # Errors are returned, not raised, so a whole reply is always consumed
+    line = reader.readline()
+    if not line.endswith(b"\r\n"):
+        raise ConnectionError("Connection closed by the cache server")
+    kind, payload = line[:1], line[1:-2]
+    if kind == b"+":
+        return payload
+    if kind == b"-":
+        return RedisError(payload.decode("utf-8", "replace"))
+    if kind == b":":
+        return int(payload)
+    if kind == b"$":
+        length = int(payload)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError("Connection closed by the cache server")
+        return data[:-2]
+    if kind == b"*":
+        count = int(payload)
+        return None if count < 0 else [_read_reply(reader) for _ in range(count)]
+    raise ConnectionError(f"Unexpected reply from the cache server: {line[:32]!r}")
+
+
+def open_backend(url, max_bytes=DEFAULT_MAX_BYTES, timeout=DEFAULT_TIMEOUT):
+    """
+    Backend for a shared cache URL
+
+    Parameters:
+    - url: redis://[[user]:password@]host[:port][/db], file:///path or a plain
+      directory path
+    - max_bytes: Byte budget (filesystem backend)
+    - timeout: Seconds per operation (Redis backend)
+
+    Returns:
+    - FileSystemBackend or RedisBackend
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "redis":
+        db = parsed.path.strip("/")
+        return RedisBackend(
+            host=parsed.hostname or "127.0.0.1",
+            port=parsed.port or 6379,
+            db=int(db) if db else 0,
+            password=parsed.password,
+            username=parsed.username or None,
+            timeout=timeout,
+        )
+    if parsed.scheme == "file":
+        return FileSystemBackend(parsed.path, max_bytes=max_bytes)
+    if parsed.scheme:
+        raise ValueError(f"Unsupported shared cache URL: {url}")
+    return FileSystemBackend(url, max_bytes=max_bytes)
+
+
+class CacheNamespace:
+    """
+    One namespace of a shared cache, with its own TTL
+
+    Backend errors are logged once and treated as misses, and the backend
+    is then skipped for RETRY_INTERVAL seconds, so an unreachable cache only
+    costs the local work it would have saved, not a timeout per lookup.
+
+    Parameters:
+    - backend: FileSystemBackend or RedisBackend
+    - namespace: Namespace name (prefixed to every key)
+    - ttl: Seconds entries live (None: until evicted)
+    - max_value_bytes: Larger values are not stored
+    """
+
+    def __init__(self, backend, namespace, ttl=None, max_value_bytes=DEFAULT_MAX_VALUE_BYTES):
+        self.backend = backend
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_value_bytes = max_value_bytes
+        self._failing = False
+        self._retry_at = 0.0
+
+    def get(self, key):
+        """
+        Value stored under a key, or None on a miss or error
+        """
+        if self._skipping():
+            return None
+        try:
+            value = self.backend.get(f"{self.namespace}:{key}")
+        except (OSError, RedisError, ValueError, struct.error) as e:
+            self._failed("read", e)
+            return None
+        self._failing = False
+        _requests_total.inc(namespace=self.namespace, result="hit" if value is not None else "miss")
+        return value
+
+    def set(self, key, value):
+        """
+        Store a value (skipped if it is over the size limit or on error)
+        """
+        if len(value) > self.max_value_bytes or self._skipping():
+            _requests_total.inc(namespace=self.namespace, result="skipped")
+            return
+        try:
+            self.backend.set(f"{self.namespace}:{key}", value, self.ttl)
+        except (OSError, RedisError, ValueError) as e:
+            self._failed("write", e)
+            return
+        self._failing = False
+        _requests_total.inc(namespace=self.namespace, result="stored")
+
+    def get_json(self, key):
+        """
+        JSON value stored under a key, or None
+        """
+        value = self.get(key)
+        if value is None:
+            return None
+        try:
+            return json.loads(value.decode("utf-8"))
+        except ValueError:
+            return None
+
+    def set_json(self, key, value):
+        """
+        Store a JSON-serializable value
+        """
+        self.set(key, json.dumps(value).encode("utf-8"))
+
+    def _skipping(self):
+        return self._failing and time.monotonic() < self._retry_at
+
+    def _failed(self, operation, error):
+        _requests_total.inc(namespace=self.namespace, result="error")
+        self._retry_at = time.monotonic() + RETRY_INTERVAL
+        if not self._failing:
+            self._failing = True
+            print(f"Shared cache {operation} failed ({self.namespace}): {error}")
+
+
+# Process-wide namespaces, set up by configure()
+_namespaces = {}
+_configure_lock = threading.Lock()
+
+
+def configure(config):
+    """
+    Connect the local caches to the shared cache named in the configuration,
+    once per process
+
+    Parameters:
+    - config: Configuration dictionary; reads shared_cache_url,
+      shared_cache_max_bytes, shared_cache_ttls and shared_cache_timeout
+    """
+    url = config.get("shared_cache_url")
+    if not url:
+        return
+    with _configure_lock:
+        if _namespaces:
+            return
+        backend = open_backend(
+            url,
+            max_bytes=int(config.get("shared_cache_max_bytes", DEFAULT_MAX_BYTES)),
+            timeout=float(config.get("shared_cache_timeout", DEFAULT_TIMEOUT)),
+        )
+        ttls = dict(DEFAULT_TTLS, **(config.get("shared_cache_ttls") or {}))
+        max_value_bytes = int(config.get("shared_cache_max_value_bytes", DEFAULT_MAX_VALUE_BYTES))
+        for namespace, ttl in ttls.items():
+            _namespaces[namespace] = CacheNamespace(backend, namespace, ttl, max_value_bytes)
+
+
+def shared_cache(namespace):
+    """
+    A namespace of the shared cache
+
+    Parameters:
+    - namespace: Key of DEFAULT_TTLS
+
+    Returns:
+    - CacheNamespace, or None when no shared cache is configured
+    """
+    return _namespaces.get(namespace)
@@ -0,0 +1,519 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+from cache_backend import shared_cache
+from content_hash import file_sha256
+from thumbnails import IMAGE_EXTENSIONS, get_thumbnail_engine
+
+# SQLite database holding the index for every catalog directory
+DEFAULT_INDEX_PATH = os.path.join(".cache", "catalog_index.sqlite3")
+
+# Minimum seconds between directory scans of the same catalog
+DEFAULT_REFRESH_INTERVAL = 5
+
+# Rescan even if the directory mtime is unchanged (catches in-place overwrites)
+DEFAULT_FULL_RESCAN_INTERVAL = 60
+
+# Above this many changed files, thumbnails are built on the process pool
+BULK_THUMBNAIL_THRESHOLD = 16
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    path TEXT PRIMARY KEY,
+    catalog TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    name TEXT NOT NULL,
+    type TEXT NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    sha256 TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    thumbnails TEXT,
+    descriptor BLOB
+);
+CREATE UNIQUE INDEX IF NOT EXISTS items_by_catalog ON items (catalog, filename);
+CREATE TABLE IF NOT EXISTS catalogs (
+    catalog TEXT PRIMARY KEY,
+    item_count INTEGER NOT NULL,
+    scanned_at REAL NOT NULL
+);
+"""
+
+
+def item_display_name(filename):
+    """
+    Derive a display name from an image filename (e.g. blue_dress.png -> Blue Dress)
+    """
+    return os.path.splitext(filename)[0].replace('_', ' ').title()
+
+
+def item_type(catalog_path):
+    """
+    Item type for a catalog directory
+    """
+    return "clothing" if "clothing" in catalog_path else "accessory"
+
+
+class CatalogIndex:
+    """
+    Persistent SQLite index of catalog images
+
+    Stores path, name, type, dimensions, content hash, size/mtime, thumbnail
+    paths and a visual descriptor (see similarity.py) per image. Refreshes
+    stat the directory with os.scandir and only hash, measure, thumbnail and
+    describe entries that changed, so new SKUs show up within seconds without
+    a full rescan. Pages are keyset queries on (catalog, filename) starting
+    from the nearest page whose first filename is known, so paging through
+    even a very large catalog costs O(page) per page.
+    Descriptors are also kept in an in-memory matrix per catalog for
+    similar-item queries, updated by each refresh.
+
+    Parameters:
+    - db_path: Path of the SQLite database
+    - refresh_interval: Minimum seconds between scans of one catalog
+    - full_rescan_interval: Maximum seconds a scan may be skipped because the
+      directory mtime did not change
+    """
+
+    def __init__(self, db_path=DEFAULT_INDEX_PATH, refresh_interval=DEFAULT_REFRESH_INTERVAL,
+                 full_rescan_interval=DEFAULT_FULL_RESCAN_INTERVAL):
+        self.db_path = db_path
+        self.refresh_interval = refresh_interval
+        self.full_rescan_interval = full_rescan_interval
+        self._local = threading.local()
+        self._scan_state = {}
+        self._state_lock = threading.Lock()
+        self._refresh_locks = {}
+        self._matrices = {}
+        self._listeners = []
+        # (catalog, items_per_page) -> item count and {page: first filename}
+        self._page_anchors = {}
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        connection = self._connection()
+        connection.executescript(SCHEMA)
+        # Indexes created before descriptors existed get the column; the
+        # next full refresh fills it in
+        columns = [row["name"] for row in connection.execute("PRAGMA table_info(items)")]
+        if "descriptor" not in columns:
+            with connection:
+                connection.execute("ALTER TABLE items ADD COLUMN descriptor BLOB")
+
+    def refresh(self, catalog_path, force=False, light=False):
+        """
+        Bring the index for one catalog directory up to date
+
+        Parameters:
+        - catalog_path: Path to the catalog directory
+        - force: Scan even if the catalog was scanned recently
+        - light: Only record names and stat info for changed files; hashes,
+          dimensions and thumbnails are filled in by the next full refresh
+
+        Returns:
+        - Dictionary with added, updated and removed counts, or None if the
+          scan was skipped
+        """
+        catalog = os.path.normpath(catalog_path)
+        if not os.path.isdir(catalog):
+            os.makedirs(catalog, exist_ok=True)
+
+        if not force and not self._scan_due(catalog):
+            return None
+
+        with self._refresh_lock(catalog):
+            # Another thread may have refreshed while we waited
+            if not force and not self._scan_due(catalog):
+                return None
+            dir_mtime_ns = os.stat(catalog).st_mtime_ns
+            with metrics.span("catalog.refresh_light" if light else "catalog.refresh"):
+                stats = self._scan(catalog_path, catalog, light)
+            now = time.time()
+            with self._state_lock:
+                self._scan_state[catalog] = {
+                    "scanned_at": now,
+                    "full_scan_at": now,
+                    "dir_mtime_ns": dir_mtime_ns,
+                }
+            return stats
+
+    def page(self, catalog_path, page=1, items_per_page=6):
+        """
+        Get one page of items from the index
+
+        Parameters:
+        - catalog_path: Path to the catalog directory
+        - page: Page number (1-indexed, clamped to the valid range)
+        - items_per_page: Number of items per page
+
+        Returns:
+        - Dictionary with items and pagination info
+        """
+        catalog = os.path.normpath(catalog_path)
+        with metrics.span("catalog.page_query"):
+            total_items = self.count(catalog_path)
+            total_pages = max(1, (total_items + items_per_page - 1) // items_per_page)
+            current_page = min(max(1, page), total_pages)
+
+            # Seek to the nearest page at or before this one whose first
+            # filename is known; an OFFSET only covers the pages in between,
+            # so paging forward or back costs O(page), not O(offset)
+            with self._state_lock:
+                anchors = self._page_anchors.get((catalog, items_per_page))
+                if anchors is None or anchors["count"] != total_items:
+                    anchors = self._page_anchors[(catalog, items_per_page)] = {"count": total_items, "pages": {}}
+                start_page = max((known for known in anchors["pages"] if known <= current_page), default=1)
+                start_filename = anchors["pages"].get(start_page, "")
+            # One row more than the page gives the next page's first filename
+            rows = self._connection().execute(
+                "SELECT * FROM items WHERE catalog = ? AND filename >= ? ORDER BY filename LIMIT ? OFFSET ?",
+                (catalog, start_filename, items_per_page + 1, (current_page - start_page) * items_per_page)
+            ).fetchall()
+            with self._state_lock:
+                if rows:
+                    anchors["pages"][current_page] = rows[0]["filename"]
+                if len(rows) > items_per_page:
+                    anchors["pages"][current_page + 1] = rows[items_per_page]["filename"]
+            rows = rows[:items_per_page]
+        return {
+            "items": [self._row_to_item(row) for row in rows],
+            "pagination": {
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "total_items": total_items
+            }
+        }
+
+    def items(self, catalog_path):
+        """
+        Get every indexed item of a catalog, ordered by filename
+
+        Parameters:
+        - catalog_path: Path to the catalog directory
+
+        Returns:
+        - List of item dictionaries
+        """
+        rows = self._connection().execute(
+            "SELECT * FROM items WHERE catalog = ? ORDER BY filename",
+            (os.path.normpath(catalog_path),)
+        ).fetchall()
+        return [self._row_to_item(row) for row in rows]
+
+    def get(self, path):
+        """
+        Look up a single item by path
+
+        Parameters:
+        - path: Path to the catalog image
+
+        Returns:
+        - Item dictionary, or None if the path is not indexed
+        """
+        row = self._connection().execute(
+            "SELECT * FROM items WHERE path = ?", (os.path.normpath(path),)
+        ).fetchone()
+        return self._row_to_item(row) if row else None
+
+    def add_listener(self, listener):
+        """
+        Get notified of changes found by refreshes
+
+        Parameters:
+        - listener: Callable(catalog, changed_paths, removed_paths) run after
+          every refresh that added, updated or removed items (catalog is the
+          normalized catalog directory)
+        """
+        with self._state_lock:
+            self._listeners.append(listener)
+
+    def similar(self, path, k=6):
+        """
+        Catalog items that look most like a given item
+
+        Parameters:
+        - path: Path of an indexed catalog image
+        - k: Number of items to return
+
+        Returns:
+        - List of item dictionaries (with a "similarity" score, 1.0 being
+          identical), best first; empty if the item has no descriptor yet
+        """
+        return self.similar_many([path], k)[0]
+
+    def similar_many(self, paths, k=6):
+        """
+        Batched version of similar()
+
+        Parameters:
+        - paths: Paths of indexed catalog images
+        - k: Number of items per query
+
+        Returns:
+        - One list of item dictionaries per path
+        """
+        results = [[] for _ in paths]
+        # Group the queries by catalog so each catalog matrix is scanned once
+        by_catalog = {}
+        for index, path in enumerate(paths):
+            item = self._connection().execute(
+                "SELECT catalog FROM items WHERE path = ?", (os.path.normpath(path),)
+            ).fetchone()
+            if item is not None:
+                by_catalog.setdefault(item["catalog"], []).append((index, os.path.normpath(path)))
+
+        for catalog, queries in by_catalog.items():
+            matrix = self._matrix(catalog)
+            with metrics.span("catalog.similar_query"):
+                vectors = [(index, path, matrix.descriptor(path)) for index, path in queries]
+                vectors = [(index, path, vector) for index, path, vector in vectors if vector is not None]
+                if not vectors:
+                    continue
+                neighbors = matrix.query(
+                    [vector for _, _, vector in vectors], k, exclude=[path for _, path, _ in vectors]
+                )
+            for (index, _, _), matches in zip(vectors, neighbors):
+                for match_path, score in matches:
+                    item = self.get(match_path)
+                    if item is not None:
+                        item["similarity"] = round(score, 4)
+                        results[index].append(item)
+        return results
+
+    def count(self, catalog_path):
+        """
+        Number of indexed items in a catalog
+        """
+        row = self._connection().execute(
+            "SELECT item_count FROM catalogs WHERE catalog = ?", (os.path.normpath(catalog_path),)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def _scan(self, catalog_path, catalog, light=False):
+        connection = self._connection()
+        known = {}
+        incomplete = set()
+        for filename, size, mtime_ns, sha256, undescribed in connection.execute(
+            "SELECT filename, size, mtime_ns, sha256, descriptor IS NULL FROM items WHERE catalog = ?", (catalog,)
+        ):
+            known[filename] = (size, mtime_ns)
+            if sha256 is None or undescribed:
+                incomplete.add(filename)
+
+        # Stat-only pass; nothing is opened unless it changed
+        seen = set()
+        changed = []
+        with os.scandir(catalog) as entries:
+            for dir_entry in entries:
+                if not dir_entry.is_file() or not dir_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                seen.add(dir_entry.name)
+                stat = dir_entry.stat()
+                if known.get(dir_entry.name) != (stat.st_size, stat.st_mtime_ns):
+                    changed.append((dir_entry.name, stat))
+                elif not light and dir_entry.name in incomplete:
+                    # Indexed by a light refresh; finish it now
+                    changed.append((dir_entry.name, stat))
+        removed = [filename for filename in known if filename not in seen]
+
+        engine = get_thumbnail_engine()
+        if not light and len(changed) > BULK_THUMBNAIL_THRESHOLD:
+            engine.build_catalog(catalog)
+
+        rows = []
+        for filename, stat in changed:
+            path = os.path.join(catalog_path, filename)
+            thumbnails, entry, sha256, descriptor = None, None, None, None
+            if not light:
+                thumbnails, entry = self._describe(engine, path)
+                # Unreadable images still get a hash (and an empty descriptor)
+                # so they aren't retried every scan
+                sha256 = entry["sha256"] if entry else file_sha256(path)
+                descriptor = self._descriptor(path, thumbnails, sha256)
+            rows.append((
+                os.path.normpath(path), catalog, filename, item_display_name(filename), item_type(catalog_path),
+                entry["width"] if entry else None,
+                entry["height"] if entry else None,
+                sha256,
+                stat.st_size, stat.st_mtime_ns,
+                json.dumps(thumbnails) if thumbnails else None,
+                descriptor,
+            ))
+
+        with connection:
+            if rows:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+                )
+            if removed:
+                connection.executemany(
+                    "DELETE FROM items WHERE catalog = ? AND filename = ?",
+                    [(catalog, filename) for filename in removed]
+                )
+            connection.execute(
+                "INSERT OR REPLACE INTO catalogs VALUES (?, ?, ?)", (catalog, len(seen), time.time())
+            )
+
+        # Keep a loaded similarity matrix in step with the table
+        with self._state_lock:
+            matrix = self._matrices.get(catalog)
+        if matrix is not None:
+            from similarity import descriptor_from_bytes
+
+            for row in rows:
+                vector = descriptor_from_bytes(row[-1])
+                if vector is None:
+                    matrix.remove(row[0])
+                else:
+                    matrix.upsert(row[0], vector)
+            for filename in removed:
+                matrix.remove(os.path.normpath(os.path.join(catalog_path, filename)))
+
+        added = sum(1 for filename, _ in changed if filename not in known)
+        if added or removed:
+            # Page boundaries moved
+            with self._state_lock:
+                for key in [key for key in self._page_anchors if key[0] == catalog]:
+                    del self._page_anchors[key]
+
+        if rows or removed:
+            with self._state_lock:
+                listeners = list(self._listeners)
+            removed_paths = [os.path.normpath(os.path.join(catalog_path, filename)) for filename in removed]
+            for listener in listeners:
+                try:
+                    listener(catalog, [row[0] for row in rows], removed_paths)
+                except Exception as e:
+                    print(f"Catalog index listener failed: {e}")
+
+        return {"added": added, "updated": len(changed) - added, "removed": len(removed)}
+
+    def _describe(self, engine, path):
+        # Thumbnails plus the manifest record (dimensions, content hash)
+        try:
+            return engine.ensure(path), engine.manifest_entry(path)
+        except Exception as e:
+            # Keep unreadable images listed; they fall back to the original
+            print(f"Could not index {path}: {e}")
+            return None, None
+
+    def _descriptor(self, path, thumbnails, sha256):
+        # similarity pulls in numpy, so it's imported on the first scan
+        # rather than on every cold start
+        from similarity import compute_descriptor, descriptor_from_bytes, descriptor_to_bytes
+
+        # Another replica may already have described the same image
+        shared = shared_cache("descriptors")
+        if shared:
+            data = shared.get(sha256)
+            if data is not None and descriptor_from_bytes(data) is not None:
+                return data
+        # The grid thumbnail has all the detail a descriptor needs
+        source = (thumbnails or {}).get("grid", path)
+        try:
+            with metrics.span("catalog.describe"):
+                data = descriptor_to_bytes(compute_descriptor(source))
+        except Exception as e:
+            print(f"Could not describe {path}: {e}")
+            return b""
+        if shared:
+            shared.set(sha256, data)
+        return data
+
+    def _matrix(self, catalog):
+        # Load a catalog's descriptors into memory on first use
+        with self._state_lock:
+            matrix = self._matrices.get(catalog)
+        if matrix is not None:
+            return matrix
+        with self._refresh_lock(catalog):
+            with self._state_lock:
+                matrix = self._matrices.get(catalog)
+            if matrix is None:
+                from similarity import SimilarityMatrix, descriptor_from_bytes
+
+                matrix = SimilarityMatrix()
+                for path, data in self._connection().execute(
+                    "SELECT path, descriptor FROM items WHERE catalog = ?", (catalog,)
+                ):
+                    vector = descriptor_from_bytes(data)
+                    if vector is not None:
+                        matrix.upsert(path, vector)
+                with self._state_lock:
+                    self._matrices[catalog] = matrix
+            return matrix
+
+    def _scan_due(self, catalog):
+        with self._state_lock:
+            state = self._scan_state.get(catalog)
+            if state is None:
+                return True
+            now = time.time()
+            if now - state["scanned_at"] < self.refresh_interval:
+                return False
+            if now - state["full_scan_at"] >= self.full_rescan_interval:
+                return True
+            # Adding, removing or renaming files changes the directory mtime
+            try:
+                dir_mtime_ns = os.stat(catalog).st_mtime_ns
+            except FileNotFoundError:
+                return True
+            if dir_mtime_ns != state["dir_mtime_ns"]:
+                return True
+            state["scanned_at"] = now
+            return False
+
+    def _refresh_lock(self, catalog):
+        with self._state_lock:
+            lock = self._refresh_locks.get(catalog)
+            if lock is None:
+                lock = self._refresh_locks[catalog] = threading.Lock()
+            return lock
+
+    def _connection(self):
+        # One connection per thread; WAL lets readers proceed during refreshes
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def _row_to_item(self, row):
+        thumbnails = json.loads(row["thumbnails"]) if row["thumbnails"] else {}
+        return {
+            "name": row["name"],
+            "path": row["path"],
+            "type": row["type"],
+            "width": row["width"],
+            "height": row["height"],
+            "sha256": row["sha256"],
+            "thumbnails": thumbnails,
+            "thumbnail_path": thumbnails.get("grid", row["path"]),
+        }
+
+
+# Process-wide index shared by all sessions
+_catalog_index = None
+_catalog_index_lock = threading.Lock()
+
+
+def get_catalog_index():
+    """
+    Get the process-wide catalog index, creating it on first use
+
+    Returns:
+    - The shared CatalogIndex instance
+    """
+    global _catalog_index
+    if _catalog_index is None:
+        with _catalog_index_lock:
+            if _catalog_index is None:
+                _catalog_index = CatalogIndex()
+    return _catalog_index
@@ -0,0 +1,280 @@
+"""
+Text search and faceted filtering over the catalog
+
+Every item is indexed under the words of its name plus, when the catalog
+directory has a metadata.json sidecar, its color, category, brand and tags:
+
+    {
+        "black_leather_jacket.png": {"color": "black", "category": "jacket", "brand": "Acme",
+                                     "tags": ["leather", "biker"]},
+        "blue_dress.png": {"name": "Summer Dress", "color": "blue", "category": "dress"}
+    }
+
+Query words match as prefixes ("bla jack" finds "Black Leather Jacket") and
+all of them must match. Facet filters (e.g. color=black) narrow the results,
+and the facet counts of the matching items are returned with every page.
+The index follows the catalog index: refreshes that add, change or remove
+items update only those items, and editing metadata.json re-reads it.
+"""
+import bisect
+import heapq
+import json
+import os
+import re
+import threading
+
+from catalog_index import get_catalog_index
+
+# Name of the optional metadata file in each catalog directory
+METADATA_FILENAME = "metadata.json"
+
+# Metadata fields offered as facets (besides the item type)
+FACET_FIELDS = ("color", "category", "brand")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    """
+    Lowercase words of a string (e.g. "Black_Leather-Jacket" -> ["black", "leather", "jacket"])
+    """
+    return _TOKEN_RE.findall(str(text).lower())
+
+
+def load_metadata(catalog_path):
+    """
+    Read a catalog's metadata.json sidecar
+
+    Parameters:
+    - catalog_path: Path to the catalog directory
+
+    Returns:
+    - Dictionary mapping filename to metadata (empty if there is no sidecar
+      or it can't be parsed)
+    """
+    path = os.path.join(catalog_path, METADATA_FILENAME)
+    try:
+        with open(path, "r") as f:
+            metadata = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"Could not read {path}: {e}")
+        return {}
+    return metadata if isinstance(metadata, dict) else {}
+
+
+class _CatalogSearchIndex:
+    # Postings and facets for one catalog directory
+
+    def __init__(self, catalog_path):
+        self.catalog_path = catalog_path
+        self.docs = {}
+        self.postings = {}
+        self.facets = {}
+        self.metadata = {}
+        self.metadata_mtime_ns = None
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+
+    def add(self, item):
+        filename = os.path.basename(item["path"])
+        meta = self.metadata.get(filename) or {}
+        name = meta.get("name") or item["name"]
+        item = dict(item, name=name)
+        values = {"type": item["type"]}
+        for field in FACET_FIELDS:
+            if meta.get(field):
+                values[field] = str(meta[field]).strip().lower()
+        item["facets"] = values
+
+        tokens = set(tokenize(name)) | set(tokenize(os.path.splitext(filename)[0]))
+        for value in values.values():
+            tokens.update(tokenize(value))
+        for tag in meta.get("tags") or []:
+            tokens.update(tokenize(tag))
+
+        path = item["path"]
+        self.docs[path] = (item, tokens)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = set()
+                self._vocabulary_dirty = True
+            postings.add(path)
+        for field, value in values.items():
+            self.facets.setdefault(field, {}).setdefault(value, set()).add(path)
+
+    def remove(self, path):
+        doc = self.docs.pop(path, None)
+        if doc is None:
+            return
+        item, tokens = doc
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is not None:
+                postings.discard(path)
+                if not postings:
+                    del self.postings[token]
+                    self._vocabulary_dirty = True
+        for field, value in item["facets"].items():
+            paths = self.facets.get(field, {}).get(value)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.facets[field][value]
+
+    def match(self, tokens):
+        # Paths matching every query token as a prefix
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self.postings)
+            self._vocabulary_dirty = False
+        result = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            start = bisect.bisect_left(self._vocabulary, token)
+            matches = set()
+            for word in self._vocabulary[start:]:
+                if not word.startswith(token):
+                    break
+                matches |= self.postings[word]
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return set(self.docs) if result is None else result
+
+    def filter(self, paths, filters):
+        # Values of one facet are alternatives; different facets must all match
+        for field, values in filters.items():
+            allowed = set()
+            for value in values:
+                allowed |= self.facets.get(field, {}).get(str(value).lower(), set())
+            paths = paths & allowed
+        return paths
+
+
+class CatalogSearch:
+    """
+    In-memory inverted index over one or more catalog directories
+
+    Built from the catalog index on first use and kept current through its
+    change notifications.
+
+    Parameters:
+    - index: CatalogIndex to read items from (default: the shared one)
+    """
+
+    def __init__(self, index=None):
+        self.index = index or get_catalog_index()
+        self._catalogs = {}
+        self._lock = threading.Lock()
+        self.index.add_listener(self._on_change)
+
+    def search(self, catalog_paths, query="", filters=None, page=1, items_per_page=6):
+        """
+        Search items by words and facet values
+
+        Parameters:
+        - catalog_paths: Catalog directories to search
+        - query: Words to match (as prefixes) against names and metadata
+        - filters: Optional dictionary mapping a facet ('type', 'color',
+          'category', 'brand') to a list of accepted values
+        - page: Page number (1-indexed, clamped to the valid range)
+        - items_per_page: Number of items per page
+
+        Returns:
+        - Dictionary with the page's items, pagination info and facet counts
+          ({facet: {value: count}}) over all matching items (each facet's
+          counts leave out that facet's own filter)
+        """
+        tokens = tokenize(query)
+        filters = {field: values for field, values in (filters or {}).items() if values}
+        matches = []
+        facet_counts = {}
+        with self._lock:
+            for catalog_path in catalog_paths:
+                search_index = self._catalog(catalog_path)
+                matched = search_index.match(tokens)
+                paths = search_index.filter(matched, filters)
+                matches.extend(search_index.docs[path][0] for path in paths)
+                for field, values in search_index.facets.items():
+                    # A facet's counts ignore its own filter, so the other
+                    # values stay visible as alternatives
+                    field_paths = paths
+                    if field in filters:
+                        field_paths = search_index.filter(
+                            matched, {other: v for other, v in filters.items() if other != field}
+                        )
+                    counts = facet_counts.setdefault(field, {})
+                    for value, value_paths in values.items():
+                        # Set intersection iterates the smaller side
+                        count = len(field_paths & value_paths)
+                        if count:
+                            counts[value] = counts.get(value, 0) + count
+
+        total_items = len(matches)
+        total_pages = max(1, (total_items + items_per_page - 1) // items_per_page)
+        current_page = min(max(1, page), total_pages)
+        start = (current_page - 1) * items_per_page
+        # Same order as catalog pages; only the items up to this page are ordered
+        ordered = heapq.nsmallest(start + items_per_page, matches, key=lambda item: item["path"])
+        return {
+            "items": [dict(item) for item in ordered[start:]],
+            "pagination": {
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "total_items": total_items
+            },
+            "facets": facet_counts,
+        }
+
+    def _catalog(self, catalog_path):
+        # Index for one catalog, (re)built when it is new or metadata.json changed
+        catalog = os.path.normpath(catalog_path)
+        try:
+            metadata_mtime_ns = os.stat(os.path.join(catalog, METADATA_FILENAME)).st_mtime_ns
+        except FileNotFoundError:
+            metadata_mtime_ns = None
+
+        search_index = self._catalogs.get(catalog)
+        if search_index is None or search_index.metadata_mtime_ns != metadata_mtime_ns:
+            search_index = _CatalogSearchIndex(catalog_path)
+            search_index.metadata = load_metadata(catalog)
+            search_index.metadata_mtime_ns = metadata_mtime_ns
+            for item in self.index.items(catalog_path):
+                search_index.add(item)
+            self._catalogs[catalog] = search_index
+        return search_index
+
+    def _on_change(self, catalog, changed_paths, removed_paths):
+        with self._lock:
+            search_index = self._catalogs.get(catalog)
+            if search_index is None:
+                # Not loaded yet; it will be built from the index when needed
+                return
+            for path in removed_paths:
+                search_index.remove(path)
+            for path in changed_paths:
+                search_index.remove(path)
+                item = self.index.get(path)
+                if item is not None:
+                    search_index.add(item)
+
+
+# Process-wide search index
+_catalog_search = None
+_catalog_search_lock = threading.Lock()
+
+
+def get_catalog_search():
+    """
+    Get the process-wide catalog search, creating it on first use
+
+    Returns:
+    - The shared CatalogSearch instance
+    """
+    global _catalog_search
+    if _catalog_search is None:
+        with _catalog_search_lock:
+            if _catalog_search is None:
+                _catalog_search = CatalogSearch()
+    return _catalog_search
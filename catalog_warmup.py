@@ -0,0 +1,182 @@
+import os
+import threading
+import time
+
+from catalog_index import get_catalog_index
+from thumbnails import IMAGE_EXTENSIONS, get_thumbnail_engine
+
+# Catalog directories warmed up at startup
+DEFAULT_CATALOG_PATHS = ("catalog/clothing", "catalog/accessories")
+
+# Warm-up states
+WARMUP_PENDING = "pending"
+WARMUP_RUNNING = "running"
+WARMUP_READY = "ready"
+WARMUP_FAILED = "failed"
+
+
+class CatalogWarmup:
+    """
+    One-shot background warm-up of catalog thumbnails and the catalog index
+
+    The first page of every catalog is prepared first so the UI can render
+    right away; the rest of the catalog is thumbnailed on the process pool
+    and indexed afterwards.
+
+    Parameters:
+    - catalog_paths: Catalog directories to warm up
+    - items_per_page: Size of the first page prepared ahead of the rest
+    """
+
+    def __init__(self, catalog_paths=DEFAULT_CATALOG_PATHS, items_per_page=6):
+        self.catalog_paths = list(catalog_paths)
+        self.items_per_page = items_per_page
+        self.state = WARMUP_PENDING
+        self.error = None
+        self.first_page_ready = threading.Event()
+        self.timings = {}
+        self.started_at = None
+        self.finished_at = None
+        self._progress = {path: (0, 0) for path in self.catalog_paths}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        """
+        Start the warm-up thread; later calls are no-ops
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self.state = WARMUP_RUNNING
+            self.started_at = time.time()
+            self._thread = threading.Thread(target=self._run, name="catalog-warmup", daemon=True)
+            self._thread.start()
+
+    def is_ready(self):
+        """
+        True once every catalog is fully thumbnailed and indexed
+        """
+        return self.state == WARMUP_READY
+
+    def status(self):
+        """
+        Snapshot of the warm-up for display
+
+        Returns:
+        - Dictionary with state, first_page_ready, progress (0-1), done/total
+          image counts, elapsed seconds, per-stage timings and any error
+        """
+        with self._lock:
+            done = sum(done for done, _ in self._progress.values())
+            total = sum(total for _, total in self._progress.values())
+            timings = dict(self.timings)
+        if self.state == WARMUP_READY:
+            progress = 1.0
+        else:
+            progress = done / total if total else 0.0
+        end = self.finished_at or time.time()
+        return {
+            "state": self.state,
+            "first_page_ready": self.first_page_ready.is_set(),
+            "progress": progress,
+            "done": done,
+            "total": total,
+            "elapsed": end - self.started_at if self.started_at else 0.0,
+            "timings": timings,
+            "error": self.error,
+        }
+
+    def _run(self):
+        try:
+            start = time.time()
+            for catalog_path in self.catalog_paths:
+                self._prepare_first_page(catalog_path)
+            self.timings["first_page"] = time.time() - start
+            self.first_page_ready.set()
+
+            engine = get_thumbnail_engine()
+            index = get_catalog_index()
+            for catalog_path in self.catalog_paths:
+                stage_start = time.time()
+                engine.build_catalog(catalog_path, progress=self._progress_callback(catalog_path))
+                with self._lock:
+                    total = self._progress[catalog_path][1]
+                    self._progress[catalog_path] = (total, total)
+                self.timings[f"thumbnails:{catalog_path}"] = time.time() - stage_start
+
+                stage_start = time.time()
+                index.refresh(catalog_path, force=True)
+                self.timings[f"index:{catalog_path}"] = time.time() - stage_start
+
+            self.state = WARMUP_READY
+        except Exception as e:
+            self.error = str(e)
+            self.state = WARMUP_FAILED
+            print(f"Catalog warm-up failed: {e}")
+        finally:
+            self.finished_at = time.time()
+            # Never leave the UI waiting on a failed warm-up
+            self.first_page_ready.set()
+
+    def _prepare_first_page(self, catalog_path):
+        # Index names only (no decoding) and thumbnail just the first page
+        index = get_catalog_index()
+        index.refresh(catalog_path, force=True, light=True)
+        engine = get_thumbnail_engine()
+        for item in index.page(catalog_path, 1, self.items_per_page)["items"]:
+            try:
+                engine.ensure(item["path"])
+            except Exception as e:
+                print(f"Could not create thumbnail for {item['path']}: {e}")
+
+    def _progress_callback(self, catalog_path):
+        # Count already-current images as done so progress reflects real work
+        total = 0
+        if os.path.isdir(catalog_path):
+            with os.scandir(catalog_path) as entries:
+                total = sum(
+                    1 for entry in entries
+                    if entry.is_file() and entry.name.lower().endswith(IMAGE_EXTENSIONS)
+                )
+        with self._lock:
+            self._progress[catalog_path] = (0, total)
+
+        def callback(done, stale_total):
+            with self._lock:
+                self._progress[catalog_path] = (total - stale_total + done, total)
+
+        return callback
+
+
+# Process-wide warm-up; runs once no matter how often the script reruns
+_warmup = None
+_warmup_lock = threading.Lock()
+
+
+def warmup_in_progress():
+    """
+    True while the background warm-up has been started but not finished
+
+    Callers use this to avoid duplicating the warm-up's heavy work (hashing
+    and thumbnailing the whole catalog) on the UI thread.
+    """
+    return _warmup is not None and _warmup.state == WARMUP_RUNNING
+
+
+def start_catalog_warmup(catalog_paths=DEFAULT_CATALOG_PATHS):
+    """
+    Start the background catalog warm-up once per process
+
+    Parameters:
+    - catalog_paths: Catalog directories to warm up (used on the first call)
+
+    Returns:
+    - The shared CatalogWarmup instance
+    """
+    global _warmup
+    with _warmup_lock:
+        if _warmup is None:
+            _warmup = CatalogWarmup(catalog_paths)
+        _warmup.start()
+        return _warmup
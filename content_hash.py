@@ -0,0 +1,59 @@
+import hashlib
+import os
+import threading
+
+# Read files in 1 MiB blocks when hashing
+HASH_BLOCK_SIZE = 1024 * 1024
+
+# Memoized file digests keyed by path, invalidated on size/mtime change
+_digest_cache = {}
+_digest_cache_lock = threading.Lock()
+_DIGEST_CACHE_MAX_ENTRIES = 100000
+
+
+def bytes_sha256(data):
+    """
+    Compute the SHA-256 hex digest of in-memory bytes
+
+    Parameters:
+    - data: Bytes-like object
+
+    Returns:
+    - Hex digest string
+    """
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_sha256(path):
+    """
+    Compute the SHA-256 hex digest of a file's contents
+
+    Digests are memoized per path and recomputed only when the file's size or
+    modification time changes, so hashing popular catalog items is cheap.
+
+    Parameters:
+    - path: Path to the file
+
+    Returns:
+    - Hex digest string
+    """
+    stat = os.stat(path)
+    cache_key = os.path.abspath(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+
+    with _digest_cache_lock:
+        cached = _digest_cache.get(cache_key)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    hex_digest = digest.hexdigest()
+
+    with _digest_cache_lock:
+        if len(_digest_cache) >= _DIGEST_CACHE_MAX_ENTRIES:
+            _digest_cache.clear()
+        _digest_cache[cache_key] = (signature, hex_digest)
+    return hex_digest
@@ -0,0 +1,407 @@
+"""
+Routing of images/edits calls across a pool of Azure OpenAI deployments
+
+Configure the pool in config.json:
+
+    "imagegen_deployments": [
+        {"name": "eastus", "resource": "my-eastus", "deployment": "gpt-image-1",
+         "api_key": "...", "weight": 2},
+        {"name": "swedencentral", "resource": "my-sweden", "deployment": "gpt-image-1",
+         "api_key": "...", "weight": 1, "requests_per_minute": 10}
+    ]
+
+Every deployment keeps its own connection pool, rate limit and in-flight
+limit. Requests go to a weighted random deployment, favouring the ones that
+are currently fast, healthy and lightly loaded. A circuit breaker takes a
+deployment out of rotation after repeated failures (or immediately when its
+quota is exhausted) and lets a single probe through once it cools down.
+Throttled (429), failed (5xx) and unreachable deployments fail over to the
+next one. Without imagegen_deployments the top-level imagegen_aoai_* keys
+form a pool of one.
+"""
+import json
+import random
+import threading
+import time
+
+import metrics
+from rate_limit import get_upstream_governor
+from upstream import RETRYABLE_STATUS_CODES, UpstreamError, UpstreamTimeout, get_upstream_client
+
+# Short keys accepted in imagegen_deployments entries
+BACKEND_KEYS = {
+    "resource": "imagegen_aoai_resource",
+    "endpoint": "imagegen_aoai_endpoint",
+    "deployment": "imagegen_aoai_deployment",
+    "api_key": "imagegen_aoai_api_key",
+    "edits_url": "imagegen_aoai_edits_url",
+    "requests_per_minute": "imagegen_aoai_requests_per_minute",
+    "max_in_flight": "imagegen_aoai_max_in_flight",
+    "burst": "imagegen_aoai_burst",
+    "max_retries": "imagegen_aoai_max_retries",
+    "max_retry_after": "imagegen_aoai_max_retry_after",
+}
+
+# In a pool, a deployment retries briefly and then hands the request to
+# another one instead of waiting out long Retry-After delays
+POOL_MAX_RETRIES = 1
+POOL_MAX_RETRY_AFTER = 10
+
+# Circuit breaker states
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+# Consecutive failures that open a circuit
+DEFAULT_FAILURE_THRESHOLD = 3
+
+# Seconds a circuit stays open; doubled each time a probe fails
+DEFAULT_OPEN_SECONDS = 30
+MAX_OPEN_SECONDS = 300
+
+# Weight of the newest sample in the latency and error-rate averages
+EWMA_ALPHA = 0.2
+
+# Latency assumed for a deployment that has not answered yet (seconds)
+INITIAL_LATENCY = 30.0
+
+# How strongly the error rate lowers a deployment's share of traffic
+ERROR_PENALTY = 4.0
+
+_routed_total = metrics.counter("upstream_routed_total", "Upstream attempts by deployment", ("backend",))
+_failovers_total = metrics.counter(
+    "upstream_failovers_total", "Requests moved off a deployment, by reason", ("backend", "reason")
+)
+_circuit_opened_total = metrics.counter("upstream_circuit_opened_total", "Circuit breaker trips", ("backend",))
+_backend_seconds = metrics.histogram(
+    "upstream_backend_seconds", "Upstream call time by deployment and outcome", ("backend", "outcome")
+)
+
+
+def deployment_configs(config):
+    """
+    Per-deployment configuration dictionaries for the pool
+
+    Each entry of imagegen_deployments overrides the top-level keys, so
+    shared settings (timeouts, limits) only need to be given once.
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+
+    Returns:
+    - List of (name, weight, config) tuples
+    """
+    pool = config.get("imagegen_deployments") or []
+    if not pool:
+        name = config.get("imagegen_aoai_deployment") or "default"
+        return [(name, 1.0, config)]
+
+    backends = []
+    for index, entry in enumerate(pool):
+        backend_config = {
+            key: value for key, value in config.items() if key != "imagegen_deployments"
+        }
+        backend_config["imagegen_aoai_max_retries"] = POOL_MAX_RETRIES
+        backend_config["imagegen_aoai_max_retry_after"] = POOL_MAX_RETRY_AFTER
+        for key, value in entry.items():
+            if key not in ("name", "weight"):
+                backend_config[BACKEND_KEYS.get(key, key)] = value
+        name = entry.get("name") or (
+            f"{backend_config.get('imagegen_aoai_resource', '')}/{backend_config.get('imagegen_aoai_deployment', '')}"
+            if backend_config.get("imagegen_aoai_resource") else f"deployment-{index + 1}"
+        )
+        backends.append((name, float(entry.get("weight", 1.0)), backend_config))
+
+    names = [name for name, _, _ in backends]
+    if len(set(names)) != len(names):
+        raise ValueError("imagegen_deployments entries must have unique names")
+    return backends
+
+
+class Backend:
+    """
+    One deployment in the pool, with its health and circuit breaker
+
+    Parameters:
+    - name: Name used in metrics and health reports
+    - weight: Relative share of traffic when all deployments are equally healthy
+    - config: Configuration dictionary for this deployment
+    - failure_threshold: Consecutive failures that open the circuit
+    - open_seconds: Initial time the circuit stays open
+    """
+
+    def __init__(self, name, weight, config, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 open_seconds=DEFAULT_OPEN_SECONDS):
+        self.name = name
+        self.weight = max(0.0, weight)
+        self.client = get_upstream_client(config)
+        self.governor = get_upstream_governor(config)
+        self.failure_threshold = max(1, failure_threshold)
+        self.base_open_seconds = open_seconds
+        self.latency = None
+        self.error_rate = 0.0
+        self.state = CIRCUIT_CLOSED
+        self._consecutive_failures = 0
+        self._open_seconds = open_seconds
+        self._open_until = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def available(self, now):
+        """
+        True if a request may be sent now (a half-open circuit admits one probe)
+        """
+        with self._lock:
+            if self.state == CIRCUIT_OPEN and now >= self._open_until:
+                self.state = CIRCUIT_HALF_OPEN
+            if self.state == CIRCUIT_HALF_OPEN:
+                return not self._probe_in_flight
+            return self.state == CIRCUIT_CLOSED
+
+    def score(self, default_latency):
+        """
+        Relative share of traffic: weight, discounted by latency, error rate
+        and queue depth
+        """
+        load = self.governor.stats()
+        queue = (load["in_flight"] + load["waiting"]) / float(self.governor.max_in_flight)
+        latency = self.latency if self.latency is not None else default_latency
+        return self.weight / (max(latency, 0.001) * (1 + ERROR_PENALTY * self.error_rate) * (1 + queue))
+
+    def begin(self):
+        """
+        Mark the start of a call (it is the probe when the circuit is half open)
+        """
+        with self._lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._probe_in_flight = True
+
+    def record_success(self, seconds):
+        with self._lock:
+            self.latency = seconds if self.latency is None else (
+                EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+            )
+            self.error_rate *= 1 - EWMA_ALPHA
+            self._consecutive_failures = 0
+            self._probe_in_flight = False
+            if self.state != CIRCUIT_CLOSED:
+                self.state = CIRCUIT_CLOSED
+                self._open_seconds = self.base_open_seconds
+
+    def record_failure(self, error):
+        """
+        Count a failed call and open the circuit if the deployment looks down
+
+        Parameters:
+        - error: The UpstreamError raised by the call
+        """
+        with self._lock:
+            self.error_rate = EWMA_ALPHA + (1 - EWMA_ALPHA) * self.error_rate
+            self._consecutive_failures += 1
+            if self.state == CIRCUIT_HALF_OPEN:
+                # The probe failed: stay out of rotation for longer
+                self._open_seconds = min(MAX_OPEN_SECONDS, self._open_seconds * 2)
+                self._open_locked(self._open_seconds)
+            elif error.status_code == 429:
+                # Quota exhausted: sending more only earns more 429s
+                self._open_locked(error.retry_after or self._open_seconds)
+            elif self._consecutive_failures >= self.failure_threshold:
+                self._open_locked(self._open_seconds)
+            self._probe_in_flight = False
+
+    def release(self):
+        """
+        End a call that says nothing about the deployment's health
+        (e.g. a request rejected as invalid)
+        """
+        with self._lock:
+            self._probe_in_flight = False
+
+    def reopens_at(self):
+        with self._lock:
+            return self._open_until
+
+    def status(self):
+        """
+        Health and load of the deployment for monitoring
+        """
+        load = self.governor.stats()
+        with self._lock:
+            return {
+                "name": self.name,
+                "weight": self.weight,
+                "state": self.state,
+                "latency_ewma": self.latency,
+                "error_rate": round(self.error_rate, 4),
+                "open_for": max(0.0, self._open_until - time.time()) if self.state == CIRCUIT_OPEN else 0.0,
+                "in_flight": load["in_flight"],
+                "waiting": load["waiting"],
+            }
+
+    def _open_locked(self, seconds):
+        if self.state != CIRCUIT_OPEN:
+            _circuit_opened_total.inc(backend=self.name)
+        self.state = CIRCUIT_OPEN
+        self._open_until = time.time() + seconds
+
+
+class DeploymentRouter:
+    """
+    Routes upstream calls across a pool of deployments with failover
+
+    Parameters:
+    - backends: List of Backend instances
+    - max_attempts: Deployments tried per request (default: all of them)
+    """
+
+    def __init__(self, backends, max_attempts=None):
+        if not backends:
+            raise ValueError("At least one image deployment is required")
+        self.backends = backends
+        self.max_attempts = max(1, min(max_attempts or len(backends), len(backends)))
+        self.random = random.Random()
+
+    def choose(self, exclude=()):
+        """
+        Pick a deployment for the next attempt
+
+        Parameters:
+        - exclude: Names of deployments already tried for this request
+
+        Returns:
+        - A Backend, or None if every deployment has been tried
+        """
+        now = time.time()
+        candidates = [backend for backend in self.backends if backend.name not in exclude]
+        if not candidates:
+            return None
+        available = [backend for backend in candidates if backend.available(now)]
+        if not available:
+            # Every circuit is open: try the one that reopens first rather
+            # than failing without a call
+            return min(candidates, key=lambda backend: backend.reopens_at())
+
+        known = [backend.latency for backend in self.backends if backend.latency is not None]
+        default_latency = sum(known) / len(known) if known else INITIAL_LATENCY
+        scores = [backend.score(default_latency) for backend in available]
+        total = sum(scores)
+        if total <= 0:
+            return self.random.choice(available)
+        pick = self.random.uniform(0, total)
+        for backend, score in zip(available, scores):
+            pick -= score
+            if pick <= 0:
+                return backend
+        return available[-1]
+
+    def call(self, fn, ticket=None):
+        """
+        Run an upstream call on the best deployment, failing over on errors
+
+        Parameters:
+        - fn: Callable(client, throttle) making the call with the deployment's
+          ImageEditsClient; throttle is the before_attempt hook
+        - ticket: Identifier shown in the upstream queue (e.g. a job ID)
+
+        Returns:
+        - The return value of fn
+        """
+        tried = set()
+        last_error = None
+        for _ in range(self.max_attempts):
+            backend = self.choose(tried)
+            if backend is None:
+                break
+            tried.add(backend.name)
+            _routed_total.inc(backend=backend.name)
+
+            queued_at = time.perf_counter()
+            with backend.governor.slot(ticket):
+                metrics.observe_stage("tryon.upstream_queue_wait", time.perf_counter() - queued_at)
+                backend.begin()
+                started = time.perf_counter()
+                try:
+                    result = fn(backend.client, backend.governor.throttle)
+                except UpstreamError as e:
+                    elapsed = time.perf_counter() - started
+                    if isinstance(e, UpstreamTimeout) or e.status_code is None or e.status_code in RETRYABLE_STATUS_CODES:
+                        backend.record_failure(e)
+                        _backend_seconds.observe(elapsed, backend=backend.name, outcome="failed")
+                    else:
+                        # The request itself was rejected; another deployment
+                        # would reject it too
+                        backend.release()
+                        _backend_seconds.observe(elapsed, backend=backend.name, outcome="rejected")
+                        raise
+                    if isinstance(e, UpstreamTimeout):
+                        # The generation may still be running there; don't pay twice
+                        raise
+                    last_error = e
+                    _failovers_total.inc(backend=backend.name, reason=e.status_code or "error")
+                    continue
+                except BaseException:
+                    backend.release()
+                    raise
+                backend.record_success(time.perf_counter() - started)
+                _backend_seconds.observe(time.perf_counter() - started, backend=backend.name, outcome="ok")
+                return result
+
+        raise last_error
+
+    def position(self, ticket):
+        """
+        Queue position of a ticket waiting for any deployment, or None
+        """
+        for backend in self.backends:
+            position = backend.governor.position(ticket)
+            if position is not None:
+                return position
+        return None
+
+    def stats(self):
+        """
+        Load across the pool and the health of each deployment
+
+        Returns:
+        - Dictionary with in_flight and waiting totals and per-backend status
+        """
+        backends = [backend.status() for backend in self.backends]
+        return {
+            "in_flight": sum(backend["in_flight"] for backend in backends),
+            "waiting": sum(backend["waiting"] for backend in backends),
+            "backends": backends,
+        }
+
+
+# Process-wide routers keyed by pool configuration
+_routers = {}
+_routers_lock = threading.Lock()
+
+
+def get_deployment_router(config):
+    """
+    Get the shared router for the configured deployments, creating it on first use
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+
+    Returns:
+    - The shared DeploymentRouter instance
+    """
+    key = json.dumps([
+        config.get("imagegen_deployments") or [],
+        config.get("imagegen_aoai_resource", ""),
+        config.get("imagegen_aoai_deployment", ""),
+        config.get("imagegen_aoai_edits_url", ""),
+    ], sort_keys=True)
+    with _routers_lock:
+        router = _routers.get(key)
+        if router is None:
+            threshold = int(config.get("imagegen_circuit_failure_threshold", DEFAULT_FAILURE_THRESHOLD))
+            open_seconds = float(config.get("imagegen_circuit_open_seconds", DEFAULT_OPEN_SECONDS))
+            router = DeploymentRouter([
+                Backend(name, weight, backend_config, failure_threshold=threshold, open_seconds=open_seconds)
+                for name, weight, backend_config in deployment_configs(config)
+            ])
+            _routers[key] = router
+        return router
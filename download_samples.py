@@ -1,7 +1,6 @@
 import os
-import requests
-from PIL import Image
-from io import BytesIO
+
+from ingest_catalog import ingest
 
 # Sample items with URLs for clothing and accessories
 SAMPLE_ITEMS = {
@@ -57,44 +56,26 @@ SAMPLE_PERSON = {
     "url": "https://i.imgur.com/ZqMN3bB.jpg"
 }
 
-def download_image(url, save_path):
-    """Download an image from URL and save it to the specified path"""
-    try:
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        img = Image.open(BytesIO(response.content))
-        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-        img.save(save_path)
-        print(f"Downloaded: {save_path}")
-        return True
-    except Exception as e:
-        print(f"Error downloading {url}: {str(e)}")
-        return False
-
 def download_all_samples():
-    """Download all sample images"""
+    """Download all sample images (through the catalog ingestion pipeline)"""
     base_dir = os.path.dirname(os.path.abspath(__file__))
-    
-    # Ensure directories exist
-    os.makedirs(os.path.join(base_dir, "catalog", "clothing"), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, "catalog", "accessories"), exist_ok=True)
-    os.makedirs(os.path.join(base_dir, "uploads", "user_images"), exist_ok=True)
-    
-    # Download sample person
-    person_path = os.path.join(base_dir, "uploads", "user_images", f"{SAMPLE_PERSON['name']}.jpg")
-    download_image(SAMPLE_PERSON["url"], person_path)
-    
-    # Download clothing items
-    for item in SAMPLE_ITEMS["clothing"]:
-        path = os.path.join(base_dir, "catalog", "clothing", f"{item['name']}.png")
-        download_image(item["url"], path)
-    
-    # Download accessories
-    for item in SAMPLE_ITEMS["accessories"]:
-        path = os.path.join(base_dir, "catalog", "accessories", f"{item['name']}.png")
-        download_image(item["url"], path)
-    
-    print("Sample download completed!")
+
+    # Catalog items get thumbnails too; the sample person only goes to uploads
+    items = [
+        {"url": item["url"], "name": item["name"], "category": category}
+        for category, category_items in SAMPLE_ITEMS.items()
+        for item in category_items
+    ]
+    items.append({
+        "url": SAMPLE_PERSON["url"],
+        "name": SAMPLE_PERSON["name"],
+        "directory": os.path.join(base_dir, "uploads", "user_images"),
+    })
+
+    # The app indexes the new items on its next catalog refresh
+    summary = ingest(items, catalog_dir=os.path.join(base_dir, "catalog"), update_index=False)
+    print(f"Sample download completed! ({summary['added'] + summary['replaced']} downloaded, "
+          f"{summary['duplicate']} already present, {summary['failed']} failed)")
 
 if __name__ == "__main__":
     download_all_samples()
\ No newline at end of file
@@ -0,0 +1,263 @@
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from io import BytesIO
+
+from cache_backend import pack, shared_cache, unpack
+from content_hash import file_sha256
+
+# Longest side sent upstream; outputs are at most 1536px, so larger inputs
+# only cost upload time
+DEFAULT_MAX_SIDE = 1536
+
+# JPEG quality for opaque inputs
+JPEG_QUALITY = 90
+
+# Image.info keys that carry no personal metadata (everything else, such as
+# EXIF, XMP or PNG text chunks, triggers a re-encode)
+CLEAN_INFO_KEYS = {
+    "icc_profile", "dpi", "jfif", "jfif_version", "jfif_unit", "jfif_density",
+    "progressive", "progression", "adobe", "adobe_transform", "transparency",
+    "gamma", "srgb", "aspect",
+}
+
+# In-memory budget for normalized payloads (64 MiB)
+DEFAULT_MEMORY_BUDGET = 64 * 1024 * 1024
+
+# On-disk cache of normalized payloads
+DEFAULT_PAYLOAD_CACHE_DIR = os.path.join(".cache", "payloads")
+
+
+def _has_transparency(img):
+    if img.mode in ("RGBA", "LA"):
+        return img.getchannel("A").getextrema()[0] < 255
+    if img.mode == "P" and "transparency" in img.info:
+        return _has_transparency(img.convert("RGBA"))
+    return False
+
+
+def normalize_image(img, max_side=DEFAULT_MAX_SIDE):
+    """
+    Downscale and re-encode an image for upload
+
+    The EXIF orientation is applied before all metadata is dropped (only the
+    ICC color profile is kept). Images that use transparency are re-encoded
+    as PNG so cut-out catalog items keep their alpha; everything else becomes
+    a JPEG.
+
+    Parameters:
+    - img: PIL Image object
+    - max_side: Longest side of the output in pixels
+
+    Returns:
+    - (bytes, content_type, extension) tuple
+    """
+    # PIL is imported on first use (see tryon.generate_try_on)
+    from PIL import Image, ImageOps
+
+    icc_profile = img.info.get("icc_profile")
+    img = ImageOps.exif_transpose(img)
+    if max(img.size) > max_side:
+        img.thumbnail((max_side, max_side), Image.LANCZOS)
+
+    buffer = BytesIO()
+    save_kwargs = {"icc_profile": icc_profile} if icc_profile else {}
+    if _has_transparency(img):
+        img.convert("RGBA").save(buffer, format="PNG", optimize=True, **save_kwargs)
+        return buffer.getvalue(), "image/png", ".png"
+
+    img.convert("RGB").save(buffer, format="JPEG", quality=JPEG_QUALITY, optimize=True, **save_kwargs)
+    return buffer.getvalue(), "image/jpeg", ".jpg"
+
+
+def is_upload_ready(img, max_side=DEFAULT_MAX_SIDE):
+    """
+    True if an opened image can be sent as-is: already small, a JPEG or PNG,
+    and free of metadata
+    """
+    return (
+        img.format in ("JPEG", "PNG")
+        and max(img.size) <= max_side
+        and set(img.info) <= CLEAN_INFO_KEYS
+    )
+
+
+def normalize_image_file(image_path, max_side=DEFAULT_MAX_SIDE):
+    """
+    Normalize an image file for upload (see normalize_image)
+
+    Files that are already normalized (e.g. stored by the upload store) are
+    passed through unchanged instead of being re-encoded.
+
+    Parameters:
+    - image_path: Path to the image file
+    - max_side: Longest side of the output in pixels
+
+    Returns:
+    - (bytes, content_type, extension) tuple
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        if is_upload_ready(img, max_side):
+            with open(image_path, "rb") as f:
+                if img.format == "JPEG":
+                    return f.read(), "image/jpeg", ".jpg"
+                return f.read(), "image/png", ".png"
+        img.load()
+        return normalize_image(img, max_side)
+
+
+class PayloadCache:
+    """
+    Cache of normalized upload payloads keyed by source content hash
+
+    Popular catalog items are normalized once and then served from memory,
+    or from disk after a restart, or from the shared cache when another
+    replica normalized them first. The disk copies are kept within a quota
+    by the storage sweeper (the ".cache/payloads" policy), least recently
+    used first.
+
+    Parameters:
+    - cache_dir: Directory for the on-disk copies (None disables disk caching)
+    - memory_budget: Bytes of payloads kept in memory
+    - max_side: Longest side of normalized images
+    """
+
+    def __init__(self, cache_dir=DEFAULT_PAYLOAD_CACHE_DIR, memory_budget=DEFAULT_MEMORY_BUDGET,
+                 max_side=DEFAULT_MAX_SIDE):
+        self.cache_dir = cache_dir
+        self.memory_budget = memory_budget
+        self.max_side = max_side
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, image_path):
+        """
+        Get the normalized payload for an image, normalizing it on a miss
+
+        Parameters:
+        - image_path: Path to the source image
+
+        Returns:
+        - (bytes, content_type, extension) tuple
+        """
+        key = f"{file_sha256(image_path)}_{self.max_side}"
+
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                return payload
+
+        payload = self._load_from_disk(key)
+        if payload is None:
+            payload = self._load_shared(key)
+            if payload is None:
+                payload = normalize_image_file(image_path, self.max_side)
+                self._save_shared(key, payload)
+            self._save_to_disk(key, payload)
+
+        self._remember(key, payload)
+        return payload
+
+    def _remember(self, key, payload):
+        with self._lock:
+            if key in self._memory:
+                return
+            self._memory[key] = payload
+            self._memory_bytes += len(payload[0])
+            while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted[0])
+
+    def _load_from_disk(self, key):
+        if not self.cache_dir:
+            return None
+        for extension in (".jpg", ".png"):
+            path = os.path.join(self.cache_dir, key + extension)
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            try:
+                # Mark the hit for the sweeper's LRU order (mounts with
+                # relatime only update the access time once a day)
+                os.utime(path, (time.time(), os.stat(path).st_mtime))
+            except OSError:
+                pass
+            return data, mimetypes.types_map[extension], extension
+        return None
+
+    def _load_shared(self, key):
+        shared = shared_cache("payloads")
+        value = shared.get(key) if shared else None
+        unpacked = unpack(value) if value else None
+        if unpacked is None:
+            return None
+        metadata, parts = unpacked
+        try:
+            return parts["data"], metadata["content_type"], metadata["extension"]
+        except (KeyError, TypeError):
+            return None
+
+    def _save_shared(self, key, payload):
+        shared = shared_cache("payloads")
+        if shared:
+            data, content_type, extension = payload
+            shared.set(key, pack({"content_type": content_type, "extension": extension}, {"data": data}))
+
+    def _save_to_disk(self, key, payload):
+        if not self.cache_dir:
+            return
+        data, _, extension = payload
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, key + extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+# Process-wide payload cache shared by all sessions
+_payload_cache = None
+_payload_cache_lock = threading.Lock()
+
+
+def get_payload_cache(max_side=DEFAULT_MAX_SIDE):
+    """
+    Get the process-wide payload cache, creating it on first use
+
+    Parameters:
+    - max_side: Longest side used when the cache is first created
+
+    Returns:
+    - The shared PayloadCache instance
+    """
+    global _payload_cache
+    if _payload_cache is None:
+        with _payload_cache_lock:
+            if _payload_cache is None:
+                _payload_cache = PayloadCache(max_side=max_side)
+    return _payload_cache
+
+
+def prepare_upload_part(image_path, payload_cache=None):
+    """
+    Build a normalized image[] multipart part for the images/edits request
+
+    Parameters:
+    - image_path: Path to the source image
+    - payload_cache: PayloadCache to use (default: the process-wide cache)
+
+    Returns:
+    - (field, (filename, bytes, content_type)) tuple
+    """
+    cache = payload_cache or get_payload_cache()
+    data, content_type, extension = cache.get(image_path)
+    filename = os.path.splitext(os.path.basename(image_path))[0] + extension
+    return ("image[]", (filename, data, content_type))
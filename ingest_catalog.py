@@ -0,0 +1,593 @@
+"""
+Catalog ingestion: fetch, validate, normalize, deduplicate and thumbnail
+catalog images in one pass
+
+A manifest lists one image per line, either as a bare URL or path (placed in
+--category) or as a JSON object:
+
+    {"url": "https://cdn.example.com/sku/1234.jpg", "category": "clothing", "name": "red_dress"}
+    {"path": "drops/spring/5678.png", "category": "accessories"}
+
+"name" defaults to the source's file name. An item named like an existing
+one replaces it; an image whose content is already in the category is
+skipped as a duplicate. Sources are downloaded (pooled connections,
+timeouts, retries) or read on a bounded thread pool, while a process pool
+decodes each image once to validate it, normalize it for upload (EXIF
+orientation applied, metadata dropped, longest side capped) and render its
+thumbnails. Thumbnail manifests are written in batches and the catalog
+index is refreshed at the end, so a new drop is browsable as soon as the
+run finishes:
+
+    python ingest_catalog.py spring_drop.jsonl --fetch-concurrency 32
+    python ingest_catalog.py --from-dir ~/photos/bags --category accessories
+
+Every finished item is appended to a checkpoint (by default
+.cache/ingest/<manifest>.jsonl), so an interrupted run started again with
+the same manifest skips what was already ingested.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from io import BytesIO
+from urllib.parse import unquote, urlparse
+
+import requests
+from PIL import Image, ImageOps
+from requests.adapters import HTTPAdapter
+
+import cache_backend
+import metrics
+from content_hash import bytes_sha256, file_sha256
+from image_prep import DEFAULT_MAX_SIDE, is_upload_ready, normalize_image
+from thumbnails import IMAGE_EXTENSIONS, get_thumbnail_engine, thumbnail_targets, write_thumbnails
+from upstream import RETRYABLE_STATUS_CODES, parse_retry_after
+
+# Catalog root; categories are its subdirectories
+DEFAULT_CATALOG_DIR = "catalog"
+
+# Directory holding the default checkpoints
+DEFAULT_CHECKPOINT_DIR = os.path.join(".cache", "ingest")
+
+# Concurrent downloads / file reads
+DEFAULT_FETCH_CONCURRENCY = 16
+
+# Download limits
+FETCH_CONNECT_TIMEOUT = 10
+FETCH_READ_TIMEOUT = 60
+FETCH_MAX_RETRIES = 3
+FETCH_BACKOFF_BASE = 0.5
+FETCH_MAX_RETRY_AFTER = 30
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# Validation limits
+DEFAULT_MAX_SOURCE_BYTES = 50 * 1024 * 1024
+DEFAULT_MIN_SIDE = 64
+MAX_PIXELS = 50 * 1000 * 1000
+
+# How often (seconds) thumbnail manifests and the checkpoint are synced, and
+# progress is reported
+SYNC_INTERVAL = 10
+
+# Item outcomes recorded in the checkpoint
+INGEST_ADDED = "added"
+INGEST_REPLACED = "replaced"
+INGEST_DUPLICATE = "duplicate"
+INGEST_FAILED = "failed"
+
+_ingested_total = metrics.counter("catalog_ingest_total", "Catalog images ingested by outcome", ("result",))
+
+
+def _item_from_line(line, default_category):
+    return _normalize_item(json.loads(line) if line.startswith("{") else {"source": line}, default_category)
+
+
+def _normalize_item(item, default_category=None):
+    # Fill in "source" from "url"/"path" and check the destination
+    item = dict(item)
+    source = item.get("source") or item.get("url") or item.get("path")
+    if not source:
+        raise ValueError("'url' or 'path' is required")
+    item["source"] = str(source)
+    if not item.get("directory"):
+        item["category"] = item.get("category") or default_category
+        if not item["category"]:
+            raise ValueError("'category' is required (or pass --category)")
+    return item
+
+
+def iter_manifest(manifest_path, default_category=None):
+    """
+    Stream the items of an ingestion manifest (see module docstring)
+
+    Lines are parsed as they are read, so manifests of any size are never
+    held in memory.
+
+    Parameters:
+    - manifest_path: Path to the manifest
+    - default_category: Category of items that don't name one
+
+    Yields:
+    - Item dictionaries with source, category (or directory) and name
+    """
+    with open(manifest_path, "r") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                yield _item_from_line(line, default_category)
+            except ValueError as e:
+                # json.JSONDecodeError is a ValueError too
+                raise ValueError(f"{manifest_path}:{line_number}: {e}")
+
+
+def iter_directory(directory, category):
+    """
+    Items for every image in a local directory
+
+    Parameters:
+    - directory: Directory to ingest (not recursive)
+    - category: Catalog category the images go to
+
+    Yields:
+    - Item dictionaries
+    """
+    with os.scandir(directory) as entries:
+        for dir_entry in sorted(entries, key=lambda entry: entry.name):
+            if dir_entry.is_file() and dir_entry.name.lower().endswith(IMAGE_EXTENSIONS + (".webp",)):
+                yield {"source": dir_entry.path, "category": category}
+
+
+def _item_name(item):
+    # Catalog file stem: the given name, else the source's file name
+    name = item.get("name")
+    if not name:
+        source = item["source"]
+        path = unquote(urlparse(source).path) if "://" in source else source
+        name = os.path.splitext(os.path.basename(path.rstrip("/")))[0]
+    return re.sub(r"[^A-Za-z0-9._-]", "_", str(name)).strip("._") or "item"
+
+
+def _process_image(job):
+    # Runs in worker processes: decode once, validate, normalize, write the
+    # catalog file and its thumbnails; returns failures instead of raising
+    data, stem_path, targets, image_format, max_side, min_side = job
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if img.width * img.height > MAX_PIXELS:
+                raise ValueError(f"image too large ({img.width}x{img.height})")
+            # A full decode catches truncated and corrupt files
+            img.load()
+            if min(img.size) < min_side:
+                raise ValueError(f"image too small ({img.width}x{img.height})")
+            if is_upload_ready(img, max_side):
+                output, extension, display = data, ".jpg" if img.format == "JPEG" else ".png", img
+            else:
+                display = ImageOps.exif_transpose(img)
+                if max(display.size) > max_side:
+                    display.thumbnail((max_side, max_side), Image.LANCZOS)
+                output, _, extension = normalize_image(display, max_side)
+
+            path = stem_path + extension
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(output)
+            os.replace(tmp_path, path)
+            if targets is not None:
+                write_thumbnails(display, list(thumbnail_targets(path, targets[0], targets[1]).values()), image_format)
+            return {"path": path, "sha256": bytes_sha256(output), "width": display.width, "height": display.height}
+    except Exception as e:
+        return e
+
+
+class CatalogIngester:
+    """
+    Streams items through a bounded fetch stage and a processing pool
+
+    At most a few batches of source bytes are in memory at once, whatever
+    the manifest size. Catalog items get thumbnails (recorded in the
+    thumbnail manifests) and are added to the catalog index; items with a
+    "directory" instead of a category (e.g. sample user photos) are only
+    normalized and written.
+
+    Parameters:
+    - catalog_dir: Catalog root holding one directory per category
+    - checkpoint_path: JSONL checkpoint for resuming (None: no checkpoint)
+    - fetch_concurrency: Concurrent downloads / file reads
+    - workers: Processing pool size (default: CPU count)
+    - max_side: Longest side of stored images
+    - min_side: Images with a shorter side are rejected
+    - max_source_bytes: Larger sources are rejected
+    - update_index: Refresh the catalog index for changed categories
+    - report: Callable receiving progress lines
+    """
+
+    def __init__(self, catalog_dir=DEFAULT_CATALOG_DIR, checkpoint_path=None,
+                 fetch_concurrency=DEFAULT_FETCH_CONCURRENCY, workers=None, max_side=DEFAULT_MAX_SIDE,
+                 min_side=DEFAULT_MIN_SIDE, max_source_bytes=DEFAULT_MAX_SOURCE_BYTES, update_index=True,
+                 report=print):
+        self.catalog_dir = catalog_dir
+        self.checkpoint_path = checkpoint_path
+        self.fetch_concurrency = fetch_concurrency
+        self.workers = workers or os.cpu_count() or 1
+        self.max_side = max_side
+        self.min_side = min_side
+        self.max_source_bytes = max_source_bytes
+        self.update_index = update_index
+        self.report = report
+        self.engine = get_thumbnail_engine()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=8, pool_maxsize=fetch_concurrency, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        # Per destination directory: content hash -> path, and stems taken this run
+        self._hashes = {}
+        self._claimed = {}
+        self._rendered = []
+        self._touched = set()
+        self._checkpoint = None
+        self._counts = {}
+        self._started_at = time.time()
+        self._synced_at = time.time()
+
+    def run(self, items):
+        """
+        Ingest items, skipping those finished in a previous run
+
+        Parameters:
+        - items: Iterable of item dictionaries with a url or path and a
+          category or directory (see iter_manifest)
+
+        Returns:
+        - Summary dictionary (counts, throughput, refreshed categories)
+        """
+        done = self._load_checkpoint()
+        self._counts = {
+            "total": 0, "skipped": 0, INGEST_ADDED: 0, INGEST_REPLACED: 0,
+            INGEST_DUPLICATE: 0, INGEST_FAILED: 0, "bytes_fetched": 0,
+        }
+        self._started_at = self._synced_at = time.time()
+        if self.checkpoint_path:
+            os.makedirs(os.path.dirname(self.checkpoint_path) or ".", exist_ok=True)
+            self._checkpoint = open(self.checkpoint_path, "a")
+            if self._checkpoint.tell() and not self._ends_with_newline():
+                # Terminate a line cut short by a crash, so the first new
+                # record isn't appended to it and lost
+                self._checkpoint.write("\n")
+
+        fetcher = ThreadPoolExecutor(max_workers=self.fetch_concurrency, thread_name_prefix="ingest-fetch")
+        # Spawned workers avoid forking a process with live threads
+        processor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        fetching = {}
+        processing = {}
+        try:
+            for item in items:
+                self._counts["total"] += 1
+                item = _normalize_item(item)
+                directory = self._destination(item)
+                key = f"{directory}\t{item['source']}"
+                previous = done.get(key)
+                if previous and (previous["status"] == INGEST_DUPLICATE or os.path.exists(previous["path"])):
+                    self._counts["skipped"] += 1
+                    continue
+                # Keep both stages busy without reading the whole manifest ahead
+                while len(fetching) + len(processing) >= 2 * (self.fetch_concurrency + self.workers):
+                    self._drain(fetching, processing, processor)
+                fetching[fetcher.submit(self._fetch, item["source"])] = (item, directory, key)
+            while fetching or processing:
+                self._drain(fetching, processing, processor)
+        except KeyboardInterrupt:
+            self.report("Interrupted; rerun with the same checkpoint to resume")
+            for future in fetching:
+                future.cancel()
+            raise
+        finally:
+            fetcher.shutdown(wait=True, cancel_futures=True)
+            processor.shutdown(wait=True, cancel_futures=True)
+            self.session.close()
+            self._sync(final=True)
+            if self._checkpoint:
+                self._checkpoint.close()
+                self._checkpoint = None
+
+        summary = self.summary()
+        if self.update_index and self._touched:
+            summary["index"] = self._refresh_index()
+        return summary
+
+    def summary(self):
+        """
+        Counts and throughput of the current run
+        """
+        summary = dict(self._counts)
+        summary["elapsed_seconds"] = time.time() - self._started_at
+        processed = summary["total"] - summary["skipped"]
+        summary["items_per_second"] = processed / summary["elapsed_seconds"] if summary["elapsed_seconds"] else 0.0
+        return summary
+
+    def _destination(self, item):
+        if item.get("directory"):
+            return os.path.normpath(item["directory"])
+        return os.path.normpath(os.path.join(self.catalog_dir, item["category"]))
+
+    def _drain(self, fetching, processing, processor):
+        finished, _ = wait(list(fetching) + list(processing), return_when=FIRST_COMPLETED)
+        for future in finished:
+            if future in fetching:
+                item, directory, key = fetching.pop(future)
+                try:
+                    data = future.result()
+                except Exception as e:
+                    self._finish(key, item, INGEST_FAILED, error=f"fetch failed: {e}")
+                    continue
+                self._counts["bytes_fetched"] += len(data)
+                job = self._prepare(item, directory, key, data)
+                if job is not None:
+                    processing[processor.submit(_process_image, job[0])] = job[1:]
+            else:
+                item, directory, key, sha256, replaced = processing.pop(future)
+                self._processed(future.result(), item, directory, key, sha256, replaced)
+        if time.time() - self._synced_at >= SYNC_INTERVAL:
+            self._sync()
+
+    def _prepare(self, item, directory, key, data):
+        # Deduplicate and pick the destination; returns (job, context...) or None
+        sha256 = bytes_sha256(data)
+        hashes = self._known_hashes(directory)
+        if sha256 in hashes:
+            self._finish(key, item, INGEST_DUPLICATE, path=hashes[sha256], sha256=sha256)
+            return None
+        # Claimed now so identical sources still in flight count as duplicates
+        hashes[sha256] = None
+
+        stem = _item_name(item)
+        claimed = self._claimed.setdefault(directory, set())
+        if stem in claimed:
+            # Two different images given the same name in one run
+            stem = f"{stem}_{sha256[:8]}"
+        claimed.add(stem)
+        os.makedirs(directory, exist_ok=True)
+        existing = [
+            os.path.join(directory, stem + extension) for extension in IMAGE_EXTENSIONS
+            if os.path.exists(os.path.join(directory, stem + extension))
+        ]
+        targets = None if item.get("directory") else (self.engine.sizes, self.engine.extension)
+        job = (data, os.path.join(directory, stem), targets, self.engine.image_format, self.max_side, self.min_side)
+        return job, item, directory, key, sha256, existing
+
+    def _processed(self, result, item, directory, key, sha256, replaced):
+        hashes = self._known_hashes(directory)
+        if isinstance(result, Exception):
+            hashes.pop(sha256, None)
+            self._finish(key, item, INGEST_FAILED, error=f"invalid image: {result}")
+            return
+        path = result["path"]
+        # The new item replaces same-named files (overwritten, or of another type)
+        for old_path in replaced:
+            self._forget(old_path, directory)
+            if old_path != path:
+                self._remove_item(old_path)
+        hashes[sha256] = path
+        hashes[result["sha256"]] = path
+        if not item.get("directory"):
+            self._rendered.append((path, result["sha256"], (result["width"], result["height"])))
+            self._touched.add(directory)
+        status = INGEST_REPLACED if replaced else INGEST_ADDED
+        self._finish(key, item, status, path=path, sha256=result["sha256"])
+
+    def _forget(self, path, directory):
+        hashes = self._known_hashes(directory)
+        for sha256 in [sha256 for sha256, known in hashes.items() if known == path]:
+            del hashes[sha256]
+
+    def _remove_item(self, path):
+        for remove_path in [path] + [target[0] for target in thumbnail_targets(
+                path, self.engine.sizes, self.engine.extension).values()]:
+            try:
+                os.remove(remove_path)
+            except OSError:
+                pass
+
+    def _known_hashes(self, directory):
+        # Content hashes of what the directory already holds, from the
+        # thumbnail manifest where it is current
+        hashes = self._hashes.get(directory)
+        if hashes is not None:
+            return hashes
+        hashes = self._hashes[directory] = {}
+        if not os.path.isdir(directory):
+            return hashes
+        with os.scandir(directory) as entries:
+            for dir_entry in entries:
+                if not dir_entry.is_file() or not dir_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = dir_entry.stat()
+                entry = self.engine.manifest_entry(dir_entry.path)
+                if entry and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+                    hashes[entry["sha256"]] = dir_entry.path
+                else:
+                    try:
+                        hashes[file_sha256(dir_entry.path)] = dir_entry.path
+                    except OSError:
+                        pass
+        return hashes
+
+    def _fetch(self, source):
+        # Source bytes from a URL or a local path
+        if "://" not in source or source.startswith("file://"):
+            path = unquote(urlparse(source).path) if source.startswith("file://") else os.path.expanduser(source)
+            if os.path.getsize(path) > self.max_source_bytes:
+                raise ValueError(f"larger than {self.max_source_bytes} bytes")
+            with open(path, "rb") as f:
+                return f.read()
+
+        attempt = 0
+        while True:
+            delay = None
+            try:
+                with self.session.get(source, stream=True, timeout=(FETCH_CONNECT_TIMEOUT, FETCH_READ_TIMEOUT)) as response:
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        delay = parse_retry_after(response.headers)
+                        error = requests.HTTPError(f"HTTP {response.status_code}")
+                    else:
+                        response.raise_for_status()
+                        return self._read_body(response)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            attempt += 1
+            if attempt > FETCH_MAX_RETRIES:
+                raise error
+            if delay is None:
+                # Exponential backoff with jitter
+                delay = FETCH_BACKOFF_BASE * (2 ** (attempt - 1)) * (0.5 + random.random())
+            time.sleep(min(delay, FETCH_MAX_RETRY_AFTER))
+
+    def _read_body(self, response):
+        length = response.headers.get("Content-Length")
+        if length and length.isdigit() and int(length) > self.max_source_bytes:
+            raise ValueError(f"larger than {self.max_source_bytes} bytes")
+        body = bytearray()
+        for chunk in response.iter_content(FETCH_CHUNK_SIZE):
+            body += chunk
+            if len(body) > self.max_source_bytes:
+                raise ValueError(f"larger than {self.max_source_bytes} bytes")
+        return bytes(body)
+
+    def _finish(self, key, item, status, path=None, sha256=None, error=None):
+        self._counts[status] += 1
+        _ingested_total.inc(result=status)
+        record = {"key": key, "source": item["source"], "status": status, "path": path, "sha256": sha256}
+        if error:
+            record["error"] = error
+            self.report(f"{item['source']}: {error}")
+        if self._checkpoint:
+            self._checkpoint.write(json.dumps(record) + "\n")
+
+    def _sync(self, final=False):
+        # Record rendered thumbnails first, so a checkpointed item never
+        # lacks its manifest entry for long
+        if self._rendered:
+            self.engine.record_rendered(self._rendered)
+            self._rendered = []
+        if self._checkpoint:
+            self._checkpoint.flush()
+            os.fsync(self._checkpoint.fileno())
+        self._synced_at = time.time()
+
+        summary = self.summary()
+        self.report(
+            f"{'Done' if final else 'Progress'}: {summary['total']} items, {summary['skipped']} skipped, "
+            f"{summary[INGEST_ADDED]} added, {summary[INGEST_REPLACED]} replaced, "
+            f"{summary[INGEST_DUPLICATE]} duplicates, {summary[INGEST_FAILED]} failed | "
+            f"{summary['items_per_second']:.1f} items/s"
+        )
+
+    def _ends_with_newline(self):
+        with open(self.checkpoint_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    def _load_checkpoint(self):
+        records = {}
+        if not self.checkpoint_path or not os.path.exists(self.checkpoint_path):
+            return records
+        with open(self.checkpoint_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A crash can leave a partial last line
+                    continue
+                if record["status"] == INGEST_FAILED:
+                    records.pop(record["key"], None)
+                else:
+                    records[record["key"]] = record
+        return records
+
+    def _refresh_index(self):
+        # Thumbnails are already recorded, so this only adds the new items
+        # and computes their descriptors
+        from catalog_index import get_catalog_index
+
+        index = get_catalog_index()
+        stats = {}
+        for directory in sorted(self._touched):
+            self.report(f"Updating catalog index for {directory}")
+            stats[directory] = index.refresh(directory, force=True)
+        return stats
+
+
+def default_checkpoint_path(name):
+    """
+    Checkpoint used for a manifest or directory unless one is given
+
+    Parameters:
+    - name: Manifest path or source directory
+
+    Returns:
+    - Path under .cache/ingest
+    """
+    stem = re.sub(r"[^A-Za-z0-9._-]", "_", os.path.basename(os.path.normpath(name)))
+    return os.path.join(DEFAULT_CHECKPOINT_DIR, f"{stem}.jsonl")
+
+
+def ingest(items, **kwargs):
+    """
+    Ingest items end to end (see CatalogIngester for the keyword arguments)
+
+    Parameters:
+    - items: Iterable of item dictionaries
+
+    Returns:
+    - Summary dictionary
+    """
+    return CatalogIngester(**kwargs).run(items)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest catalog images from a manifest or a directory")
+    parser.add_argument("manifest", nargs="?", help="File with one URL, path or JSON item per line")
+    parser.add_argument("--from-dir", help="Ingest every image in this directory instead of a manifest")
+    parser.add_argument("--category", help="Category of items that don't name one (e.g. clothing)")
+    parser.add_argument("--catalog-dir", default=DEFAULT_CATALOG_DIR, help="Catalog root directory")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: .cache/ingest/<manifest>.jsonl)")
+    parser.add_argument("--no-resume", action="store_true", help="Ignore and replace the checkpoint")
+    parser.add_argument("--fetch-concurrency", type=int, default=DEFAULT_FETCH_CONCURRENCY,
+                        help="Concurrent downloads / file reads")
+    parser.add_argument("--workers", type=int, default=None, help="Processing pool size (default: CPU count)")
+    parser.add_argument("--max-side", type=int, default=DEFAULT_MAX_SIDE, help="Longest side of stored images")
+    parser.add_argument("--min-side", type=int, default=DEFAULT_MIN_SIDE, help="Reject smaller images")
+    parser.add_argument("--no-index", action="store_true", help="Don't refresh the catalog index")
+    parser.add_argument("--config", help="Path to config.json, for the shared cache (default: next to this script)")
+    args = parser.parse_args()
+    if bool(args.manifest) == bool(args.from_dir):
+        parser.error("pass either a manifest or --from-dir")
+    if args.from_dir and not args.category:
+        parser.error("--from-dir needs --category")
+
+    from tryon import load_config
+
+    # Publish thumbnails for the app replicas when a shared cache is set up
+    cache_backend.configure(load_config(args.config))
+    checkpoint_path = args.checkpoint or default_checkpoint_path(args.manifest or args.from_dir)
+    if args.no_resume and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    items = iter_directory(args.from_dir, args.category) if args.from_dir else iter_manifest(args.manifest, args.category)
+
+    summary = ingest(
+        items, catalog_dir=args.catalog_dir, checkpoint_path=checkpoint_path,
+        fetch_concurrency=args.fetch_concurrency, workers=args.workers, max_side=args.max_side,
+        min_side=args.min_side, update_index=not args.no_index
+    )
+    print(json.dumps(summary, indent=2))
+
+
+if __name__ == "__main__":
+    main()
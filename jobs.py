@@ -0,0 +1,244 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Job status values reported to the UI
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# Default number of worker threads shared by every session in the process
+DEFAULT_MAX_WORKERS = 4
+
+# How long finished jobs are kept around for polling (seconds)
+DEFAULT_RETENTION_SECONDS = 3600
+
+
+_jobs_finished = metrics.counter("tryon_jobs_finished_total", "Finished try-on jobs by status", ("status",))
+
+# ID of the job running on the current worker thread
+_current = threading.local()
+
+
+def current_job_id():
+    """
+    Get the ID of the job being run by the calling thread
+
+    Returns:
+    - Job ID, or None when called outside a job worker
+    """
+    return getattr(_current, "job_id", None)
+
+
+def set_current_job_preview(preview):
+    """
+    Publish an intermediate result for the job run by the calling thread
+
+    Pollers see it in the job's "preview" field until the job finishes.
+    Does nothing when called outside a job worker.
+
+    Parameters:
+    - preview: JSON-serializable value, e.g. the path of a partial image
+    """
+    job = getattr(_current, "job", None)
+    if job is not None:
+        job.preview = preview
+
+
+class TryOnJob:
+    """
+    A single try-on generation submitted to the job queue
+
+    Parameters:
+    - job_id: Unique identifier returned to the caller
+    - fn: Callable that performs the work and returns the result
+    - args: Positional arguments for fn
+    - kwargs: Keyword arguments for fn
+    """
+
+    def __init__(self, job_id, fn, args, kwargs):
+        self.job_id = job_id
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.status = JOB_QUEUED
+        self.result = None
+        self.error = None
+        # Latest intermediate result (e.g. a partial image) while running
+        self.preview = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        """
+        Snapshot of the job state that is safe to hand to the UI
+        """
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "result": self.result,
+            "error": self.error,
+            "preview": self.preview,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TryOnJobQueue:
+    """
+    Bounded worker pool for try-on generations
+
+    Submissions return a job ID immediately; a fixed number of worker threads
+    run the upstream calls so that many sessions share the same slots instead
+    of each tying up its own Streamlit script thread.
+
+    Parameters:
+    - max_workers: Number of generations that may run at the same time
+    - retention_seconds: How long finished jobs stay available for polling
+    """
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, retention_seconds=DEFAULT_RETENTION_SECONDS):
+        self.max_workers = max_workers
+        self.retention_seconds = retention_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tryon-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue a callable for execution on the worker pool
+
+        Parameters:
+        - fn: Callable to run; its return value becomes the job result
+        - args, kwargs: Arguments passed to fn
+
+        Returns:
+        - Job ID that can be passed to get()
+        """
+        job = TryOnJob(uuid.uuid4().hex, fn, args, kwargs)
+        with self._lock:
+            self._prune_locked()
+            self._jobs[job.job_id] = job
+        self._executor.submit(self._run, job)
+        return job.job_id
+
+    def get(self, job_id):
+        """
+        Get the current state of a job
+
+        Parameters:
+        - job_id: ID returned by submit()
+
+        Returns:
+        - Dictionary with the job state, or None if the job is unknown or expired
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            state = job.to_dict()
+            state["queue_position"] = self._queue_position_locked(job)
+            return state
+
+    def stats(self):
+        """
+        Count jobs by status
+
+        Returns:
+        - Dictionary mapping status to the number of known jobs in that status
+        """
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0, JOB_FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def shutdown(self, wait=True):
+        """
+        Stop accepting work and optionally wait for running jobs to finish
+        """
+        self._executor.shutdown(wait=wait)
+
+    def _queue_position_locked(self, job):
+        # Jobs are dispatched in submission order, so the position is the
+        # number of queued jobs submitted before this one (1-indexed)
+        if job.status != JOB_QUEUED:
+            return None
+        position = 1
+        for other in self._jobs.values():
+            if other is job:
+                break
+            if other.status == JOB_QUEUED:
+                position += 1
+        return position
+
+    def _run(self, job):
+        with self._lock:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+        metrics.observe_stage("jobs.queue_wait", job.started_at - job.submitted_at)
+        _current.job_id = job.job_id
+        _current.job = job
+        try:
+            with metrics.span("jobs.run"):
+                result = job.fn(*job.args, **job.kwargs)
+        except Exception as e:
+            _jobs_finished.inc(status=JOB_FAILED)
+            with self._lock:
+                job.status = JOB_FAILED
+                job.error = str(e)
+                job.preview = None
+                job.finished_at = time.time()
+        else:
+            _jobs_finished.inc(status=JOB_DONE)
+            with self._lock:
+                job.status = JOB_DONE
+                job.result = result
+                job.preview = None
+                job.finished_at = time.time()
+        finally:
+            _current.job_id = None
+            _current.job = None
+            # Drop references to the inputs once the job has finished
+            job.fn = None
+            job.args = ()
+            job.kwargs = {}
+
+    def _prune_locked(self):
+        # Forget finished jobs nobody has polled for a while
+        cutoff = time.time() - self.retention_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Process-wide queue shared by all Streamlit sessions
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue(max_workers=DEFAULT_MAX_WORKERS):
+    """
+    Get the process-wide try-on job queue, creating it on first use
+
+    Parameters:
+    - max_workers: Worker count used when the queue is first created
+
+    Returns:
+    - The shared TryOnJobQueue instance
+    """
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = TryOnJobQueue(max_workers=max_workers)
+    return _job_queue
@@ -0,0 +1,332 @@
+"""
+Lightweight in-process metrics: counters, latency histograms and timing spans
+
+Metrics are off by default. When disabled, span() returns a shared no-op
+context manager and inc()/observe() return after a single flag check, so
+instrumented code pays almost nothing. Enable with "metrics_enabled" in
+config.json (or the TRYON_METRICS=1 environment variable) and read them in
+Prometheus text format from the API's /metrics endpoint, from a standalone
+endpoint ("metrics_port") or from a file rewritten periodically
+("metrics_file").
+"""
+import bisect
+import os
+import threading
+import time
+
+# Histogram buckets (seconds) covering file I/O up to slow image generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Seconds between metrics file writes
+DEFAULT_FILE_INTERVAL = 15
+
+# Name of the histogram fed by span()
+STAGE_HISTOGRAM = "tryon_stage_seconds"
+
+_enabled = os.getenv("TRYON_METRICS", "").lower() in ("1", "true", "yes")
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def enable(enabled=True):
+    """
+    Turn metric collection on or off for the whole process
+    """
+    global _enabled
+    _enabled = enabled
+
+
+def is_enabled():
+    """
+    True if metrics are being collected
+    """
+    return _enabled
+
+
+def _label_key(labelnames, labels):
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = list(zip(labelnames, key))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """
+    Monotonic counter with optional labels
+
+    Parameters:
+    - name: Metric name (Prometheus naming, ending in _total)
+    - help_text: One-line description
+    - labelnames: Names of the labels passed to inc()
+    """
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """
+        Add to the counter (no-op while metrics are disabled)
+        """
+        if not _enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        """
+        Current value for a label combination
+        """
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative histogram with optional labels
+
+    Parameters:
+    - name: Metric name (e.g. ..._seconds)
+    - help_text: One-line description
+    - labelnames: Names of the labels passed to observe()
+    - buckets: Upper bounds of the buckets, ascending
+    """
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Record one observation (no-op while metrics are disabled)
+        """
+        if not _enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self, **labels):
+        """
+        (count, sum) for a label combination
+        """
+        with self._lock:
+            series = self._series.get(_label_key(self.labelnames, labels))
+            return (series[2], series[1]) if series else (0, 0.0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def _register(cls, name, *args, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = _registry[name] = cls(name, *args, **kwargs)
+        return metric
+
+
+def counter(name, help_text, labelnames=()):
+    """
+    Get or create a registered counter
+    """
+    return _register(Counter, name, help_text, labelnames)
+
+
+def histogram(name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """
+    Get or create a registered histogram
+    """
+    return _register(Histogram, name, help_text, labelnames, buckets=buckets)
+
+
+_stage_seconds = histogram(STAGE_HISTOGRAM, "Time spent in each stage of try-on and catalog work", ("stage",))
+_stage_errors = counter("tryon_stage_errors_total", "Stages that raised an exception", ("stage",))
+
+
+class _Span:
+    __slots__ = ("stage", "start")
+
+    def __init__(self, stage):
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _stage_seconds.observe(time.perf_counter() - self.start, stage=self.stage)
+        if exc_type is not None:
+            _stage_errors.inc(stage=self.stage)
+        return False
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+def span(stage):
+    """
+    Time a block of code into the stage histogram
+
+        with metrics.span("upstream.request"):
+            ...
+
+    Parameters:
+    - stage: Stage name (dotted, e.g. "tryon.prepare_upload")
+
+    Returns:
+    - Context manager (a shared no-op while metrics are disabled)
+    """
+    if not _enabled:
+        return _NOOP_SPAN
+    return _Span(stage)
+
+
+def observe_stage(stage, seconds):
+    """
+    Record a stage duration measured by the caller (e.g. time spent queued)
+    """
+    _stage_seconds.observe(seconds, stage=stage)
+
+
+def render_prometheus():
+    """
+    All registered metrics in Prometheus text exposition format
+    """
+    with _registry_lock:
+        metrics = list(_registry.values())
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path):
+    """
+    Write the current metrics to a file atomically (e.g. for node_exporter's
+    textfile collector)
+    """
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def _start_metrics_server(host, port):
+    # http.server is only imported when the standalone endpoint is configured
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def configure(config):
+    """
+    Enable metrics and start the configured exporters, once per process
+
+    Parameters:
+    - config: Configuration dictionary; reads metrics_enabled, metrics_port
+      (standalone /metrics endpoint) and metrics_file / metrics_file_interval
+    """
+    global _exporters_started
+    if config.get("metrics_enabled"):
+        enable(True)
+    if not _enabled:
+        return
+
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    port = config.get("metrics_port")
+    if port:
+        _start_metrics_server(config.get("metrics_host", "0.0.0.0"), int(port))
+
+    path = config.get("metrics_file")
+    if path:
+        interval = float(config.get("metrics_file_interval", DEFAULT_FILE_INTERVAL))
+
+        def write_forever():
+            while True:
+                try:
+                    write_metrics_file(path)
+                except OSError as e:
+                    print(f"Could not write metrics file: {e}")
+                time.sleep(interval)
+
+        threading.Thread(target=write_forever, name="metrics-file", daemon=True).start()
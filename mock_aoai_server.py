@@ -0,0 +1,265 @@
+"""
+Local stand-in for the Azure OpenAI images/edits endpoint
+
+Point the app at it by setting "imagegen_aoai_edits_url" in config.json, e.g.
+http://127.0.0.1:8765/openai/deployments/mock/images/edits
+
+    python mock_aoai_server.py --port 8765 --latency 2 --error-rate 0.2
+
+--payload-bytes makes the returned PNG roughly that large (incompressible
+noise), to model realistic 1-3 MB generations.
+
+Requests with stream=true get a server-sent event stream instead: one
+image_edit.partial_image event per requested partial image, spread over the
+latency, then image_edit.completed with the final image.
+"""
+import argparse
+import base64
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+
+def make_png(size=(1024, 1536), color=(180, 140, 200)):
+    """
+    Build a solid-color PNG to return as the generated image
+
+    Parameters:
+    - size: (width, height) of the image
+    - color: RGB fill color
+
+    Returns:
+    - PNG bytes
+    """
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def make_noise_png(target_bytes, seed=0):
+    """
+    Build a noise PNG of roughly target_bytes (noise barely compresses)
+
+    Parameters:
+    - target_bytes: Approximate size of the PNG in bytes
+    - seed: Seed for the noise, so payloads are reproducible
+
+    Returns:
+    - PNG bytes
+    """
+    side = max(1, int((target_bytes / 3) ** 0.5))
+    noise = random.Random(seed).randbytes(side * side * 3)
+    buffer = BytesIO()
+    Image.frombytes("RGB", (side, side), noise).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def form_field(body, name):
+    """
+    Value of a simple text field in a multipart/form-data body
+
+    Parameters:
+    - body: Raw request body
+    - name: Field name
+
+    Returns:
+    - Field value as a string, or None if the field is missing
+    """
+    match = re.search(rb'name="' + re.escape(name.encode()) + rb'"\r\n(?:[^\r\n]+\r\n)*\r\n([^\r\n]*)', body)
+    return match.group(1).decode("utf-8", "replace") if match else None
+
+
+class MockImageEditsHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so clients can keep connections alive
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        # Always drain the request body so the connection can be reused
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+
+        with server.stats_lock:
+            server.stats["requests"] += 1
+            server.stats["bytes_received"] += length
+
+        if not self.path.split("?")[0].endswith("/images/edits"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        latency = server.random.uniform(server.latency * 0.8, server.latency * 1.2) if server.latency else 0
+        stream = form_field(body, "stream") == "true"
+        if stream:
+            # Partial images arrive over the generation time, so only the
+            # first one is delayed by the time to first frame
+            partial_images = min(3, max(0, int(form_field(body, "partial_images") or 0)))
+            time.sleep(latency / (partial_images + 1))
+        else:
+            time.sleep(latency)
+
+        if server.random.random() < server.error_rate:
+            with server.stats_lock:
+                server.stats["errors"] += 1
+            headers = {}
+            if server.error_status == 429 and server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+            self._send_json(server.error_status, {"error": {"message": "Mock upstream error"}}, headers)
+            return
+
+        if stream:
+            self._send_stream(partial_images, latency)
+            return
+
+        self._send_json(200, {
+            "created": int(time.time()),
+            "data": [{"b64_json": server.b64_image}],
+        })
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up (e.g. its read timeout expired)
+            pass
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def _send_stream(self, partial_images, latency):
+        server = self.server
+        with server.stats_lock:
+            server.stats["streams"] += 1
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        # Chunked, like the real service, so each event is delivered as it is sent
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        for index in range(partial_images):
+            if index:
+                time.sleep(latency / (partial_images + 1))
+            self._send_event("image_edit.partial_image", {
+                "type": "image_edit.partial_image",
+                "partial_image_index": index,
+                "b64_json": server.b64_partials[index],
+            })
+        if partial_images:
+            time.sleep(latency / (partial_images + 1))
+        self._send_event("image_edit.completed", {
+            "type": "image_edit.completed",
+            "created_at": int(time.time()),
+            "b64_json": server.b64_image,
+        })
+        # Zero-length chunk ends the response
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _send_event(self, event, payload):
+        data = f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_mock_server(host="127.0.0.1", port=0, latency=0.0, error_rate=0.0,
+                       error_status=429, retry_after=None, image_size=(1024, 1536), quiet=True,
+                       payload_bytes=None, seed=None):
+    """
+    Create a mock images/edits server (call serve_forever() or use start_mock_server())
+
+    Parameters:
+    - host, port: Address to bind; port 0 picks a free port
+    - latency: Mean response latency in seconds
+    - error_rate: Fraction of requests answered with error_status
+    - error_status: HTTP status used for injected errors
+    - retry_after: Retry-After seconds sent with injected 429s
+    - image_size: (width, height) of the returned image
+    - quiet: Suppress per-request logging
+    - payload_bytes: Approximate size of the returned PNG (overrides image_size)
+    - seed: Seed for latency jitter and error injection (reproducible runs)
+
+    Returns:
+    - ThreadingHTTPServer instance
+    """
+    server = ThreadingHTTPServer((host, port), MockImageEditsHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.retry_after = retry_after
+    server.quiet = quiet
+    server.random = random.Random(seed)
+    png = make_noise_png(payload_bytes, seed or 0) if payload_bytes else make_png(image_size)
+    server.b64_image = base64.b64encode(png).decode("ascii")
+    # Partial images: small, progressively lighter frames
+    server.b64_partials = [
+        base64.b64encode(make_png((256, 384), (60 + 40 * index, 50 + 30 * index, 80 + 40 * index))).decode("ascii")
+        for index in range(3)
+    ]
+    server.stats = {"requests": 0, "errors": 0, "bytes_received": 0, "streams": 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+def start_mock_server(**kwargs):
+    """
+    Start a mock server on a background thread
+
+    Parameters:
+    - kwargs: Passed to create_mock_server()
+
+    Returns:
+    - (server, edits_url) tuple; call server.shutdown() when done
+    """
+    server = create_mock_server(**kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f"http://{host}:{port}/openai/deployments/mock/images/edits"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI images/edits server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=1.0, help="Mean latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None)
+    parser.add_argument("--payload-bytes", type=int, default=None, help="Approximate size of the returned PNG")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latency jitter and errors")
+    args = parser.parse_args()
+
+    server = create_mock_server(
+        host=args.host,
+        port=args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        quiet=False,
+        payload_bytes=args.payload_bytes,
+        seed=args.seed,
+    )
+    print(f"Mock images/edits endpoint: http://{args.host}:{args.port}/openai/deployments/mock/images/edits")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+"""
+Local stand-in for a Redis server, for the shared cache (cache_backend.py)
+
+Speaks enough of the Redis protocol (RESP) for the cache: PING, AUTH,
+SELECT, GET, SET (with EX/PX/NX/XX), DEL, EXISTS, PTTL, DBSIZE, FLUSHDB,
+FLUSHALL and INFO. Keys expire like Redis keys, and with --max-bytes the
+least recently used keys are evicted (Redis' allkeys-lru policy), so TTLs
+and size limits can be tried without a real server:
+
+    python mock_redis_server.py --port 6399 --max-bytes 268435456
+
+then set "shared_cache_url": "redis://127.0.0.1:6399/0" on every replica.
+"""
+import argparse
+import threading
+import time
+from collections import OrderedDict
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+
+class _Store:
+    # Keys of every database in one LRU order, with expiry times and a byte budget
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.stats = {"commands": 0, "hits": 0, "misses": 0, "evicted": 0, "expired": 0}
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self._drop(key)
+            self.stats["expired"] += 1
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def set(self, key, value, expires_at):
+        self._drop(key)
+        self.entries[key] = (value, expires_at)
+        self.bytes += len(key) + len(value)
+        while self.max_bytes and self.bytes > self.max_bytes and len(self.entries) > 1:
+            oldest = next(iter(self.entries))
+            self._drop(oldest)
+            self.stats["evicted"] += 1
+
+    def _drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.bytes -= len(key) + len(entry[0])
+        return entry is not None
+
+
+class _Handler(StreamRequestHandler):
+    def handle(self):
+        self.db = b"0"
+        while True:
+            try:
+                command = self._read_command()
+            except (ConnectionError, ValueError):
+                return
+            if command is None:
+                return
+            self.wfile.write(self.server.execute(self, command))
+
+    def _read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            # Inline command (e.g. typed into telnet)
+            return line.strip().split()
+        args = []
+        for _ in range(int(line[1:])):
+            header = self.rfile.readline()
+            if not header.startswith(b"$"):
+                raise ValueError("Expected a bulk string")
+            length = int(header[1:])
+            data = self.rfile.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError("Client went away")
+            args.append(data[:-2])
+        return args
+
+
+def _simple(text):
+    return b"+" + text + b"\r\n"
+
+
+def _error(text):
+    return b"-ERR " + text.encode("utf-8") + b"\r\n"
+
+
+def _integer(value):
+    return b":%d\r\n" % value
+
+
+def _bulk(value):
+    if value is None:
+        return b"$-1\r\n"
+    return b"$%d\r\n" % len(value) + value + b"\r\n"
+
+
+class MockRedisServer(ThreadingTCPServer):
+    """
+    Threaded RESP server backed by an in-memory dictionary
+
+    Parameters:
+    - address: (host, port) to listen on (port 0 picks a free port)
+    - max_bytes: Memory budget for keys and values (None: unlimited)
+    - password: Password required by AUTH (None: no authentication)
+    """
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, max_bytes=None, password=None):
+        super().__init__(address, _Handler)
+        self.store = _Store(max_bytes)
+        self.password = password
+
+    @property
+    def stats(self):
+        with self.store.lock:
+            return dict(self.store.stats, keys=len(self.store.entries), bytes=self.store.bytes)
+
+    def execute(self, handler, args):
+        if not args:
+            return _error("empty command")
+        name = args[0].upper()
+        store = self.store
+        with store.lock:
+            store.stats["commands"] += 1
+            if name == b"AUTH":
+                if self.password is None or args[-1].decode("utf-8", "replace") == self.password:
+                    handler.authenticated = True
+                    return _simple(b"OK")
+                return b"-WRONGPASS invalid password\r\n"
+            if self.password is not None and not getattr(handler, "authenticated", False):
+                return b"-NOAUTH Authentication required.\r\n"
+            if name == b"PING":
+                return _simple(b"PONG") if len(args) == 1 else _bulk(args[1])
+            if name == b"SELECT":
+                handler.db = args[1]
+                return _simple(b"OK")
+
+            keys = [handler.db + b":" + key for key in args[1:]]
+            if name == b"GET":
+                entry = store.get(keys[0])
+                store.stats["hits" if entry else "misses"] += 1
+                return _bulk(entry[0] if entry else None)
+            if name == b"SET":
+                return self._set(keys[0], args[2], [option.upper() for option in args[3:]])
+            if name == b"DEL":
+                return _integer(sum(store._drop(key) for key in keys))
+            if name == b"EXISTS":
+                return _integer(sum(store.get(key) is not None for key in keys))
+            if name == b"PTTL":
+                entry = store.get(keys[0])
+                if entry is None:
+                    return _integer(-2)
+                return _integer(-1 if entry[1] is None else int((entry[1] - time.time()) * 1000))
+            if name == b"DBSIZE":
+                prefix = handler.db + b":"
+                return _integer(sum(1 for key in store.entries if key.startswith(prefix)))
+            if name == b"FLUSHDB":
+                prefix = handler.db + b":"
+                for key in [key for key in store.entries if key.startswith(prefix)]:
+                    store._drop(key)
+                return _simple(b"OK")
+            if name == b"FLUSHALL":
+                store.entries.clear()
+                store.bytes = 0
+                return _simple(b"OK")
+            if name == b"INFO":
+                info = (
+                    f"# Memory\r\nused_memory:{store.bytes}\r\nmaxmemory:{store.max_bytes or 0}\r\n"
+                    f"maxmemory_policy:allkeys-lru\r\n# Stats\r\nkeyspace_hits:{store.stats['hits']}\r\n"
+                    f"keyspace_misses:{store.stats['misses']}\r\nevicted_keys:{store.stats['evicted']}\r\n"
+                    f"expired_keys:{store.stats['expired']}\r\n"
+                )
+                return _bulk(info.encode("utf-8"))
+            return _error(f"unknown command '{name.decode('utf-8', 'replace')}'")
+
+    def _set(self, key, value, options):
+        store = self.store
+        expires_at = None
+        index = 0
+        while index < len(options):
+            option = options[index]
+            if option in (b"EX", b"PX") and index + 1 < len(options):
+                amount = int(options[index + 1])
+                expires_at = time.time() + (amount if option == b"EX" else amount / 1000)
+                index += 2
+                continue
+            if option == b"NX" and store.get(key) is not None:
+                return _bulk(None)
+            if option == b"XX" and store.get(key) is None:
+                return _bulk(None)
+            if option not in (b"NX", b"XX"):
+                return _error("syntax error")
+            index += 1
+        store.set(key, value, expires_at)
+        return _simple(b"OK")
+
+
+def start_mock_redis_server(host="127.0.0.1", port=0, max_bytes=None, password=None):
+    """
+    Start a mock Redis server on a background thread
+
+    Parameters:
+    - host / port: Address to listen on (port 0 picks a free port)
+    - max_bytes: Memory budget; least recently used keys are evicted beyond it
+    - password: Password required by AUTH
+
+    Returns:
+    - (server, url) tuple, url being a shared_cache_url; call
+      server.shutdown() when done
+    """
+    server = MockRedisServer((host, port), max_bytes=max_bytes, password=password)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address[:2]
+    credentials = f":{password}@" if password else ""
+    return server, f"redis://{credentials}{host}:{port}/0"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock Redis server for the shared cache")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6399)
+    parser.add_argument("--max-bytes", type=int, default=None, help="Memory budget (allkeys-lru eviction)")
+    parser.add_argument("--password", default=None)
+    args = parser.parse_args()
+
+    server = MockRedisServer((args.host, args.port), max_bytes=args.max_bytes, password=args.password)
+    print(f"Mock Redis server: redis://{args.host}:{args.port}/0")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
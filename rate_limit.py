@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Default limits for one images/edits deployment
+DEFAULT_REQUESTS_PER_MINUTE = 20
+DEFAULT_MAX_IN_FLIGHT = 4
+
+
+class TokenBucket:
+    """
+    Token-bucket rate limiter with FIFO reservations
+
+    Each caller reserves the next available token under the lock, so callers
+    are served in arrival order and never stampede when tokens refill.
+
+    Parameters:
+    - rate_per_minute: Sustained request rate
+    - burst: Number of requests that may be sent back to back (default: 1)
+    """
+
+    def __init__(self, rate_per_minute, burst=1):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Reserve one token
+
+        Returns:
+        - Seconds the caller must wait before using the token
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """
+        Block until a token is available
+        """
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UpstreamGovernor:
+    """
+    Process-wide traffic shaper for one upstream deployment
+
+    Combines a fair (FIFO) max-in-flight limit with a token bucket, so bursts
+    from many sessions are queued client-side instead of being rejected by
+    the service with 429s.
+
+    Parameters:
+    - requests_per_minute: Sustained request rate (0 disables rate limiting)
+    - max_in_flight: Maximum concurrent upstream calls
+    - burst: Requests that may be sent back to back (default: max_in_flight)
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, burst=None):
+        self.max_in_flight = max(1, max_in_flight)
+        self.bucket = None
+        if requests_per_minute > 0:
+            self.bucket = TokenBucket(requests_per_minute, burst or self.max_in_flight)
+        self._in_flight = 0
+        self._waiters = deque()
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, ticket=None):
+        """
+        Hold one of the in-flight slots for the duration of the block
+
+        Waiters are admitted strictly in arrival order.
+
+        Parameters:
+        - ticket: Optional identifier (e.g. a job ID) used by position()
+        """
+        entry = [ticket]
+        with self._cond:
+            self._waiters.append(entry)
+            while self._waiters[0] is not entry or self._in_flight >= self.max_in_flight:
+                self._cond.wait()
+            self._waiters.popleft()
+            self._in_flight += 1
+            # The next waiter may be admissible as well
+            self._cond.notify_all()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
+
+    def throttle(self):
+        """
+        Wait for a rate-limit token; call before every upstream attempt,
+        including retries
+        """
+        if self.bucket is not None:
+            self.bucket.acquire()
+
+    def position(self, ticket):
+        """
+        Queue position of a waiting ticket
+
+        Parameters:
+        - ticket: Identifier passed to slot()
+
+        Returns:
+        - 1-based position among waiters, or None if the ticket is not waiting
+        """
+        with self._cond:
+            for index, entry in enumerate(self._waiters):
+                if entry[0] == ticket:
+                    return index + 1
+        return None
+
+    def stats(self):
+        """
+        Current load on the governor
+
+        Returns:
+        - Dictionary with in_flight and waiting counts
+        """
+        with self._cond:
+            return {"in_flight": self._in_flight, "waiting": len(self._waiters)}
+
+
+# Process-wide governors keyed by deployment
+_governors = {}
+_governors_lock = threading.Lock()
+
+
+def get_upstream_governor(config):
+    """
+    Get the shared governor for the configured deployment, creating it on first use
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+
+    Returns:
+    - The shared UpstreamGovernor instance
+    """
+    key = (
+        config.get("imagegen_aoai_resource", ""),
+        config.get("imagegen_aoai_deployment", ""),
+        config.get("imagegen_aoai_edits_url", ""),
+    )
+    with _governors_lock:
+        governor = _governors.get(key)
+        if governor is None:
+            burst = config.get("imagegen_aoai_burst")
+            governor = UpstreamGovernor(
+                requests_per_minute=float(config.get("imagegen_aoai_requests_per_minute", DEFAULT_REQUESTS_PER_MINUTE)),
+                max_in_flight=int(config.get("imagegen_aoai_max_in_flight", DEFAULT_MAX_IN_FLIGHT)),
+                burst=int(burst) if burst else None,
+            )
+            _governors[key] = governor
+        return governor
@@ -0,0 +1,115 @@
+"""
+Display-sized renditions of results, uploads and catalog originals
+
+The UI never needs a full-resolution PNG on screen: a selected item is
+shown a couple of hundred pixels wide, and a 1024x1536 result fits in half
+the page. Renditions are downscaled, compactly encoded (WebP, or JPEG
+where WebP is unavailable) copies, cached on disk under the SHA-256 of the
+source and the target size, so every rerun and every session reuses them
+and an edited source gets new ones. Originals are still served for
+downloads.
+"""
+import os
+import threading
+
+import metrics
+from content_hash import file_sha256
+from singleflight import SingleFlight
+from thumbnails import default_thumbnail_format, render_thumbnails
+
+# Named renditions: name -> max (width, height)
+RENDITION_SIZES = {
+    "strip": (240, 240),      # selected-items strip and small previews
+    "preview": (768, 1152),   # result column and profile photo
+    "full": (1024, 1536),     # largest on-screen size (full result size)
+}
+
+# Directory holding cached renditions
+DEFAULT_RENDITION_DIR = os.path.join(".cache", "renditions")
+
+# Characters of the source hash used in rendition filenames
+HASH_PREFIX_LENGTH = 32
+
+_renditions_total = metrics.counter("renditions_total", "Rendition lookups by outcome (hit, built, failed)", ("result",))
+
+
+class RenditionCache:
+    """
+    On-disk cache of downscaled, re-encoded copies of images
+
+    Renditions are keyed by source content hash and target size; concurrent
+    requests for the same rendition render it once.
+
+    Parameters:
+    - cache_dir: Directory holding the renditions
+    - image_format: "WEBP" or "JPEG" (default: best supported)
+    """
+
+    def __init__(self, cache_dir=DEFAULT_RENDITION_DIR, image_format=None):
+        self.cache_dir = cache_dir
+        self.image_format = image_format or default_thumbnail_format()
+        self.extension = ".webp" if self.image_format == "WEBP" else ".jpg"
+        self._flights = SingleFlight()
+
+    def get(self, image_path, size="preview"):
+        """
+        Path to a display rendition of an image, rendering it if needed
+
+        Parameters:
+        - image_path: Path to the source image
+        - size: Name from RENDITION_SIZES, or a max (width, height) tuple
+          (a height of None bounds the width only)
+
+        Returns:
+        - Path to the rendition, or the source path if it can't be rendered
+        """
+        max_width, max_height = RENDITION_SIZES[size] if isinstance(size, str) else size
+        if max_height is None:
+            # Image.thumbnail() needs both bounds; this one never applies
+            max_height = max_width * 100
+        try:
+            key = f"{file_sha256(image_path)[:HASH_PREFIX_LENGTH]}_{max_width}x{max_height}"
+        except OSError:
+            _renditions_total.inc(result="failed")
+            return image_path
+        path = os.path.join(self.cache_dir, key + self.extension)
+        if os.path.exists(path):
+            _renditions_total.inc(result="hit")
+            return path
+
+        def render():
+            if not os.path.exists(path):
+                with metrics.span("renditions.render"):
+                    render_thumbnails(image_path, [(path, (max_width, max_height))], self.image_format)
+                _renditions_total.inc(result="built")
+            return path
+
+        try:
+            return self._flights.do(key, render)[0]
+        except Exception as e:
+            print(f"Could not render {image_path} at {max_width}x{max_height}: {e}")
+            _renditions_total.inc(result="failed")
+            return image_path
+
+
+# Process-wide rendition cache shared by all sessions
+_rendition_cache = None
+_rendition_cache_lock = threading.Lock()
+
+
+def get_rendition_cache(cache_dir=DEFAULT_RENDITION_DIR):
+    """
+    Get the process-wide rendition cache, creating it on first use
+
+    Parameters:
+    - cache_dir: Directory used when the cache is first created
+
+    Returns:
+    - The shared RenditionCache instance
+    """
+    global _rendition_cache
+    if _rendition_cache is None:
+        with _rendition_cache_lock:
+            if _rendition_cache is None:
+                _rendition_cache = RenditionCache(cache_dir=cache_dir)
+    return _rendition_cache
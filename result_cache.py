@@ -0,0 +1,239 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from cache_backend import pack, shared_cache, unpack
+from content_hash import bytes_sha256, file_sha256
+
+# Default byte budget for cached generations (512 MiB)
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Name of the index file stored alongside the cached images
+INDEX_FILENAME = ".result_cache.json"
+
+# Minimum seconds between index writes caused only by cache hits
+INDEX_FLUSH_INTERVAL = 30
+
+
+def make_cache_key(user_image_path, item_paths, prompt, params):
+    """
+    Build a content-addressed cache key for a try-on request
+
+    The key depends on the bytes of the input images rather than their paths,
+    so re-uploads of the same photo and reordered item selections hit the
+    same entry.
+
+    Parameters:
+    - user_image_path: Path to the user's photo
+    - item_paths: List of paths to the selected catalog items
+    - prompt: Full prompt sent upstream
+    - params: Dictionary of request parameters (size, quality, deployment...)
+
+    Returns:
+    - Hex digest identifying the request
+    """
+    payload = {
+        "user_image": file_sha256(user_image_path),
+        "items": sorted(file_sha256(path) for path in item_paths),
+        "prompt": prompt,
+        "params": params,
+    }
+    return bytes_sha256(json.dumps(payload, sort_keys=True).encode("utf-8"))
+
+
+class ResultCache:
+    """
+    On-disk LRU cache of generated try-on images
+
+    Entries point at files in the cache directory and are evicted least
+    recently used first once the total size exceeds the byte budget. With a
+    shared cache configured, new generations are published to it and local
+    misses are looked up there, so every replica can serve a result rendered
+    by any of them.
+
+    Parameters:
+    - cache_dir: Directory holding the generated images and the index
+    - max_bytes: Byte budget for all cached images
+    """
+
+    def __init__(self, cache_dir="generated_images", max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, INDEX_FILENAME)
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+        self._last_flush = time.time()
+
+    def get(self, key):
+        """
+        Look up a cached generation
+
+        Parameters:
+        - key: Cache key from make_cache_key()
+
+        Returns:
+        - Path to the cached image, or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if os.path.exists(entry["path"]):
+                    entry["last_access"] = time.time()
+                    if time.time() - self._last_flush > INDEX_FLUSH_INTERVAL:
+                        self._save_index_locked()
+                    return entry["path"]
+                # The file was removed behind our back
+                del self._entries[key]
+        # Possibly rendered by another replica
+        return self._import_shared(key)
+
+    def put(self, key, path, family=None, quality=None):
+        """
+        Record a newly generated image and evict old entries over budget
+
+        Parameters:
+        - key: Cache key from make_cache_key()
+        - path: Path to the generated image inside the cache directory
+        - family: Optional key shared by renders of the same inputs at
+          different qualities (links a draft to its HD version)
+        - quality: Quality the image was rendered at
+        """
+        self._record(key, path, family, quality)
+        self._publish(key, path, family, quality)
+
+    def variants(self, family):
+        """
+        Cached renders of the same inputs, by quality
+
+        Parameters:
+        - family: Family key passed to put()
+
+        Returns:
+        - Dictionary mapping quality to image path
+        """
+        with self._lock:
+            variants = {
+                entry["quality"]: entry["path"]
+                for entry in self._entries.values()
+                if entry.get("family") == family and os.path.exists(entry["path"])
+            }
+        # Tiers rendered by other replicas
+        shared = shared_cache("families")
+        for quality, key in ((shared.get_json(family) if shared else None) or {}).items():
+            if quality not in variants:
+                path = self.get(key)
+                if path:
+                    variants[quality] = path
+        return variants
+
+    def total_bytes(self):
+        """
+        Total size of all cached images in bytes
+        """
+        with self._lock:
+            return sum(entry["bytes"] for entry in self._entries.values())
+
+    def _record(self, key, path, family, quality):
+        size = os.path.getsize(path)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "path": path,
+                "bytes": size,
+                "created": now,
+                "last_access": now,
+            }
+            if family:
+                self._entries[key]["family"] = family
+                self._entries[key]["quality"] = quality
+            # The new entry is never evicted, even when it alone exceeds the
+            # budget: its path is about to be returned to the caller
+            self._evict_locked(keep=key)
+            self._save_index_locked()
+
+    def _import_shared(self, key):
+        shared = shared_cache("results")
+        value = shared.get(key) if shared else None
+        unpacked = unpack(value) if value else None
+        if unpacked is None or not unpacked[1].get("image"):
+            return None
+        metadata, parts = unpacked
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"generated_{uuid.uuid4().hex[:8]}.png")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(parts["image"])
+        os.replace(tmp_path, path)
+        self._record(key, path, metadata.get("family"), metadata.get("quality"))
+        return path
+
+    def _publish(self, key, path, family, quality):
+        shared = shared_cache("results")
+        if not shared:
+            return
+        with open(path, "rb") as f:
+            shared.set(key, pack({"family": family, "quality": quality}, {"image": f.read()}))
+        families = shared_cache("families")
+        if family and families:
+            # Read-modify-write; a lost update only hides a tier from other replicas
+            tiers = families.get_json(family) or {}
+            tiers[quality] = key
+            families.set_json(family, tiers)
+
+    def _evict_locked(self, keep=None):
+        total = sum(entry["bytes"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        # Oldest access first
+        for key, entry in sorted(self._entries.items(), key=lambda kv: kv[1]["last_access"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(entry["path"])
+            except OSError:
+                pass
+            total -= entry["bytes"]
+            del self._entries[key]
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_index_locked(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
+        self._last_flush = time.time()
+
+
+# Process-wide cache shared by all sessions
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache(cache_dir="generated_images", max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Get the process-wide result cache, creating it on first use
+
+    Parameters:
+    - cache_dir: Directory used when the cache is first created
+    - max_bytes: Byte budget used when the cache is first created
+
+    Returns:
+    - The shared ResultCache instance
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(cache_dir=cache_dir, max_bytes=max_bytes)
+    return _result_cache
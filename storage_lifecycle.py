@@ -0,0 +1,366 @@
+"""
+Storage lifecycle management for uploads/ and generated_images/
+
+Run a one-off report of what would be removed:
+
+    python storage_lifecycle.py --dry-run
+
+References (files a session or a queued job depends on) are only known to
+the process that recorded them, so the sweeper assumes a single process. When
+several app or API workers, batch_tryon.py or ingest_catalog.py share the
+volume, run the sweeper in one process only (storage_sweep_interval 0
+disables it elsewhere); files the other processes wrote recently are kept
+by the grace window, which outlasts any generation.
+"""
+import fnmatch
+import json
+import os
+import threading
+import time
+
+# Default per-directory policies: byte quota, time-to-live and protected files
+DEFAULT_POLICIES = {
+    "uploads/user_images": {
+        "max_bytes": 1024 * 1024 * 1024,
+        "ttl_seconds": 7 * 24 * 3600,
+        # Sample photos offered by "Use Sample Photo" (see download_samples.py
+        # and copy_samples.py)
+        "protected": ["person_*", "sample_*", "priya_*"],
+    },
+    "uploads/user_items": {
+        "max_bytes": 1024 * 1024 * 1024,
+        "ttl_seconds": 7 * 24 * 3600,
+        "protected": [],
+    },
+    "generated_images": {
+        "max_bytes": 2 * 1024 * 1024 * 1024,
+        "ttl_seconds": 14 * 24 * 3600,
+        "protected": [],
+    },
+    # Display renditions are rebuilt on demand from their originals
+    ".cache/renditions": {
+        "max_bytes": 512 * 1024 * 1024,
+        "ttl_seconds": 7 * 24 * 3600,
+        "protected": [],
+    },
+    # Normalized upload payloads are rebuilt from their sources on a miss
+    ".cache/payloads": {
+        "max_bytes": 1024 * 1024 * 1024,
+        "ttl_seconds": 30 * 24 * 3600,
+        "protected": [],
+    },
+    # Partial images are only useful while their generation is running
+    "generated_images/previews": {
+        "max_bytes": 256 * 1024 * 1024,
+        "ttl_seconds": 3600,
+        "protected": [],
+    },
+}
+
+# Files that belong to the app's own bookkeeping and are never swept
+INTERNAL_PATTERNS = [".*"]
+
+# Temporary files from interrupted writes are removed after this many seconds
+STALE_TMP_SECONDS = 3600
+
+# Sessions that have not reported their references for this long are inactive
+DEFAULT_SESSION_TTL = 2 * 3600
+
+# Seconds between background sweeps
+DEFAULT_SWEEP_INTERVAL = 600
+
+# Files modified this recently are never removed, whatever their quota: longer
+# than a job's lifetime (queue wait plus every upstream attempt), so results
+# and uploads of jobs in other processes survive until they are referenced
+DEFAULT_GRACE_SECONDS = 3600
+
+
+def is_sample_image(path, policies=None):
+    """
+    True if a path is part of the protected sample set of its directory
+
+    Parameters:
+    - path: Path to the file
+    - policies: Policies to consult (default: DEFAULT_POLICIES)
+    """
+    directory = os.path.abspath(os.path.dirname(path))
+    filename = os.path.basename(path)
+    for policy_dir, policy in (policies or DEFAULT_POLICIES).items():
+        if os.path.abspath(policy_dir) == directory:
+            return any(fnmatch.fnmatch(filename, pattern) for pattern in policy.get("protected", []))
+    return False
+
+
+class StorageLifecycle:
+    """
+    Enforces quotas and TTLs on upload and result directories
+
+    Files are removed when they outlive their directory's TTL, then least
+    recently accessed first until the directory is within its byte quota.
+    Files referenced by an active session or a queued or running job, files
+    modified within the grace window, and the protected sample set are never
+    removed.
+
+    Parameters:
+    - policies: Mapping of directory -> {max_bytes, ttl_seconds, protected,
+      grace_seconds (optional)}
+    - session_ttl: Seconds after which a silent session's references expire
+    - grace_seconds: Default grace window, in seconds since modification
+    """
+
+    def __init__(self, policies=None, session_ttl=DEFAULT_SESSION_TTL, grace_seconds=DEFAULT_GRACE_SECONDS):
+        self.policies = {os.path.normpath(path): policy for path, policy in (policies or DEFAULT_POLICIES).items()}
+        self.session_ttl = session_ttl
+        self.grace_seconds = grace_seconds
+        self._sessions = {}
+        self._accessed = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self.metrics = {
+            "sweeps_total": 0,
+            "files_removed_total": 0,
+            "bytes_reclaimed_total": 0,
+            "last_sweep": None,
+        }
+
+    def reference(self, session_id, paths):
+        """
+        Record the files a session currently depends on
+
+        Call on every rerun; the set replaces the session's previous one.
+
+        Parameters:
+        - session_id: Stable identifier of the session
+        - paths: Iterable of file paths (None entries are ignored)
+        """
+        # Absolute paths, so relative and absolute references match
+        normalized = {os.path.abspath(path) for path in paths if path}
+        now = time.time()
+        with self._lock:
+            self._sessions[session_id] = (now, normalized)
+            for path in normalized:
+                self._accessed[path] = now
+
+    def release(self, session_id):
+        """
+        Drop the references of a session or job (e.g. when a job finishes)
+
+        Parameters:
+        - session_id: Identifier passed to reference()
+        """
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def record_access(self, path):
+        """
+        Mark a file as recently used (for LRU eviction)
+
+        Parameters:
+        - path: Path to the file
+        """
+        with self._lock:
+            self._accessed[os.path.abspath(path)] = time.time()
+
+    def sweep(self, dry_run=False):
+        """
+        Apply every directory policy once
+
+        Parameters:
+        - dry_run: Report what would be removed without deleting anything
+
+        Returns:
+        - Report dictionary with per-directory details and totals
+        """
+        started = time.time()
+        referenced = self._active_references()
+        report = {"dry_run": dry_run, "started_at": started, "directories": {}}
+        total_files = 0
+        total_bytes = 0
+
+        for directory, policy in self.policies.items():
+            result = self._sweep_directory(directory, policy, referenced, dry_run)
+            report["directories"][directory] = result
+            total_files += len(result["removed"])
+            total_bytes += result["reclaimed_bytes"]
+
+        report["files_removed"] = total_files
+        report["bytes_reclaimed"] = total_bytes
+        report["duration_seconds"] = time.time() - started
+
+        with self._lock:
+            self.metrics["last_sweep"] = {
+                key: report[key] for key in ("dry_run", "started_at", "files_removed", "bytes_reclaimed", "duration_seconds")
+            }
+            if not dry_run:
+                self.metrics["sweeps_total"] += 1
+                self.metrics["files_removed_total"] += total_files
+                self.metrics["bytes_reclaimed_total"] += total_bytes
+        return report
+
+    def stats(self):
+        """
+        Snapshot of the sweeper metrics
+
+        Returns:
+        - Dictionary with sweeps_total, files_removed_total,
+          bytes_reclaimed_total, active_sessions and the last sweep summary
+        """
+        with self._lock:
+            stats = dict(self.metrics)
+            stats["active_sessions"] = len(self._sessions)
+        return stats
+
+    def start(self, interval=DEFAULT_SWEEP_INTERVAL):
+        """
+        Start the background sweeper thread; later calls are no-ops
+
+        Parameters:
+        - interval: Seconds between sweeps (0 or less: don't sweep in this
+          process)
+        """
+        with self._lock:
+            if self._thread is not None or interval <= 0:
+                return
+            self._thread = threading.Thread(target=self._run, args=(interval,), name="storage-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stop the background sweeper
+        """
+        self._stop.set()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Storage sweep failed: {e}")
+
+    def _active_references(self):
+        cutoff = time.time() - self.session_ttl
+        referenced = set()
+        with self._lock:
+            for session_id, (seen_at, paths) in list(self._sessions.items()):
+                if seen_at < cutoff:
+                    del self._sessions[session_id]
+                    continue
+                referenced |= paths
+        return referenced
+
+    def _sweep_directory(self, directory, policy, referenced, dry_run):
+        result = {
+            "files": 0,
+            "bytes": 0,
+            "removed": [],
+            "reclaimed_bytes": 0,
+            "protected": 0,
+            "max_bytes": policy.get("max_bytes"),
+            "ttl_seconds": policy.get("ttl_seconds"),
+        }
+        if not os.path.isdir(directory):
+            return result
+
+        now = time.time()
+        protected_patterns = policy.get("protected", [])
+        grace_seconds = policy.get("grace_seconds", self.grace_seconds)
+        candidates = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                result["files"] += 1
+                result["bytes"] += stat.st_size
+                path = os.path.abspath(entry.path)
+
+                if entry.name.endswith(".tmp"):
+                    # Leftovers of interrupted atomic writes
+                    if now - stat.st_mtime > STALE_TMP_SECONDS:
+                        candidates.append((0, path, stat.st_size, "stale_tmp"))
+                    continue
+                if any(fnmatch.fnmatch(entry.name, pattern) for pattern in INTERNAL_PATTERNS):
+                    continue
+                if path in referenced or any(fnmatch.fnmatch(entry.name, pattern) for pattern in protected_patterns):
+                    result["protected"] += 1
+                    continue
+                if now - stat.st_mtime < grace_seconds:
+                    # Possibly still needed by a job in this or another process
+                    result["protected"] += 1
+                    continue
+
+                with self._lock:
+                    tracked = self._accessed.get(path, 0)
+                last_used = max(tracked, stat.st_atime, stat.st_mtime)
+                candidates.append((last_used, path, stat.st_size, None))
+
+        remaining = result["bytes"]
+        ttl = policy.get("ttl_seconds")
+        max_bytes = policy.get("max_bytes")
+        # Least recently used first
+        for last_used, path, size, reason in sorted(candidates):
+            if reason is None:
+                if ttl and now - last_used > ttl:
+                    reason = "expired"
+                elif max_bytes is not None and remaining > max_bytes:
+                    reason = "over_quota"
+                else:
+                    continue
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                with self._lock:
+                    self._accessed.pop(path, None)
+            remaining -= size
+            result["removed"].append({"path": path, "bytes": size, "reason": reason})
+            result["reclaimed_bytes"] += size
+        return result
+
+
+# Process-wide lifecycle manager
+_lifecycle = None
+_lifecycle_lock = threading.Lock()
+
+
+def get_storage_lifecycle(policies=None):
+    """
+    Get the process-wide lifecycle manager, creating it on first use
+
+    Parameters:
+    - policies: Directory policies used when the manager is first created;
+      entries override DEFAULT_POLICIES per directory
+
+    Returns:
+    - The shared StorageLifecycle instance
+    """
+    global _lifecycle
+    with _lifecycle_lock:
+        if _lifecycle is None:
+            merged = {path: dict(policy) for path, policy in DEFAULT_POLICIES.items()}
+            for path, overrides in (policies or {}).items():
+                merged.setdefault(path, {}).update(overrides)
+            _lifecycle = StorageLifecycle(merged)
+        return _lifecycle
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Apply storage quotas and TTLs")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be removed")
+    parser.add_argument("--config", help="Path to config.json, for storage_policies (default: next to this script)")
+    args = parser.parse_args()
+
+    from tryon import load_config
+
+    # Sweep with the same policies as the app and the API server
+    config = load_config(args.config)
+    report = get_storage_lifecycle(config.get("storage_policies")).sweep(dry_run=args.dry_run)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Shared fixtures: the in-process mock servers the tests run against
+"""
+import os
+import socket
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The modules live at the repository root, next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock_aoai_server import start_mock_server
+from mock_redis_server import start_mock_redis_server
+
+
+@pytest.fixture
+def aoai_server():
+    """
+    Factory starting mock images/edits servers; returns (server, edits_url)
+    """
+    servers = []
+
+    def start(**kwargs):
+        kwargs.setdefault("image_size", (64, 96))
+        server, url = start_mock_server(**kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+class _ScriptedStreamHandler(BaseHTTPRequestHandler):
+    # Answers every POST with the server's scripted event stream
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body, truncate = self.server.body, self.server.truncate
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        if self.server.chunked:
+            # One chunk per event, like the real service
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            offset = 0
+            for event in body.split(b"\n\n")[:-1]:
+                chunk = event + b"\n\n"
+                if truncate is not None and offset + len(chunk) > truncate:
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk[:truncate - offset])
+                    break
+                self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                self.wfile.flush()
+                offset += len(chunk)
+            else:
+                self.wfile.write(b"0\r\n\r\n")
+        else:
+            # Delimited by closing the connection, like an HTTP/1.0 response
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.wfile.write(body[:truncate] if truncate is not None else body)
+        self.wfile.flush()
+        self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stream_server():
+    """
+    Factory starting servers that answer with a fixed server-sent event
+    stream; returns the URL
+
+    Parameters of the factory:
+    - body: Raw event stream bytes
+    - truncate: Close the connection after this many body bytes
+    - chunked: Use chunked transfer encoding (else the connection close ends
+      the body)
+    """
+    servers = []
+
+    def start(body, truncate=None, chunked=True):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _ScriptedStreamHandler)
+        server.daemon_threads = True
+        server.body, server.truncate, server.chunked = body, truncate, chunked
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        host, port = server.server_address[:2]
+        return f"http://{host}:{port}/openai/deployments/mock/images/edits"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def redis_server():
+    """
+    Factory starting mock Redis servers; returns (server, url)
+    """
+    servers = []
+
+    def start(**kwargs):
+        server, url = start_mock_redis_server(**kwargs)
+        servers.append(server)
+        return server, url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def closed_port():
+    """
+    A local port nothing is listening on
+    """
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Empty working directory (the app's paths are relative to it) with fresh
+    process-wide services, queues and caches, and no retry backoff
+    """
+    import catalog_index
+    import catalog_search
+    import catalog_warmup
+    import image_prep
+    import jobs
+    import renditions
+    import result_cache
+    import singleflight
+    import storage_lifecycle
+    import thumbnails
+    import tryon_service
+    import upload_store
+    import upstream
+
+    monkeypatch.chdir(tmp_path)
+    for module, name in (
+        (catalog_index, "_catalog_index"), (catalog_search, "_catalog_search"), (catalog_warmup, "_warmup"),
+        (image_prep, "_payload_cache"), (jobs, "_job_queue"), (renditions, "_rendition_cache"),
+        (result_cache, "_result_cache"), (singleflight, "_single_flight"), (storage_lifecycle, "_lifecycle"),
+        (thumbnails, "_engine"), (tryon_service, "_service"),
+    ):
+        monkeypatch.setattr(module, name, None)
+    monkeypatch.setattr(upload_store, "_stores", {})
+    monkeypatch.setattr(upstream.ImageEditsClient, "_sleep", lambda self, seconds: None)
+    yield tmp_path
+    # Let a warm-up started by the test finish before its directory goes away
+    if catalog_warmup._warmup is not None and catalog_warmup._warmup._thread is not None:
+        catalog_warmup._warmup._thread.join(timeout=30)
@@ -0,0 +1,155 @@
+"""
+HTTP API handlers against the mock image service
+"""
+import asyncio
+import io
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from PIL import Image
+
+import deployment_router
+import tryon_service
+from api_server import create_app
+
+
+@pytest.fixture
+def api_config(workdir, aoai_server):
+    for category, colors in (("clothing", ["red", "green", "blue"]), ("accessories", ["black"])):
+        (workdir / "catalog" / category).mkdir(parents=True)
+        for color in colors:
+            Image.new("RGB", (40, 60), color).save(workdir / "catalog" / category / f"{color}_item.png")
+    server, edits_url = aoai_server()
+    config = {
+        "imagegen_aoai_edits_url": edits_url,
+        "imagegen_aoai_api_key": "mock",
+        "imagegen_aoai_deployment": "mock",
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_partial_images": 0,
+        "tryon_job_workers": 1,
+        "storage_sweep_interval": 0,
+    }
+    return server, config
+
+
+def call_api(config, scenario):
+    # Runs scenario(client) against a started application
+    async def run():
+        async with TestClient(TestServer(create_app(config))) as client:
+            return await scenario(client)
+
+    return asyncio.run(run())
+
+
+def png_bytes(color):
+    buffer = io.BytesIO()
+    Image.new("RGB", (48, 64), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+async def wait_for_job(client, job_id):
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        job = await (await client.get(f"/jobs/{job_id}")).json()
+        if job["status"] in ("done", "failed"):
+            return job
+        await asyncio.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_upload_generate_and_download(api_config):
+    server, config = api_config
+
+    async def scenario(client):
+        # The deployment router exists before the first request
+        assert any(config["imagegen_aoai_edits_url"] in key for key in deployment_router._routers)
+        assert (await client.get("/healthz")).status == 200
+
+        page = await (await client.get("/catalog/clothing?page=1&per_page=2")).json()
+        assert page["pagination"]["total_items"] == 3
+        assert [item["name"] for item in page["items"]] == ["Blue Item", "Green Item"]
+
+        response = await client.post("/uploads/user_image", data=png_bytes("white"))
+        assert response.status == 201
+        user_image = (await response.json())["path"]
+        # The same bytes are stored once
+        again = await client.post("/uploads/user_image", data=png_bytes("white"))
+        assert (await again.json())["path"] == user_image
+
+        response = await client.post("/jobs", json={
+            "user_image": user_image, "items": [page["items"][0]["path"]], "tier": "draft"
+        })
+        assert response.status == 202
+        job_id = (await response.json())["job_id"]
+        assert response.headers["Location"] == f"/jobs/{job_id}"
+
+        job = await wait_for_job(client, job_id)
+        assert job["status"] == "done", job
+        result = await client.get(f"/jobs/{job_id}/result")
+        assert result.status == 200
+        assert (await result.read()).startswith(b"\x89PNG")
+
+        preview = await client.get("/files", params={"path": job["result"], "rendition": "preview"})
+        assert preview.status == 200
+        assert (await client.put("/sessions/s1/references", json={"paths": [job["result"]]})).status == 200
+
+    call_api(config, scenario)
+    assert server.stats["requests"] == 1
+
+
+def test_invalid_requests(api_config):
+    server, config = api_config
+
+    async def scenario(client):
+        assert (await client.get("/catalog/shoes")).status == 400
+        assert (await client.get("/catalog/clothing?page=x")).status == 400
+        assert (await client.get("/jobs/unknown")).status == 404
+        assert (await client.get("/jobs/unknown/result")).status == 404
+        assert (await client.get("/files", params={"path": "../config.json"})).status == 404
+        assert (await client.get("/files", params={"path": "catalog/clothing/red_item.png", "rendition": "huge"})).status == 400
+        assert (await client.post("/uploads/user_image", data=b"")).status == 400
+        assert (await client.post("/uploads/user_image", data=b"not an image")).status == 400
+        assert (await client.post("/uploads/other", data=png_bytes("red"))).status == 404
+        assert (await client.post("/jobs", json={"items": []})).status == 400
+        response = await client.post("/jobs", json={"user_image": "/etc/passwd", "items": ["catalog/clothing/red_item.png"]})
+        assert response.status == 400
+        assert (await client.put("/sessions/s1/references", data=b"{")).status == 400
+        assert (await client.put("/sessions/s1/references", json=["not", "an", "object"])).status == 400
+
+    call_api(config, scenario)
+    assert server.stats["requests"] == 0
+
+
+def test_failed_job_reports_the_upstream_error(api_config):
+    server, config = api_config
+    server.error_rate = 1.0
+    server.error_status = 400
+
+    async def scenario(client):
+        user_image = (await (await client.post("/uploads/user_image", data=png_bytes("white"))).json())["path"]
+        response = await client.post("/jobs", json={
+            "user_image": user_image, "items": ["catalog/accessories/black_item.png"]
+        })
+        job_id = (await response.json())["job_id"]
+        job = await wait_for_job(client, job_id)
+        assert job["status"] == "failed"
+        assert job["error"]
+        assert (await client.get(f"/jobs/{job_id}/result")).status == 409
+
+    call_api(config, scenario)
+
+
+def test_session_references_are_capped_and_expire(api_config, monkeypatch):
+    _, config = api_config
+    service = tryon_service.get_tryon_service(config)
+    monkeypatch.setattr(tryon_service, "MAX_SESSIONS", 2)
+
+    for session_id in ("a", "b", "c"):
+        service.reference(session_id, [f"uploads/user_images/{session_id}.png"])
+    assert sorted(service.lifecycle._sessions) == ["b", "c"]
+
+    # A session silent for longer than the TTL is dropped by the next report
+    service._sessions["b"] -= service.lifecycle.session_ttl + 1
+    service.reference("c", [])
+    assert sorted(service.lifecycle._sessions) == ["c"]
@@ -0,0 +1,173 @@
+"""
+Batch runs against the mock endpoint: resuming and cost accounting
+"""
+import json
+
+import pytest
+from PIL import Image
+
+import image_prep
+import result_cache
+import upstream
+from batch_tryon import (
+    BATCH_DONE, BATCH_FAILED, STATUS_FILENAME, SUMMARY_FILENAME, BatchRunner, load_manifest, load_status, run_batch
+)
+from tryon import estimated_cost
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+    # Generated images and caches are relative to the working directory;
+    # start every test with empty process-wide caches
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(result_cache, "_result_cache", None)
+    monkeypatch.setattr(image_prep, "_payload_cache", None)
+    monkeypatch.setattr(upstream.ImageEditsClient, "_sleep", lambda self, seconds: None)
+    for index, color in enumerate(["red", "green", "blue"]):
+        Image.new("RGB", (48, 64), color).save(tmp_path / f"person_{index}.png")
+    Image.new("RGB", (48, 48), "black").save(tmp_path / "dress.png")
+    return tmp_path
+
+
+@pytest.fixture
+def mock_config(aoai_server):
+    server, edits_url = aoai_server()
+    config = {
+        "imagegen_aoai_edits_url": edits_url,
+        "imagegen_aoai_api_key": "mock",
+        "imagegen_aoai_deployment": "mock",
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_aoai_max_in_flight": 2,
+    }
+    return server, config
+
+
+def write_manifest(path, jobs):
+    with open(path, "w") as f:
+        f.write("# lookbook\n")
+        for job in jobs:
+            f.write(json.dumps(job) + "\n")
+    return str(path)
+
+
+def three_jobs(workspace):
+    return [
+        {"user_image": str(workspace / f"person_{index}.png"), "items": str(workspace / "dress.png")}
+        for index in range(3)
+    ]
+
+
+def run(config, manifest, output, quality="low"):
+    return run_batch(config, manifest, str(output), concurrency=2, quality=quality, report=lambda line: None)
+
+
+def test_load_manifest_validates_jobs(workspace):
+    manifest = write_manifest(workspace / "jobs.jsonl", [
+        {"id": "look 1", "user_image": "a.png", "items": "b.png"},
+        {"user_image": "a.png", "items": ["b.png", "c.png"], "prompt": "beach"},
+    ])
+    jobs = load_manifest(manifest, "low")
+    assert jobs[0]["id"] == "look_1" and jobs[0]["items"] == ["b.png"] and jobs[0]["prompt"] == ""
+    # Generated IDs depend on the quality, so renders don't overwrite each other
+    assert jobs[1]["id"] != load_manifest(manifest, "high")[1]["id"]
+    assert jobs[1]["id"] == load_manifest(manifest, "low")[1]["id"]
+
+    write_manifest(workspace / "bad.jsonl", [{"user_image": "a.png"}])
+    with pytest.raises(ValueError, match="required"):
+        load_manifest(str(workspace / "bad.jsonl"))
+    write_manifest(workspace / "dup.jsonl", [{"id": "x", "user_image": "a.png", "items": "b.png"}] * 2)
+    with pytest.raises(ValueError, match="duplicate"):
+        load_manifest(str(workspace / "dup.jsonl"))
+
+
+def test_run_records_status_and_cost(workspace, mock_config):
+    server, config = mock_config
+    manifest = write_manifest(workspace / "jobs.jsonl", three_jobs(workspace))
+
+    summary = run(config, manifest, workspace / "out")
+    assert summary["done"] == 3 and summary["failed"] == 0 and summary["cached"] == 0
+    assert summary["estimated_cost"] == pytest.approx(3 * estimated_cost("low"))
+    assert server.stats["requests"] == 3
+
+    records = load_status(str(workspace / "out" / STATUS_FILENAME))
+    assert len(records) == 3
+    for record in records.values():
+        assert record["status"] == BATCH_DONE and record["quality"] == "low"
+        assert open(record["output"], "rb").read(4) == b"\x89PNG"
+    with open(workspace / "out" / SUMMARY_FILENAME) as f:
+        assert json.load(f)["quality"] == "low"
+
+
+def test_rerun_resumes_where_it_stopped(workspace, mock_config):
+    server, config = mock_config
+    manifest = write_manifest(workspace / "jobs.jsonl", three_jobs(workspace))
+    run(config, manifest, workspace / "out")
+
+    # A crash mid-write leaves a partial last line, and a lost result is redone
+    status_path = workspace / "out" / STATUS_FILENAME
+    with open(status_path, "a") as f:
+        f.write('{"id": "trunc')
+    records = load_status(str(status_path))
+    lost = sorted(records.values(), key=lambda record: record["id"])[0]
+    (workspace / "out" / f"{lost['id']}.png").unlink()
+
+    summary = run(config, manifest, workspace / "out")
+    assert summary["skipped"] == 2 and summary["pending"] == 1 and summary["done"] == 1
+    # The lost image came back from the result cache without an upstream call
+    assert server.stats["requests"] == 3
+    assert summary["cached"] == 1 and summary["estimated_cost"] == 0
+
+    summary = run(config, manifest, workspace / "out")
+    assert summary["skipped"] == 3 and summary["pending"] == 0
+    assert server.stats["requests"] == 3
+
+
+def test_failed_jobs_are_retried_on_the_next_run(workspace, mock_config):
+    server, config = mock_config
+    manifest = write_manifest(workspace / "jobs.jsonl", three_jobs(workspace))
+    server.error_rate, server.error_status = 1.0, 400
+
+    summary = run(config, manifest, workspace / "out")
+    assert summary["done"] == 0 and summary["failed"] == 3
+    assert summary["estimated_cost"] == 0
+    records = load_status(str(workspace / "out" / STATUS_FILENAME))
+    assert all(record["status"] == BATCH_FAILED and "400" in record["error"] for record in records.values())
+
+    server.error_rate = 0.0
+    summary = run(config, manifest, workspace / "out")
+    assert summary["skipped"] == 0 and summary["done"] == 3
+    assert summary["estimated_cost"] == pytest.approx(3 * estimated_cost("low"))
+
+
+def test_quality_change_renders_again(workspace, mock_config):
+    server, config = mock_config
+    jobs = three_jobs(workspace)
+    jobs[0]["id"] = "look-001"
+    manifest = write_manifest(workspace / "jobs.jsonl", jobs)
+    run(config, manifest, workspace / "out", quality="low")
+
+    summary = run(config, manifest, workspace / "out", quality="high")
+    assert summary["skipped"] == 0 and summary["done"] == 3
+    assert summary["estimated_cost"] == pytest.approx(3 * estimated_cost("high"))
+    assert server.stats["requests"] == 6
+
+    records = load_status(str(workspace / "out" / STATUS_FILENAME))
+    # Explicit IDs are rerendered in place; generated ones get new files
+    assert records["look-001"]["quality"] == "high"
+    assert sorted(record["quality"] for record in records.values()) == ["high"] * 3 + ["low"] * 2
+    assert len(list((workspace / "out").glob("*.png"))) == 5
+
+
+def test_identical_jobs_are_paid_once(workspace, mock_config):
+    server, config = mock_config
+    job = three_jobs(workspace)[0]
+    manifest = write_manifest(workspace / "jobs.jsonl", [dict(job, id=f"copy-{index}") for index in range(4)])
+
+    runner = BatchRunner(config, str(workspace / "out"), concurrency=4, quality="medium", report=lambda line: None)
+    summary = runner.run(load_manifest(manifest, "medium"))
+    assert summary["done"] == 4
+    assert server.stats["requests"] == 1
+    # Cached or coalesced copies cost nothing
+    assert summary["estimated_cost"] == pytest.approx(estimated_cost("medium"))
+    records = load_status(str(workspace / "out" / STATUS_FILENAME))
+    assert sum(record["estimated_cost"] > 0 for record in records.values()) == 1
@@ -0,0 +1,147 @@
+"""
+Catalog index: incremental refreshes and keyset pagination
+"""
+import os
+
+import pytest
+from PIL import Image
+
+from catalog_index import CatalogIndex
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    path = tmp_path / "catalog" / "clothing"
+    path.mkdir(parents=True)
+    for index in range(23):
+        (path / f"item_{index:02d}.png").write_bytes(b"not decoded by a light refresh")
+    return path
+
+
+@pytest.fixture
+def index(tmp_path):
+    return CatalogIndex(db_path=str(tmp_path / "index.sqlite3"))
+
+
+def page_names(index, catalog, page, per_page=6):
+    return [item["name"] for item in index.page(str(catalog), page, per_page)["items"]]
+
+
+def expected_names(catalog, page, per_page=6):
+    names = sorted(os.listdir(catalog))[(page - 1) * per_page:page * per_page]
+    return [os.path.splitext(name)[0].replace("_", " ").title() for name in names]
+
+
+def test_pages_in_any_order_match_the_listing(index, catalog):
+    index.refresh(str(catalog), light=True)
+    data = index.page(str(catalog), 1, 6)
+    assert data["pagination"] == {"current_page": 1, "total_pages": 4, "total_items": 23}
+
+    # Forward, backward, jumps and out-of-range pages
+    for page in (1, 2, 3, 4, 2, 1, 4, 3, 3):
+        assert page_names(index, catalog, page) == expected_names(catalog, page)
+    assert index.page(str(catalog), 9, 6)["pagination"]["current_page"] == 4
+    assert page_names(index, catalog, 0) == expected_names(catalog, 1)
+
+    # A fresh index jumping straight to a late page
+    other = CatalogIndex(db_path=index.db_path)
+    assert page_names(other, catalog, 4) == expected_names(catalog, 4)
+    # Other page sizes keep their own boundaries
+    assert page_names(index, catalog, 2, per_page=10) == expected_names(catalog, 2, per_page=10)
+
+
+def test_pages_follow_added_and_removed_items(index, catalog):
+    index.refresh(str(catalog), light=True)
+    for page in (1, 2, 3, 4):
+        page_names(index, catalog, page)
+
+    (catalog / "a_new_item.png").write_bytes(b"new")
+    (catalog / "item_10.png").unlink()
+    index.refresh(str(catalog), force=True, light=True)
+    for page in (4, 3, 2, 1):
+        assert page_names(index, catalog, page) == expected_names(catalog, page)
+
+
+def test_page_query_seeks_on_the_catalog_index(index):
+    plan = " ".join(row[-1] for row in index._connection().execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM items WHERE catalog = ? AND filename >= ? ORDER BY filename LIMIT ? OFFSET ?",
+        ("catalog/clothing", "item_12.png", 7, 0)
+    ))
+    assert "items_by_catalog (catalog=? AND filename>?)" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+@pytest.fixture
+def photo_catalog(workdir):
+    path = workdir / "catalog" / "clothing"
+    path.mkdir(parents=True)
+    for name, color in (("red_dress.png", "red"), ("blue_shirt.png", "blue")):
+        Image.new("RGB", (60, 90), color).save(path / name)
+    return path
+
+
+def test_refresh_only_reads_what_changed(photo_catalog, workdir, monkeypatch):
+    index = CatalogIndex(db_path=str(workdir / "index.sqlite3"))
+    described = []
+    original = CatalogIndex._describe
+
+    def describe(self, engine, path):
+        described.append(path)
+        return original(self, engine, path)
+
+    monkeypatch.setattr(CatalogIndex, "_describe", describe)
+    changes = []
+    index.add_listener(lambda catalog, changed, removed: changes.append((sorted(changed), removed)))
+
+    assert index.refresh(str(photo_catalog)) == {"added": 2, "updated": 0, "removed": 0}
+    item = index.get(str(photo_catalog / "red_dress.png"))
+    assert (item["name"], item["type"], item["width"], item["height"]) == ("Red Dress", "clothing", 60, 90)
+    assert item["sha256"] and os.path.exists(item["thumbnail_path"])
+
+    # Within the refresh interval nothing is scanned; a forced scan finds nothing new
+    assert index.refresh(str(photo_catalog)) is None
+    assert index.refresh(str(photo_catalog), force=True) == {"added": 0, "updated": 0, "removed": 0}
+    assert len(described) == 2
+
+    Image.new("RGB", (60, 90), "black").save(photo_catalog / "black_coat.png")
+    Image.new("RGB", (30, 30), "navy").save(photo_catalog / "blue_shirt.png")
+    os.remove(photo_catalog / "red_dress.png")
+    described.clear()
+    assert index.refresh(str(photo_catalog), force=True) == {"added": 1, "updated": 1, "removed": 1}
+    assert sorted(os.path.basename(path) for path in described) == ["black_coat.png", "blue_shirt.png"]
+    assert index.get(str(photo_catalog / "blue_shirt.png"))["width"] == 30
+    assert index.get(str(photo_catalog / "red_dress.png")) is None
+    assert index.count(str(photo_catalog)) == 2
+    assert changes[-1] == (
+        [os.path.normpath(str(photo_catalog / name)) for name in ("black_coat.png", "blue_shirt.png")],
+        [os.path.normpath(str(photo_catalog / "red_dress.png"))],
+    )
+    assert len(changes) == 2
+
+
+def test_light_refresh_is_completed_by_the_next_full_one(photo_catalog, workdir):
+    index = CatalogIndex(db_path=str(workdir / "index.sqlite3"))
+    assert index.refresh(str(photo_catalog), light=True)["added"] == 2
+    item = index.get(str(photo_catalog / "red_dress.png"))
+    assert item["name"] == "Red Dress"
+    assert item["sha256"] is None and item["width"] is None
+
+    assert index.refresh(str(photo_catalog), force=True) == {"added": 0, "updated": 2, "removed": 0}
+    assert index.get(str(photo_catalog / "red_dress.png"))["width"] == 60
+    # Described items are similar to each other, not to themselves
+    similar = index.similar(str(photo_catalog / "red_dress.png"))
+    assert [item["name"] for item in similar] == ["Blue Shirt"]
+
+
+def test_new_files_are_found_after_the_refresh_interval(photo_catalog, workdir):
+    index = CatalogIndex(db_path=str(workdir / "index.sqlite3"), refresh_interval=0, full_rescan_interval=3600)
+    index.refresh(str(photo_catalog), light=True)
+    # An unchanged directory is not rescanned
+    assert index.refresh(str(photo_catalog), light=True) is None
+    Image.new("RGB", (10, 10), "white").save(photo_catalog / "white_scarf.png")
+    assert index.refresh(str(photo_catalog), light=True)["added"] == 1
+
+    # The index persists across processes
+    reopened = CatalogIndex(db_path=str(workdir / "index.sqlite3"))
+    assert reopened.count(str(photo_catalog)) == 3
+    assert reopened.refresh(str(photo_catalog), light=True) == {"added": 0, "updated": 0, "removed": 0}
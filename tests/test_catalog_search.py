@@ -0,0 +1,106 @@
+"""
+Catalog search: prefix matching, facet filters and counts, live updates
+"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from catalog_index import CatalogIndex
+from catalog_search import CatalogSearch, tokenize
+
+METADATA = {
+    "black_leather_jacket.png": {"color": "black", "category": "jacket", "brand": "Acme", "tags": ["biker"]},
+    "blue_denim_jacket.png": {"color": "Blue", "category": "jacket", "brand": "Denimco"},
+    "blue_dress.png": {"name": "Summer Dress", "color": "blue", "category": "dress", "brand": "Acme"},
+    "navy_dress.png": {"color": "navy", "category": "dress"},
+}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalogs = {"clothing": tmp_path / "catalog" / "clothing", "accessories": tmp_path / "catalog" / "accessories"}
+    for path in catalogs.values():
+        path.mkdir(parents=True)
+    for filename in list(METADATA) + ["plain_shirt.png"]:
+        (catalogs["clothing"] / filename).write_bytes(b"light refreshes don't decode")
+    (catalogs["clothing"] / "metadata.json").write_text(json.dumps(METADATA))
+    (catalogs["accessories"] / "black_leather_belt.png").write_bytes(b"belt")
+
+    index = CatalogIndex(db_path=str(tmp_path / "index.sqlite3"))
+    for path in catalogs.values():
+        index.refresh(str(path), light=True)
+    return SimpleNamespace(
+        search=CatalogSearch(index).search, index=index, clothing=str(catalogs["clothing"]),
+        everywhere=[str(path) for path in catalogs.values()],
+    )
+
+
+def names(results):
+    return [item["name"] for item in results["items"]]
+
+
+def test_tokenize():
+    assert tokenize("Black_Leather-Jacket 2") == ["black", "leather", "jacket", "2"]
+
+
+def test_query_words_match_as_prefixes(catalog):
+    search, clothing = catalog.search, [catalog.clothing]
+    assert names(search(clothing, "bla jack")) == ["Black Leather Jacket"]
+    # Metadata names, tags and facet values are searchable too
+    assert names(search(clothing, "summer")) == ["Summer Dress"]
+    assert names(search(clothing, "biker")) == ["Black Leather Jacket"]
+    assert names(search(clothing, "acme")) == ["Black Leather Jacket", "Summer Dress"]
+    # Every word must match
+    assert names(search(clothing, "blue jacket")) == ["Blue Denim Jacket"]
+    assert names(search(clothing, "blue xyz")) == []
+    assert search(clothing, "")["pagination"]["total_items"] == 5
+
+    assert names(search(catalog.everywhere, "black leather")) == ["Black Leather Belt", "Black Leather Jacket"]
+
+
+def test_facet_filters_and_counts(catalog):
+    search, clothing = catalog.search, [catalog.clothing]
+    results = search(clothing, "", {"color": ["blue", "navy"]})
+    assert names(results) == ["Blue Denim Jacket", "Summer Dress", "Navy Dress"]
+    # Values of the filtered facet stay visible as alternatives
+    assert results["facets"]["color"] == {"black": 1, "blue": 2, "navy": 1}
+    assert results["facets"]["category"] == {"jacket": 1, "dress": 2}
+    assert results["facets"]["type"] == {"clothing": 3}
+
+    results = search(clothing, "dress", {"color": ["BLUE"], "brand": ["acme"]})
+    assert names(results) == ["Summer Dress"]
+    assert results["facets"]["brand"] == {"acme": 1}
+    assert search(clothing, "", {"category": ["hat"]})["items"] == []
+
+
+def test_pages_follow_catalog_order(catalog):
+    search, clothing = catalog.search, [catalog.clothing]
+    first = search(clothing, "", page=1, items_per_page=2)
+    last = search(clothing, "", page=9, items_per_page=2)
+    assert first["pagination"] == {"current_page": 1, "total_pages": 3, "total_items": 5}
+    assert names(first) == ["Black Leather Jacket", "Blue Denim Jacket"]
+    assert last["pagination"]["current_page"] == 3
+    assert names(last) == ["Plain Shirt"]
+
+
+def test_catalog_changes_and_metadata_edits_are_picked_up(catalog):
+    search, clothing = catalog.search, catalog.clothing
+    assert names(search([clothing], "shirt")) == ["Plain Shirt"]
+
+    os.remove(os.path.join(clothing, "plain_shirt.png"))
+    with open(os.path.join(clothing, "red_shirt.png"), "wb") as f:
+        f.write(b"new")
+    # The refresh notifies the search index of just these two items
+    catalog.index.refresh(clothing, force=True, light=True)
+    assert names(search([clothing], "shirt")) == ["Red Shirt"]
+
+    metadata = dict(METADATA, **{"red_shirt.png": {"color": "red", "tags": ["linen"]}})
+    metadata_path = os.path.join(clothing, "metadata.json")
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f)
+    stat = os.stat(metadata_path)
+    os.utime(metadata_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+    assert names(search([clothing], "linen")) == ["Red Shirt"]
+    assert search([clothing], "", {"color": ["red"]})["pagination"]["total_items"] == 1
@@ -0,0 +1,98 @@
+"""
+Catalog warm-up: first page first, then the whole catalog, once per process
+"""
+import threading
+
+import pytest
+from PIL import Image
+
+import catalog_warmup
+from catalog_index import get_catalog_index
+from catalog_warmup import (WARMUP_FAILED, WARMUP_PENDING, WARMUP_READY, WARMUP_RUNNING, CatalogWarmup,
+                            start_catalog_warmup, warmup_in_progress)
+from thumbnails import get_thumbnail_engine
+
+
+@pytest.fixture
+def catalogs(workdir):
+    paths = []
+    for category, count in (("clothing", 8), ("accessories", 2)):
+        path = workdir / "catalog" / category
+        path.mkdir(parents=True)
+        for index in range(count):
+            Image.new("RGB", (40, 40), (index * 20, 0, 0)).save(path / f"{category}_{index}.png")
+        paths.append(str(path.relative_to(workdir)))
+    return paths
+
+
+class BlockingEngine:
+    # Thumbnails the first page normally; holds the full build until released
+    def __init__(self, fail=False):
+        self.engine = get_thumbnail_engine()
+        self.release = threading.Event()
+        self.fail = fail
+
+    def ensure(self, path):
+        return self.engine.ensure(path)
+
+    def build_catalog(self, catalog_path, progress=None):
+        self.release.wait(10)
+        if self.fail:
+            raise OSError("disk full")
+        return self.engine.build_catalog(catalog_path, parallel=False, progress=progress)
+
+
+def test_first_page_is_ready_before_the_catalog(catalogs, monkeypatch):
+    engine = BlockingEngine()
+    monkeypatch.setattr(catalog_warmup, "get_thumbnail_engine", lambda: engine)
+    warmup = CatalogWarmup(catalogs, items_per_page=6)
+    assert warmup.status()["state"] == WARMUP_PENDING
+
+    warmup.start()
+    assert warmup.first_page_ready.wait(10)
+    status = warmup.status()
+    assert status["state"] == WARMUP_RUNNING
+    assert status["first_page_ready"]
+    # The first page is indexed (names only) and thumbnailed
+    page = get_catalog_index().page(catalogs[0], 1, 6)
+    assert page["pagination"]["total_items"] == 8
+    assert all(get_thumbnail_engine().manifest_entry(item["path"]) for item in page["items"])
+
+    engine.release.set()
+    warmup._thread.join(10)
+    status = warmup.status()
+    assert (status["state"], status["progress"], status["done"], status["total"]) == (WARMUP_READY, 1.0, 10, 10)
+    assert warmup.is_ready()
+    assert {f"index:{path}" for path in catalogs} <= set(status["timings"])
+    # The full refresh described every item
+    assert all(item["sha256"] for item in get_catalog_index().items(catalogs[0]))
+
+
+def test_failure_is_reported_and_releases_the_first_page(catalogs, monkeypatch):
+    engine = BlockingEngine(fail=True)
+    engine.release.set()
+    monkeypatch.setattr(catalog_warmup, "get_thumbnail_engine", lambda: engine)
+    warmup = CatalogWarmup(catalogs)
+    warmup.start()
+    warmup._thread.join(10)
+    status = warmup.status()
+    assert (status["state"], status["error"]) == (WARMUP_FAILED, "disk full")
+    assert warmup.first_page_ready.is_set()
+    assert not warmup.is_ready()
+
+
+def test_warmup_runs_once_per_process(catalogs, monkeypatch):
+    engine = BlockingEngine()
+    monkeypatch.setattr(catalog_warmup, "get_thumbnail_engine", lambda: engine)
+    assert not warmup_in_progress()
+    warmup = start_catalog_warmup(catalogs)
+    assert warmup_in_progress()
+    # Reruns of the app script get the same warm-up; starting again is a no-op
+    thread = warmup._thread
+    assert start_catalog_warmup(catalogs) is warmup
+    assert warmup._thread is thread
+
+    engine.release.set()
+    thread.join(10)
+    assert not warmup_in_progress()
+    assert warmup.state == WARMUP_READY
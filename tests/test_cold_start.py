@@ -0,0 +1,44 @@
+"""
+Cold starts: heavy dependencies stay unloaded until they are needed
+"""
+import json
+import os
+import subprocess
+import sys
+
+import tryon
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Needed by generations, uploads or "Similar", not to render the catalog
+HEAVY_MODULES = ("PIL", "numpy", "requests", "multiprocessing", "similarity", "deployment_router", "upstream")
+
+
+def loaded_after(statement):
+    # Modules from HEAVY_MODULES loaded by a fresh interpreter running statement
+    script = (
+        f"import json, sys\n{statement}\n"
+        f"print(json.dumps([name for name in {HEAVY_MODULES!r} if name in sys.modules]))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_service_modules_import_without_heavy_dependencies():
+    assert loaded_after("import tryon_service, catalog_index, catalog_search, storage_lifecycle") == []
+
+
+def test_api_server_defers_image_libraries():
+    # aiohttp is the server itself; images and the upstream client wait
+    assert loaded_after("import api_server") == []
+
+
+def test_config_is_parsed_once_per_process(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({"tryon_job_workers": 2}))
+    config = tryon.get_config(str(path))
+    path.write_text(json.dumps({"tryon_job_workers": 8}))
+    assert tryon.get_config(str(path)) is config
+    assert config["tryon_job_workers"] == 2
@@ -0,0 +1,156 @@
+"""
+Failover and circuit breaking across a pool of deployments
+"""
+import time
+
+import pytest
+
+import upstream
+from deployment_router import CIRCUIT_CLOSED, CIRCUIT_HALF_OPEN, CIRCUIT_OPEN, get_deployment_router
+from upstream import UpstreamError, UpstreamTimeout
+
+FILES = [("image[]", ("user.png", b"\x89PNG fake", "image/png"))]
+DATA = {"prompt": "try this on", "n": 1, "quality": "low"}
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    # The client's retries before failing over would otherwise sleep
+    monkeypatch.setattr(upstream.ImageEditsClient, "_sleep", lambda self, seconds: None)
+
+
+def make_router(*deployments, **config):
+    """
+    Router over mock deployments given as (name, edits_url, weight) tuples
+
+    A weight of 0 makes a deployment a pure fallback: it is only chosen
+    once every other one has been tried or is out of rotation.
+    """
+    config = dict({
+        "imagegen_aoai_api_key": "mock",
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_deployments": [
+            {"name": name, "edits_url": url, "deployment": name, "weight": weight}
+            for name, url, weight in deployments
+        ],
+    }, **config)
+    router = get_deployment_router(config)
+    return router, {backend.name: backend for backend in router.backends}
+
+
+def edit(router):
+    return router.call(lambda client, throttle: client.edit(FILES, DATA, before_attempt=throttle))
+
+
+def test_failover_then_circuit_opens(aoai_server):
+    down, down_url = aoai_server(error_rate=1.0, error_status=503)
+    up, up_url = aoai_server()
+    router, backends = make_router(("down", down_url, 1), ("up", up_url, 0))
+
+    for _ in range(3):
+        assert edit(router)["data"][0]["b64_json"]
+    # Each call retried once on the failing deployment before failing over
+    assert down.stats["requests"] == 6
+    assert up.stats["requests"] == 3
+    assert backends["down"].state == CIRCUIT_OPEN
+    assert backends["up"].state == CIRCUIT_CLOSED
+
+    # Out of rotation: requests no longer touch the failing deployment
+    for _ in range(5):
+        edit(router)
+    assert down.stats["requests"] == 6
+    assert up.stats["requests"] == 8
+    status = {backend["name"]: backend for backend in router.stats()["backends"]}
+    assert status["down"]["state"] == CIRCUIT_OPEN and status["down"]["open_for"] > 0
+    assert status["up"]["error_rate"] == 0
+
+
+def test_throttled_deployment_opens_for_retry_after(aoai_server):
+    throttled, throttled_url = aoai_server(error_rate=1.0, error_status=429, retry_after=5)
+    up, up_url = aoai_server()
+    router, backends = make_router(("throttled", throttled_url, 1), ("up", up_url, 0))
+
+    edit(router)
+    # Quota exhaustion opens the circuit at once, for as long as asked
+    assert backends["throttled"].state == CIRCUIT_OPEN
+    assert 4.5 <= backends["throttled"].reopens_at() - time.time() <= 5.0
+    edit(router)
+    assert throttled.stats["requests"] == 2
+    assert up.stats["requests"] == 2
+
+
+def test_rejected_request_does_not_fail_over(aoai_server):
+    bad, bad_url = aoai_server(error_rate=1.0, error_status=400)
+    other, other_url = aoai_server()
+    router, backends = make_router(("bad", bad_url, 1), ("other", other_url, 0))
+
+    with pytest.raises(UpstreamError) as excinfo:
+        edit(router)
+    assert excinfo.value.status_code == 400
+    assert bad.stats["requests"] == 1
+    assert other.stats["requests"] == 0
+    assert backends["bad"].state == CIRCUIT_CLOSED
+
+
+def test_timeout_does_not_fail_over(aoai_server):
+    slow, slow_url = aoai_server(latency=1.0)
+    other, other_url = aoai_server()
+    router, backends = make_router(("slow", slow_url, 1), ("other", other_url, 0), imagegen_aoai_read_timeout=0.2)
+
+    # The generation may still be running on the first deployment
+    with pytest.raises(UpstreamTimeout):
+        edit(router)
+    assert other.stats["requests"] == 0
+    assert backends["slow"].error_rate > 0
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=500)
+    router, backends = make_router(
+        ("only", url, 1), imagegen_circuit_failure_threshold=1, imagegen_circuit_open_seconds=0.2
+    )
+    backend = backends["only"]
+
+    with pytest.raises(UpstreamError):
+        edit(router)
+    assert backend.state == CIRCUIT_OPEN
+
+    # A failed probe keeps it out of rotation for twice as long
+    time.sleep(0.25)
+    assert backend.available(time.time())
+    assert backend.state == CIRCUIT_HALF_OPEN
+    with pytest.raises(UpstreamError):
+        edit(router)
+    assert backend.state == CIRCUIT_OPEN
+    assert 0.3 <= backend.reopens_at() - time.time() <= 0.4
+
+    # Only one probe at a time while half open
+    time.sleep(0.45)
+    assert backend.available(time.time())
+    backend.begin()
+    assert not backend.available(time.time())
+    backend.release()
+
+    server.error_rate = 0.0
+    assert edit(router)["data"][0]["b64_json"]
+    assert backend.state == CIRCUIT_CLOSED
+    assert backend._open_seconds == backend.base_open_seconds
+
+
+def test_open_circuits_still_get_a_call(aoai_server):
+    first, first_url = aoai_server(error_rate=1.0, error_status=503)
+    second, second_url = aoai_server(error_rate=1.0, error_status=503)
+    router, backends = make_router(
+        ("first", first_url, 1), ("second", second_url, 1), imagegen_circuit_failure_threshold=1
+    )
+
+    with pytest.raises(UpstreamError) as excinfo:
+        edit(router)
+    assert excinfo.value.status_code == 503
+    assert all(backend.state == CIRCUIT_OPEN for backend in backends.values())
+
+    # Rather than failing without a call, the pool tries the deployments again
+    requests_before = first.stats["requests"] + second.stats["requests"]
+    with pytest.raises(UpstreamError):
+        edit(router)
+    assert first.stats["requests"] + second.stats["requests"] > requests_before
@@ -0,0 +1,131 @@
+"""
+Upload normalization and the payload cache
+"""
+import io
+import os
+import time
+
+import pytest
+from PIL import Image, ImageCms
+
+import image_prep
+from image_prep import PayloadCache, normalize_image, normalize_image_file, prepare_upload_part
+from storage_lifecycle import StorageLifecycle
+
+
+def decode(data):
+    return Image.open(io.BytesIO(data))
+
+
+def test_orientation_is_applied_and_metadata_dropped():
+    img = Image.new("RGB", (40, 20), "red")
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotated 90 degrees
+    exif[0x010F] = "Phone maker"
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", exif=exif.tobytes())
+
+    data, content_type, extension = normalize_image(Image.open(io.BytesIO(buffer.getvalue())))
+    assert (content_type, extension) == ("image/jpeg", ".jpg")
+    normalized = decode(data)
+    assert normalized.size == (20, 40)
+    assert "exif" not in normalized.info
+    assert not normalized.getexif()
+
+
+def test_large_images_are_downscaled_and_keep_their_profile():
+    profile = ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes()
+    img = Image.new("RGB", (3000, 1500), "blue")
+    img.info["icc_profile"] = profile
+
+    data, _, _ = normalize_image(img, max_side=600)
+    normalized = decode(data)
+    assert normalized.size == (600, 300)
+    assert normalized.info["icc_profile"] == profile
+
+
+def test_transparency_decides_the_format():
+    cut_out = Image.new("RGBA", (30, 30), (0, 0, 0, 0))
+    data, content_type, _ = normalize_image(cut_out)
+    assert content_type == "image/png"
+    assert decode(data).mode == "RGBA"
+
+    opaque = Image.new("RGBA", (30, 30), (10, 20, 30, 255))
+    assert normalize_image(opaque)[1] == "image/jpeg"
+
+
+def test_clean_files_pass_through_unchanged(tmp_path):
+    clean = tmp_path / "clean.png"
+    Image.new("RGB", (30, 30), "green").save(clean)
+    assert normalize_image_file(str(clean)) == (clean.read_bytes(), "image/png", ".png")
+
+    # Text chunks may carry personal data, so those files are re-encoded
+    from PIL.PngImagePlugin import PngInfo
+    tagged = tmp_path / "tagged.png"
+    info = PngInfo()
+    info.add_text("Author", "someone")
+    Image.new("RGB", (30, 30), "green").save(tagged, pnginfo=info)
+    data, _, _ = normalize_image_file(str(tagged))
+    assert data != tagged.read_bytes()
+    assert "Author" not in decode(data).info
+
+
+@pytest.fixture
+def photos(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = []
+    for index, color in enumerate(["red", "green", "blue"]):
+        path = tmp_path / f"photo_{index}.png"
+        Image.new("RGB", (2000, 1000), color).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_payloads_are_normalized_once(photos, monkeypatch):
+    cache = PayloadCache(cache_dir="payloads", max_side=500)
+    field, (filename, data, content_type) = prepare_upload_part(photos[0], cache)
+    assert (field, filename, content_type) == ("image[]", "photo_0.jpg", "image/jpeg")
+    assert decode(data).size == (500, 250)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("normalized twice")
+
+    monkeypatch.setattr(image_prep, "normalize_image_file", fail)
+    # From memory, then from disk after a restart
+    assert cache.get(photos[0])[0] == data
+    assert PayloadCache(cache_dir="payloads", max_side=500).get(photos[0])[0] == data
+    # Another size is another payload
+    with pytest.raises(AssertionError, match="normalized twice"):
+        PayloadCache(cache_dir="payloads", max_side=400).get(photos[0])
+
+
+def test_memory_budget_keeps_the_most_recent_payloads(photos):
+    sizes = [len(PayloadCache(cache_dir=None, max_side=500).get(path)[0]) for path in photos]
+    # Room for all but one payload
+    cache = PayloadCache(cache_dir=None, memory_budget=sum(sizes) - 1, max_side=500)
+    cache.get(photos[0])
+    cache.get(photos[1])
+    cache.get(photos[0])
+    cache.get(photos[2])
+    keys = [key.split("_")[0] for key in cache._memory]
+    assert keys == [image_prep.file_sha256(photos[0]), image_prep.file_sha256(photos[2])]
+    assert cache._memory_bytes == sizes[0] + sizes[2]
+
+
+def test_sweeper_keeps_recently_read_payloads_within_quota(photos):
+    cache_dir = os.path.join(".cache", "payloads")
+    cache = PayloadCache(cache_dir=cache_dir, max_side=500)
+    for path in photos[:2]:
+        cache.get(path)
+    files = sorted(os.listdir(cache_dir))
+    old = time.time() - 2 * 24 * 3600
+    for name in files:
+        os.utime(os.path.join(cache_dir, name), (old, old))
+
+    # A hit from disk marks the payload as used
+    PayloadCache(cache_dir=cache_dir, max_side=500).get(photos[0])
+    kept = next(name for name in files if name.startswith(image_prep.file_sha256(photos[0])))
+    quota = os.path.getsize(os.path.join(cache_dir, kept))
+    report = StorageLifecycle({cache_dir: {"max_bytes": quota, "ttl_seconds": None}}).sweep()
+    assert len(report["directories"][cache_dir]["removed"]) == 1
+    assert os.listdir(cache_dir) == [kept]
@@ -0,0 +1,140 @@
+"""
+Catalog ingestion: resuming from the checkpoint, deduplication and failed items
+"""
+import json
+import os
+import sys
+
+import pytest
+from PIL import Image
+
+import ingest_catalog
+from ingest_catalog import default_checkpoint_path, ingest, iter_directory, iter_manifest
+
+OPTIONS = {"fetch_concurrency": 2, "workers": 1, "update_index": False, "report": lambda line: None}
+
+
+def make_image(path, color, size=(120, 160)):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+@pytest.fixture
+def drop(workdir):
+    # A source directory and a manifest listing its images
+    source = workdir / "drop"
+    source.mkdir()
+    for name, color in (("red_dress", "red"), ("blue_shirt", "blue"), ("green_hat", "green")):
+        make_image(source / f"{name}.png", color)
+    manifest = workdir / "spring.jsonl"
+    manifest.write_text("\n".join([
+        "# spring drop",
+        json.dumps({"path": "drop/red_dress.png", "category": "clothing"}),
+        json.dumps({"path": "drop/blue_shirt.png", "category": "clothing", "name": "navy shirt"}),
+        "drop/green_hat.png",
+    ]) + "\n")
+    return manifest
+
+
+def checkpoint_records(path):
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                pass
+    return records
+
+
+def cli_summary(capsys):
+    # The summary JSON follows the progress lines
+    out = capsys.readouterr().out
+    return json.loads(out[out.index("{"):])
+
+
+def test_rerun_skips_ingested_items(drop):
+    checkpoint = default_checkpoint_path(str(drop))
+    assert checkpoint == os.path.join(".cache", "ingest", "spring.jsonl.jsonl")
+    first = ingest(iter_manifest(str(drop), "accessories"), checkpoint_path=checkpoint, **OPTIONS)
+    assert (first["total"], first["added"], first["skipped"]) == (3, 3, 0)
+    assert sorted(os.listdir("catalog/clothing")) == ["navy_shirt.png", "red_dress.png", "thumbnails"]
+    assert sorted(os.listdir("catalog/accessories")) == ["green_hat.png", "thumbnails"]
+
+    second = ingest(iter_manifest(str(drop), "accessories"), checkpoint_path=checkpoint, **OPTIONS)
+    assert (second["total"], second["skipped"], second["added"]) == (3, 3, 0)
+    assert len(checkpoint_records(checkpoint)) == 3
+
+
+def test_interrupted_run_resumes(drop):
+    checkpoint = default_checkpoint_path(str(drop))
+    ingest(iter_manifest(str(drop), "accessories"), checkpoint_path=checkpoint, **OPTIONS)
+    # Keep one finished item and a partial line, as a crash mid-write would
+    with open(checkpoint) as f:
+        lines = f.readlines()
+    with open(checkpoint, "w") as f:
+        f.write(lines[0] + lines[1][:20])
+    # Unrecorded items are fetched again: one whose file survived is found
+    # by its content, one whose file is gone is written again
+    lost = json.loads(lines[2])["path"]
+    os.remove(lost)
+
+    resumed = ingest(iter_manifest(str(drop), "accessories"), checkpoint_path=checkpoint, **OPTIONS)
+    assert (resumed["skipped"], resumed["duplicate"], resumed["added"]) == (1, 1, 1)
+    assert os.path.exists(lost)
+    assert len(checkpoint_records(checkpoint)) == 3
+
+
+def test_duplicate_content_is_skipped(workdir):
+    source = workdir / "bags"
+    source.mkdir()
+    make_image(source / "tote.png", "brown")
+    make_image(source / "tote_copy.png", "brown")
+    make_image(source / "clutch.png", "black")
+    summary = ingest(iter_directory(str(source), "accessories"), **OPTIONS)
+    assert (summary["added"], summary["duplicate"]) == (2, 1)
+    assert len([name for name in os.listdir("catalog/accessories") if name.endswith(".png")]) == 2
+
+    # Content already in the category is a duplicate on later runs too,
+    # whatever the source is called
+    later = workdir / "more_bags"
+    later.mkdir()
+    make_image(later / "new_name.png", "black")
+    summary = ingest(iter_directory(str(later), "accessories"), **OPTIONS)
+    assert (summary["added"], summary["duplicate"]) == (0, 1)
+    assert not os.path.exists("catalog/accessories/new_name.png")
+
+
+def test_failed_items_are_retried(workdir):
+    source = workdir / "drop"
+    source.mkdir()
+    (source / "broken.png").write_bytes(b"not an image")
+    make_image(source / "tiny.png", "red", size=(10, 10))
+    checkpoint = str(workdir / "checkpoint.jsonl")
+    summary = ingest(iter_directory(str(source), "clothing"), checkpoint_path=checkpoint, **OPTIONS)
+    assert (summary["failed"], summary["added"]) == (2, 0)
+    assert all(record["status"] == "failed" and record["error"] for record in checkpoint_records(checkpoint))
+
+    # Fixed sources are picked up by a rerun with the same checkpoint
+    make_image(source / "broken.png", "blue")
+    make_image(source / "tiny.png", "red")
+    summary = ingest(iter_directory(str(source), "clothing"), checkpoint_path=checkpoint, **OPTIONS)
+    assert (summary["skipped"], summary["added"], summary["failed"]) == (0, 2, 0)
+
+
+def test_command_line_resumes_from_the_default_checkpoint(drop, monkeypatch, capsys):
+    argv = ["ingest_catalog.py", "--from-dir", "drop", "--category", "clothing", "--workers", "1", "--no-index"]
+    monkeypatch.setattr(sys, "argv", argv)
+    ingest_catalog.main()
+    assert os.path.exists(os.path.join(".cache", "ingest", "drop.jsonl"))
+    capsys.readouterr()
+
+    ingest_catalog.main()
+    summary = cli_summary(capsys)
+    assert (summary["total"], summary["skipped"]) == (3, 3)
+
+    # --no-resume starts over; the images are already there as duplicates
+    monkeypatch.setattr(sys, "argv", argv + ["--no-resume"])
+    ingest_catalog.main()
+    summary = cli_summary(capsys)
+    assert (summary["skipped"], summary["duplicate"]) == (0, 3)
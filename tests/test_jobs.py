@@ -0,0 +1,99 @@
+"""
+Job queue: bounded concurrency, queue positions and failure propagation
+"""
+import threading
+import time
+
+import pytest
+
+from jobs import JOB_DONE, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, TryOnJobQueue, current_job_id, set_current_job_preview
+
+
+@pytest.fixture
+def queue():
+    queue = TryOnJobQueue(max_workers=2)
+    yield queue
+    queue.shutdown(wait=False)
+
+
+def wait_for(queue, job_id, statuses=(JOB_DONE, JOB_FAILED), timeout=10):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = queue.get(job_id)
+        if job["status"] in statuses:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"Job {job_id} is still {queue.get(job_id)['status']}")
+
+
+def test_runs_at_most_max_workers_at_once(queue):
+    release = threading.Event()
+    lock = threading.Lock()
+    running = []
+    peak = []
+
+    def work(index):
+        with lock:
+            running.append(index)
+            peak.append(len(running))
+        release.wait(10)
+        with lock:
+            running.remove(index)
+        return index * 10
+
+    job_ids = [queue.submit(work, index) for index in range(5)]
+    wait_for(queue, job_ids[1], statuses=(JOB_RUNNING,))
+    # Queued jobs report their place in line
+    assert [queue.get(job_id)["queue_position"] for job_id in job_ids] == [None, None, 1, 2, 3]
+    assert queue.stats() == {JOB_QUEUED: 3, JOB_RUNNING: 2, JOB_DONE: 0, JOB_FAILED: 0}
+
+    release.set()
+    results = [wait_for(queue, job_id)["result"] for job_id in job_ids]
+    assert results == [0, 10, 20, 30, 40]
+    assert max(peak) == 2
+
+
+def test_failures_are_reported_on_the_job(queue):
+    def fail():
+        raise RuntimeError("Image service rejected the request")
+
+    failed = wait_for(queue, queue.submit(fail))
+    assert failed["status"] == JOB_FAILED
+    assert failed["error"] == "Image service rejected the request"
+    assert failed["result"] is None
+    # The worker survives and runs the next job
+    assert wait_for(queue, queue.submit(lambda: "ok"))["result"] == "ok"
+    assert queue.stats()[JOB_FAILED] == 1
+
+
+def test_jobs_see_their_id_and_publish_previews(queue):
+    published = threading.Event()
+    release = threading.Event()
+
+    def work():
+        set_current_job_preview(f"preview-of-{current_job_id()}")
+        published.set()
+        release.wait(10)
+        return current_job_id()
+
+    job_id = queue.submit(work)
+    assert published.wait(10)
+    assert queue.get(job_id)["preview"] == f"preview-of-{job_id}"
+    release.set()
+    done = wait_for(queue, job_id)
+    assert done["result"] == job_id
+    assert done["preview"] is None
+    # Outside a worker there is no current job and nothing to publish
+    assert current_job_id() is None
+    set_current_job_preview("ignored")
+
+
+def test_finished_jobs_expire_after_retention():
+    queue = TryOnJobQueue(max_workers=1, retention_seconds=0.05)
+    first = queue.submit(lambda: 1)
+    wait_for(queue, first)
+    time.sleep(0.1)
+    second = queue.submit(lambda: 2)
+    assert queue.get(first) is None
+    assert wait_for(queue, second)["result"] == 2
+    queue.shutdown()
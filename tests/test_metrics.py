@@ -0,0 +1,96 @@
+"""
+Metrics: counters, histograms, spans and the Prometheus text format
+"""
+import re
+
+import pytest
+
+import metrics
+import upstream
+from metrics import Counter, Histogram
+
+# name{labels} value
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_]+="([^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$')
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", True)
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "_enabled", False)
+    counter = Counter("test_disabled_total", "Disabled")
+    counter.inc()
+    histogram = Histogram("test_disabled_seconds", "Disabled")
+    histogram.observe(1.0)
+    assert counter.value() == 0
+    assert histogram.snapshot() == (0, 0.0)
+    assert metrics.span("stage") is metrics.span("other stage")
+
+
+def test_counter_exposition(enabled):
+    counter = Counter("test_requests_total", "Requests by outcome", ("result", "path"))
+    counter.inc(result="ok", path="/a")
+    counter.inc(2, result="ok", path="/a")
+    counter.inc(result="error", path='say "hi"\n')
+    assert counter.value(result="ok", path="/a") == 3
+    assert counter.render() == [
+        "# HELP test_requests_total Requests by outcome",
+        "# TYPE test_requests_total counter",
+        'test_requests_total{result="error",path="say \\"hi\\"\\n"} 1',
+        'test_requests_total{result="ok",path="/a"} 3',
+    ]
+
+
+def test_histogram_buckets_are_cumulative(enabled):
+    histogram = Histogram("test_latency_seconds", "Latency", ("stage",), buckets=(0.1, 1))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, stage="upload")
+    assert histogram.snapshot(stage="upload") == (4, pytest.approx(3.65))
+    lines = histogram.render()
+    assert lines[2:5] == [
+        'test_latency_seconds_bucket{stage="upload",le="0.1"} 2',
+        'test_latency_seconds_bucket{stage="upload",le="1.0"} 3',
+        'test_latency_seconds_bucket{stage="upload",le="+Inf"} 4',
+    ]
+    assert lines[5].startswith('test_latency_seconds_sum{stage="upload"} 3.65')
+    assert lines[6] == 'test_latency_seconds_count{stage="upload"} 4'
+
+
+def test_spans_time_stages_and_count_errors(enabled):
+    stage = "test.span_stage"
+    before = metrics._stage_seconds.snapshot(stage=stage)[0]
+    with metrics.span(stage):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.span(stage):
+            raise RuntimeError("failed")
+    metrics.observe_stage(stage, 2.5)
+    count, total = metrics._stage_seconds.snapshot(stage=stage)
+    assert count == before + 3
+    assert total >= 2.5
+    assert metrics._stage_errors.value(stage=stage) >= 1
+
+
+def test_registry_exposition_is_well_formed(enabled, tmp_path):
+    counter = metrics.counter("test_registered_total", "Registered", ("kind",))
+    assert metrics.counter("test_registered_total", "Registered", ("kind",)) is counter
+    counter.inc(kind="a")
+    metrics.observe_stage("test.registry", 0.2)
+
+    text = metrics.render_prometheus()
+    assert text.endswith("\n")
+    names = set()
+    for line in text.splitlines():
+        if line.startswith("# TYPE"):
+            names.add(line.split()[2])
+        elif not line.startswith("# HELP"):
+            assert SAMPLE_LINE.match(line), line
+    # Module-level metrics are registered on import
+    assert {"test_registered_total", metrics.STAGE_HISTOGRAM, upstream._retries_total.name} <= names
+    assert 'test_registered_total{kind="a"} 1' in text.splitlines()
+
+    path = tmp_path / "metrics" / "tryon.prom"
+    metrics.write_metrics_file(str(path))
+    assert path.read_text().startswith("# HELP")
@@ -0,0 +1,101 @@
+"""
+Upstream traffic shaping: token bucket reservations and the FIFO governor
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limit
+from rate_limit import TokenBucket, UpstreamGovernor, get_upstream_governor
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(rate_limit, "time", SimpleNamespace(monotonic=lambda: clock.now, sleep=time.sleep))
+    return clock
+
+
+def test_token_bucket_reserves_in_arrival_order(clock):
+    bucket = TokenBucket(rate_per_minute=60, burst=2)
+    # The burst goes out at once; later callers wait one interval each
+    assert [bucket.reserve() for _ in range(4)] == [0.0, 0.0, 1.0, 2.0]
+
+    # Tokens refill at the sustained rate, up to the burst
+    clock.now += 10
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 1.0]
+    clock.now += 0.5
+    assert bucket.reserve() == pytest.approx(1.5)
+
+
+def start_waiter(governor, ticket, admitted, release):
+    def run():
+        with governor.slot(ticket):
+            admitted.append(ticket)
+            release.wait(10)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def wait_until(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            raise AssertionError("Condition not reached")
+        time.sleep(0.005)
+
+
+def test_governor_admits_waiters_in_arrival_order():
+    governor = UpstreamGovernor(requests_per_minute=0, max_in_flight=1)
+    admitted = []
+    releases = {ticket: threading.Event() for ticket in "abcde"}
+    threads = []
+    for ticket in "abcde":
+        threads.append(start_waiter(governor, ticket, admitted, releases[ticket]))
+        # Make the arrival order deterministic
+        wait_until(lambda: ticket in admitted or governor.position(ticket) is not None)
+
+    assert admitted == ["a"]
+    assert [governor.position(ticket) for ticket in "abcde"] == [None, 1, 2, 3, 4]
+    assert governor.stats() == {"in_flight": 1, "waiting": 4}
+
+    for ticket in "abcde":
+        releases[ticket].set()
+        wait_until(lambda: len(admitted) == min(5, "abcde".index(ticket) + 2))
+    for thread in threads:
+        thread.join(10)
+    assert admitted == list("abcde")
+    assert governor.stats() == {"in_flight": 0, "waiting": 0}
+
+
+def test_governor_limits_requests_in_flight():
+    governor = UpstreamGovernor(requests_per_minute=0, max_in_flight=2)
+    admitted = []
+    release = threading.Event()
+    threads = [start_waiter(governor, ticket, admitted, release) for ticket in range(5)]
+    wait_until(lambda: governor.stats() == {"in_flight": 2, "waiting": 3})
+    assert len(admitted) == 2
+    release.set()
+    for thread in threads:
+        thread.join(10)
+    assert sorted(admitted) == list(range(5))
+
+
+def test_governors_are_shared_per_deployment():
+    config = {"imagegen_aoai_edits_url": "http://governor-test/edits", "imagegen_aoai_requests_per_minute": 0}
+    governor = get_upstream_governor(config)
+    assert get_upstream_governor(dict(config)) is governor
+    assert governor.bucket is None
+    other = get_upstream_governor(dict(config, imagegen_aoai_deployment="other"))
+    assert other is not governor
+    assert other.bucket is None
+    limited = get_upstream_governor({
+        "imagegen_aoai_edits_url": "http://governor-test/limited", "imagegen_aoai_requests_per_minute": 30,
+        "imagegen_aoai_max_in_flight": 3,
+    })
+    assert limited.max_in_flight == 3
+    assert limited.bucket.burst == 3
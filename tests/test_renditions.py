@@ -0,0 +1,92 @@
+"""
+Rendition cache: named sizes, reuse across lookups and new renditions for edited sources
+"""
+import os
+import threading
+
+from PIL import Image
+
+from renditions import RENDITION_SIZES, RenditionCache, get_rendition_cache
+
+
+def make_image(path, size=(2000, 1000), color="red"):
+    Image.new("RGB", size, color).save(path)
+    return str(path)
+
+
+def test_named_and_explicit_sizes(tmp_path):
+    cache = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    source = make_image(tmp_path / "result.png")
+    for name, (max_width, max_height) in RENDITION_SIZES.items():
+        with Image.open(cache.get(source, name)) as img:
+            assert img.format == "JPEG"
+            assert img.width <= max_width and img.height <= max_height
+            assert max(img.width / max_width, img.height / max_height) > 0.99
+    with Image.open(cache.get(source, (300, None))) as img:
+        assert img.size == (300, 150)
+
+
+def test_lookups_reuse_the_rendition(tmp_path):
+    cache = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    source = make_image(tmp_path / "result.png")
+    path = cache.get(source, "strip")
+    mtime = os.stat(path).st_mtime_ns
+    # A second cache over the same directory (another session) finds it too
+    other = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    assert other.get(source, "strip") == path
+    assert os.stat(path).st_mtime_ns == mtime
+    # An identical copy elsewhere shares the rendition
+    copy = make_image(tmp_path / "copy.png")
+    assert cache.get(copy, "strip") == path
+    assert len(os.listdir(tmp_path / "renditions")) == 1
+
+
+def test_edited_source_gets_a_new_rendition(tmp_path):
+    cache = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    source = make_image(tmp_path / "photo.png", color="red")
+    before = cache.get(source, "strip")
+    make_image(tmp_path / "photo.png", color="blue")
+    after = cache.get(source, "strip")
+    assert after != before
+    with Image.open(after) as img:
+        red, green, blue = img.convert("RGB").getpixel((0, 0))
+    assert blue > 200 and red < 50
+
+
+def test_concurrent_lookups_render_once(tmp_path, monkeypatch):
+    import renditions
+
+    calls = []
+    real_render = renditions.render_thumbnails
+
+    def counting_render(*args):
+        calls.append(args)
+        return real_render(*args)
+
+    monkeypatch.setattr(renditions, "render_thumbnails", counting_render)
+    cache = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    source = make_image(tmp_path / "result.png")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get(source, "preview"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(set(results)) == 1
+    assert len(calls) == 1
+
+
+def test_unreadable_sources_fall_back_to_the_original(tmp_path):
+    cache = RenditionCache(cache_dir=str(tmp_path / "renditions"), image_format="JPEG")
+    missing = str(tmp_path / "missing.png")
+    assert cache.get(missing, "strip") == missing
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not an image")
+    assert cache.get(str(broken), "strip") == str(broken)
+    assert not list(tmp_path.glob("renditions/*"))
+
+
+def test_shared_cache_is_created_once(workdir):
+    cache = get_rendition_cache()
+    assert get_rendition_cache("elsewhere") is cache
+    assert cache.cache_dir == os.path.join(".cache", "renditions")
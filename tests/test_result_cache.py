@@ -0,0 +1,101 @@
+"""
+Result cache keys, LRU eviction, and a session still showing an evicted result
+"""
+import os
+import shutil
+import time
+
+import pytest
+from PIL import Image
+
+from result_cache import ResultCache, make_cache_key
+from tryon_service import TryOnService
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    # Served paths are relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    return TryOnService({"storage_sweep_interval": 0, "tryon_job_workers": 1})
+
+
+def generated_image(name, color):
+    os.makedirs("generated_images", exist_ok=True)
+    path = os.path.join("generated_images", name)
+    Image.new("RGB", (64, 96), color).save(path)
+    return path
+
+
+def test_displayed_result_evicted(service):
+    first = generated_image("generated_first.png", "red")
+    cache = ResultCache(cache_dir="generated_images", max_bytes=os.path.getsize(first) + 10)
+    cache.put("first", first)
+    # What the result panel reads on every rerun
+    assert os.path.exists(service.image_source(first, "preview"))
+    assert service.read_file(first).startswith(b"\x89PNG")
+
+    cache.put("second", generated_image("generated_second.png", "blue"))
+    assert not os.path.exists(first)
+    assert cache.get("first") is None
+
+    # The panel drops the result on ValueError, even with its rendition cached
+    with pytest.raises(ValueError, match="not found"):
+        service.image_source(first, "preview")
+    with pytest.raises(ValueError, match="not found"):
+        service.read_file(first)
+
+
+def test_cache_key_follows_content_not_paths(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for name, color in (("person.png", "white"), ("dress.png", "red"), ("hat.png", "black")):
+        Image.new("RGB", (32, 32), color).save(name)
+    shutil.copy("person.png", "reupload.png")
+    params = {"size": "1024x1536", "quality": "low"}
+    key = make_cache_key("person.png", ["dress.png", "hat.png"], "prompt", params)
+
+    # Re-uploads of the same photo and reordered selections share the entry
+    assert make_cache_key("reupload.png", ["hat.png", "dress.png"], "prompt", dict(params)) == key
+    # Anything that changes the output does not
+    assert make_cache_key("person.png", ["dress.png"], "prompt", params) != key
+    assert make_cache_key("person.png", ["dress.png", "hat.png"], "other prompt", params) != key
+    assert make_cache_key("person.png", ["dress.png", "hat.png"], "prompt", dict(params, quality="high")) != key
+    Image.new("RGB", (32, 32), "gray").save("reupload.png")
+    assert make_cache_key("reupload.png", ["dress.png", "hat.png"], "prompt", params) != key
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    paths = {name: generated_image(f"generated_{name}.png", color)
+             for name, color in (("a", "red"), ("b", "green"), ("c", "blue"), ("d", "white"))}
+    size = max(os.path.getsize(path) for path in paths.values())
+    cache = ResultCache(cache_dir="generated_images", max_bytes=3 * size)
+    for name in ("a", "b", "c"):
+        cache.put(name, paths[name])
+        time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == paths["a"]
+    time.sleep(0.01)
+
+    cache.put("d", paths["d"])
+    assert cache.get("b") is None
+    assert not os.path.exists(paths["b"])
+    assert {name: cache.get(name) for name in ("a", "c", "d")} == {name: paths[name] for name in ("a", "c", "d")}
+    assert cache.total_bytes() <= 3 * size
+
+    # The index survives a restart; files removed behind its back are misses
+    reloaded = ResultCache(cache_dir="generated_images", max_bytes=3 * size)
+    assert reloaded.get("c") == paths["c"]
+    os.remove(paths["d"])
+    assert reloaded.get("d") is None
+    assert reloaded.total_bytes() == os.path.getsize(paths["a"]) + os.path.getsize(paths["c"])
+
+
+def test_new_entry_over_budget_is_kept(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    cache = ResultCache(cache_dir="generated_images", max_bytes=10)
+    old = generated_image("generated_old.png", "red")
+    cache.put("old", old)
+    new = generated_image("generated_new.png", "blue")
+    cache.put("new", new)
+    assert cache.get("new") == new
+    assert cache.get("old") is None
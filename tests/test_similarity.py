@@ -0,0 +1,94 @@
+"""
+Visual descriptors and top-k queries over the similarity matrix
+"""
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from similarity import (DESCRIPTOR_DIM, SimilarityMatrix, compute_descriptor, descriptor_from_bytes,
+                        descriptor_to_bytes)
+
+
+def garment(path, color, shape="dress", background=(0, 0, 0, 0)):
+    img = Image.new("RGBA", (120, 160), background)
+    draw = ImageDraw.Draw(img)
+    if shape == "dress":
+        draw.polygon([(45, 10), (75, 10), (110, 150), (10, 150)], fill=color)
+    else:
+        draw.ellipse([20, 50, 100, 110], fill=color)
+    img.save(path)
+    return str(path)
+
+
+def test_descriptors_are_unit_vectors_that_ignore_the_background(tmp_path):
+    red = compute_descriptor(garment(tmp_path / "red.png", (200, 30, 30, 255)))
+    assert red.shape == (DESCRIPTOR_DIM,)
+    assert float(np.linalg.norm(red)) == pytest.approx(1.0, abs=1e-5)
+
+    # Transparent pixels of any color don't count
+    same = compute_descriptor(garment(tmp_path / "same.png", (200, 30, 30, 255), background=(0, 255, 0, 0)))
+    assert float(red @ same) == pytest.approx(1.0, abs=1e-3)
+
+    assert descriptor_from_bytes(descriptor_to_bytes(red)).tolist() == red.tolist()
+    assert descriptor_from_bytes(b"") is None
+    assert descriptor_from_bytes(b"\0" * 12) is None
+
+
+def test_similar_colors_and_shapes_rank_first(tmp_path):
+    catalog = {
+        "dark_red_dress": garment(tmp_path / "a.png", (190, 25, 25, 255)),
+        "red_hat": garment(tmp_path / "b.png", (200, 30, 30, 255), shape="hat"),
+        "blue_dress": garment(tmp_path / "c.png", (30, 30, 200, 255)),
+        "green_hat": garment(tmp_path / "d.png", (30, 160, 30, 255), shape="hat"),
+    }
+    matrix = SimilarityMatrix()
+    for name, path in catalog.items():
+        matrix.upsert(name, compute_descriptor(path))
+    query = compute_descriptor(garment(tmp_path / "q.png", (200, 30, 30, 255)))
+
+    # Color counts for more than shape
+    ranked = [name for name, _ in matrix.query(query, k=4)[0]]
+    assert ranked == ["dark_red_dress", "red_hat", "blue_dress", "green_hat"]
+
+
+def brute_force(vectors, query, k, exclude):
+    scores = {path: float(vector @ query) for path, vector in vectors.items() if path != exclude}
+    return sorted(scores, key=lambda path: -scores[path])[:k]
+
+
+def test_matrix_queries_match_brute_force_through_updates():
+    rng = np.random.default_rng(7)
+
+    def unit():
+        vector = rng.normal(size=DESCRIPTOR_DIM).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    # Enough rows to grow the preallocated matrix
+    vectors = {f"item_{index}": unit() for index in range(1500)}
+    matrix = SimilarityMatrix()
+    for path, vector in vectors.items():
+        matrix.upsert(path, vector)
+    for path in ("item_0", "item_700", "item_1499"):
+        matrix.remove(path)
+        del vectors[path]
+    vectors["item_5"] = unit()
+    matrix.upsert("item_5", vectors["item_5"])
+    matrix.remove("not indexed")
+    assert len(matrix) == len(vectors) == 1497
+    assert matrix.descriptor("item_700") is None
+    assert matrix.descriptor("item_5").tolist() == vectors["item_5"].tolist()
+
+    queries = ["item_5", "item_1", "item_1498"]
+    results = matrix.query([vectors[path] for path in queries], k=10, exclude=queries)
+    for path, result in zip(queries, results):
+        assert [match for match, _ in result] == brute_force(vectors, vectors[path], 10, path)
+        scores = [score for _, score in result]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_small_and_empty_matrices():
+    assert SimilarityMatrix().query(np.ones(DESCRIPTOR_DIM), k=3) == [[]]
+    matrix = SimilarityMatrix()
+    matrix.upsert("only", np.ones(DESCRIPTOR_DIM, dtype=np.float32))
+    assert matrix.query(np.ones(DESCRIPTOR_DIM), k=5, exclude=["only"]) == [[]]
+    assert [path for path, _ in matrix.query(np.ones(DESCRIPTOR_DIM), k=5)[0]] == ["only"]
@@ -0,0 +1,151 @@
+"""
+Single flight: identical calls in flight share one execution
+"""
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from singleflight import SingleFlight
+from tryon import generate_try_on
+
+
+def run_concurrently(flights, key, fn, count):
+    # Starts count callers of flights.do(key, fn); returns their outcomes
+    outcomes = [None] * count
+
+    def call(index):
+        try:
+            outcomes[index] = flights.do(key, fn)
+        except Exception as e:
+            outcomes[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    return threads, outcomes
+
+
+class Work:
+    # A call that blocks until released and counts its executions
+    def __init__(self, result="image.png", error=None):
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.result = result
+        self.error = error
+
+    def __call__(self):
+        self.calls += 1
+        self.started.set()
+        self.release.wait(10)
+        if self.error:
+            raise self.error
+        return self.result
+
+
+def test_identical_calls_share_one_execution():
+    flights = SingleFlight()
+    work = Work()
+    threads, outcomes = run_concurrently(flights, "key", work, 5)
+    assert work.started.wait(10)
+    assert flights.in_flight() == 1
+    work.release.set()
+    for thread in threads:
+        thread.join(10)
+    assert work.calls == 1
+    assert sorted(outcomes, key=lambda outcome: outcome[1]) == [("image.png", False)] + [("image.png", True)] * 4
+    assert flights.in_flight() == 0
+
+    # Finished calls are not remembered
+    assert flights.do("key", lambda: "again") == ("again", False)
+
+
+def test_other_keys_run_independently():
+    flights = SingleFlight()
+    work = Work()
+    threads, _ = run_concurrently(flights, "slow", work, 1)
+    assert work.started.wait(10)
+    assert flights.do("fast", lambda: 42) == (42, False)
+    work.release.set()
+    threads[0].join(10)
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+    work = Work(error=RuntimeError("Content filtered"))
+    threads, outcomes = run_concurrently(flights, "key", work, 3)
+    work.release.set()
+    for thread in threads:
+        thread.join(10)
+    assert work.calls == 1
+    assert all(isinstance(outcome, RuntimeError) and str(outcome) == "Content filtered" for outcome in outcomes)
+    assert flights.in_flight() == 0
+
+
+@pytest.fixture
+def lock_dir(tmp_path):
+    pytest.importorskip("fcntl")
+    return str(tmp_path / "flights")
+
+
+def test_processes_share_results_through_the_lock_directory(lock_dir):
+    # Two coalescers on one directory behave like two worker processes
+    first, second = SingleFlight(lock_dir=lock_dir), SingleFlight(lock_dir=lock_dir)
+    work = Work(result={"path": "generated_images/a.png"})
+    threads, _ = run_concurrently(first, "key", work, 1)
+    assert work.started.wait(10)
+
+    waiting = []
+    thread = threading.Thread(target=lambda: waiting.append(second.do("key", lambda: {"path": "duplicate"})))
+    thread.start()
+    time.sleep(0.1)
+    # Blocked on the file lock until the first call finishes
+    assert waiting == []
+    work.release.set()
+    threads[0].join(10)
+    thread.join(10)
+    assert waiting == [({"path": "generated_images/a.png"}, True)]
+    assert work.calls == 1
+
+
+def test_rejected_or_expired_results_are_recomputed(lock_dir):
+    first = SingleFlight(lock_dir=lock_dir)
+    assert first.do("key", lambda: {"path": "gone.png"}) == ({"path": "gone.png"}, False)
+
+    second = SingleFlight(lock_dir=lock_dir)
+    assert second.do("key", lambda: {"path": "new.png"}, is_valid=lambda result: result["path"] != "gone.png") == (
+        {"path": "new.png"}, False
+    )
+    assert SingleFlight(lock_dir=lock_dir).do("key", lambda: {"path": "other.png"}) == ({"path": "new.png"}, True)
+    expired = SingleFlight(lock_dir=lock_dir, result_ttl=-1)
+    assert expired.do("key", lambda: {"path": "fresh.png"}) == ({"path": "fresh.png"}, False)
+
+
+def test_identical_generations_call_upstream_once(workdir, aoai_server):
+    server, edits_url = aoai_server(latency=0.5)
+    config = {
+        "imagegen_aoai_edits_url": edits_url,
+        "imagegen_aoai_api_key": "mock",
+        "imagegen_aoai_deployment": "mock",
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_partial_images": 0,
+    }
+    Image.new("RGB", (48, 64), "white").save("person.png")
+    Image.new("RGB", (48, 48), "red").save("dress.png")
+
+    # A double-clicked "Generate"
+    results = []
+    callers = [
+        threading.Thread(target=lambda: results.append(generate_try_on(config, "person.png", ["dress.png"])))
+        for _ in range(2)
+    ]
+    for caller in callers:
+        caller.start()
+    for caller in callers:
+        caller.join(30)
+    assert server.stats["requests"] == 1
+    assert results[0]["path"] == results[1]["path"]
+    assert sorted(result["coalesced"] for result in results) == [False, True]
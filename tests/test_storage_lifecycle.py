@@ -0,0 +1,105 @@
+"""
+Storage sweeps: TTLs, quotas, the grace window and what is never removed
+"""
+import json
+import os
+import sys
+import time
+
+import pytest
+
+import storage_lifecycle
+from storage_lifecycle import StorageLifecycle
+
+HOUR = 3600
+
+
+@pytest.fixture
+def uploads(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("uploads")
+    return "uploads"
+
+
+def write(directory, name, size=100, age=0):
+    path = os.path.join(directory, name)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def removed(report, directory="uploads"):
+    return sorted(os.path.basename(entry["path"]) for entry in report["directories"][directory]["removed"])
+
+
+def test_quota_evicts_least_recently_used_outside_the_grace_window(uploads):
+    for name, age in (("old.png", 5 * HOUR), ("older.png", 6 * HOUR), ("oldest.png", 7 * HOUR)):
+        write(uploads, name, age=age)
+    write(uploads, "fresh.png", age=60)
+    lifecycle = StorageLifecycle({uploads: {"max_bytes": 250, "ttl_seconds": None}})
+
+    # The oldest files go first; the fresh one is kept even though the
+    # directory is still over its quota without it
+    report = lifecycle.sweep()
+    assert removed(report) == ["older.png", "oldest.png"]
+    assert all(entry["reason"] == "over_quota" for entry in report["directories"][uploads]["removed"])
+    assert sorted(os.listdir(uploads)) == ["fresh.png", "old.png"]
+
+    # A recent access outranks modification time
+    write(uploads, "other.png", age=4 * HOUR)
+    lifecycle.record_access(os.path.join(uploads, "old.png"))
+    assert removed(lifecycle.sweep()) == ["other.png"]
+
+
+def test_ttl_and_stale_temporary_files(uploads):
+    write(uploads, "expired.png", age=3 * 24 * HOUR)
+    write(uploads, "kept.png", age=2 * HOUR)
+    write(uploads, "interrupted.png.tmp", age=2 * HOUR)
+    write(uploads, "writing.png.tmp", age=60)
+    lifecycle = StorageLifecycle({uploads: {"max_bytes": None, "ttl_seconds": 24 * HOUR}})
+
+    report = lifecycle.sweep(dry_run=True)
+    assert removed(report) == ["expired.png", "interrupted.png.tmp"]
+    assert len(os.listdir(uploads)) == 4
+    lifecycle.sweep()
+    assert sorted(os.listdir(uploads)) == ["kept.png", "writing.png.tmp"]
+
+
+def test_protected_referenced_and_internal_files_are_kept(uploads):
+    for name in ("person_1.png", "sample_2.png", "session.png", "job.png", ".index", "plain.png"):
+        write(uploads, name, age=30 * 24 * HOUR)
+    lifecycle = StorageLifecycle(
+        {uploads: {"max_bytes": 0, "ttl_seconds": HOUR, "protected": ["person_*", "sample_*"]}},
+        session_ttl=HOUR,
+    )
+    # Relative and absolute references match
+    lifecycle.reference("session", [os.path.join(uploads, "session.png"), None])
+    lifecycle.reference("job", [os.path.abspath(os.path.join(uploads, "job.png"))])
+
+    report = lifecycle.sweep()
+    assert removed(report) == ["plain.png"]
+    assert report["directories"][uploads]["protected"] == 4
+
+    # A released job and a session that stopped reporting lose their hold
+    lifecycle.release("job")
+    seen_at, paths = lifecycle._sessions["session"]
+    lifecycle._sessions["session"] = (seen_at - 2 * HOUR, paths)
+    assert removed(lifecycle.sweep()) == ["job.png", "session.png"]
+    assert lifecycle.stats()["active_sessions"] == 0
+    assert sorted(os.listdir(uploads)) == [".index", "person_1.png", "sample_2.png"]
+
+
+def test_command_line_sweep_uses_configured_policies(uploads, tmp_path, monkeypatch, capsys):
+    write(uploads, "big.png", size=1000, age=2 * HOUR)
+    config_path = tmp_path / "config.json"
+    config_path.write_text(json.dumps({"storage_policies": {uploads: {"max_bytes": 10, "ttl_seconds": None}}}))
+    monkeypatch.setattr(storage_lifecycle, "_lifecycle", None)
+    monkeypatch.setattr(sys, "argv", ["storage_lifecycle.py", "--dry-run", "--config", str(config_path)])
+
+    storage_lifecycle.main()
+    report = json.loads(capsys.readouterr().out)
+    assert report["dry_run"]
+    assert removed(report) == ["big.png"]
+    assert os.path.exists(os.path.join(uploads, "big.png"))
@@ -0,0 +1,127 @@
+"""
+Streamed images/edits responses: event parsing, partial images, and streams
+that end early or report an error
+"""
+import base64
+import json
+
+import pytest
+
+from upstream import ImageEditsClient, UpstreamError, iter_sse_events, write_streamed_image
+
+FILES = [("image[]", ("user.png", b"\x89PNG fake", "image/png"))]
+DATA = {"prompt": "try this on", "n": 1, "quality": "low"}
+
+FINAL_IMAGE = b"\x89PNG final image bytes" * 50
+
+
+def event(name, payload):
+    return f"event: {name}\ndata: {json.dumps(payload)}\n\n"
+
+
+def partial(index):
+    return event("image_edit.partial_image", {
+        "type": "image_edit.partial_image", "partial_image_index": index,
+        "b64_json": base64.b64encode(b"partial %d" % index).decode("ascii"),
+    })
+
+
+def completed(image=FINAL_IMAGE):
+    return event("image_edit.completed", {
+        "type": "image_edit.completed", "b64_json": base64.b64encode(image).decode("ascii"),
+    })
+
+
+def stream_to_file(url, tmp_path, partial_images=2):
+    partials = []
+    output_path = tmp_path / "result.png"
+    client = ImageEditsClient(url, "mock", max_retries=0)
+    written = client.edit_stream_to_file(
+        FILES, DATA, str(output_path), partial_images, lambda index, data: partials.append((index, data))
+    )
+    return written, output_path, partials
+
+
+def test_iter_sse_events():
+    lines = [
+        ": keep-alive comment", "",
+        "event: first", "data: one", "",
+        "data: line 1", "data:line 2", "data:  indented", "",
+        "event: ignored without data", "",
+        "data: cut off by the end of the stream",
+    ]
+    assert list(iter_sse_events(lines)) == [
+        ("first", "one"),
+        (None, "line 1\nline 2\n indented"),
+    ]
+
+
+def test_write_streamed_image_joins_multi_line_data(tmp_path):
+    # One JSON document split over several data: lines, without event names
+    lines = [
+        'data: {"type": "image_edit.completed",',
+        'data: "b64_json":',
+        f'data: "{base64.b64encode(FINAL_IMAGE).decode("ascii")}"}}',
+        "",
+        "data: [DONE]",
+        "",
+    ]
+    with open(tmp_path / "out.png", "wb") as out_file:
+        assert write_streamed_image(lines, out_file) == len(FINAL_IMAGE)
+    assert (tmp_path / "out.png").read_bytes() == FINAL_IMAGE
+
+
+def test_partials_reach_on_partial_from_the_mock(aoai_server, tmp_path):
+    server, url = aoai_server(latency=0.1)
+    written, output_path, partials = stream_to_file(url, tmp_path, partial_images=3)
+    assert server.stats["streams"] == 1
+    # In order, decoded, before the final image
+    assert [index for index, _ in partials] == [0, 1, 2]
+    assert all(data.startswith(b"\x89PNG") for _, data in partials)
+    assert written == output_path.stat().st_size
+    assert base64.b64encode(output_path.read_bytes()).decode("ascii") == server.b64_image
+    assert [path.name for path in tmp_path.iterdir()] == ["result.png"]
+
+
+def test_multi_line_events_and_done_over_http(stream_server, tmp_path):
+    encoded = base64.b64encode(FINAL_IMAGE).decode("ascii")
+    body = (
+        ": processing\n\n" + partial(0)
+        + 'event: image_edit.completed\ndata: {"type": "image_edit.completed",\ndata: "b64_json": "'
+        + encoded + '"}\n\n'
+        + "data: [DONE]\n\n"
+    ).encode("utf-8")
+    written, output_path, partials = stream_to_file(stream_server(body), tmp_path)
+    assert partials == [(0, b"partial 0")]
+    assert written == len(FINAL_IMAGE)
+    assert output_path.read_bytes() == FINAL_IMAGE
+
+
+def test_done_before_the_final_image_is_an_error(stream_server, tmp_path):
+    body = (partial(0) + "data: [DONE]\n\n").encode("utf-8")
+    with pytest.raises(UpstreamError, match="ended before the final image"):
+        stream_to_file(stream_server(body), tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("chunked", [True, False])
+def test_stream_dropped_mid_image(stream_server, tmp_path, chunked):
+    body = (partial(0) + partial(1) + completed()).encode("utf-8")
+    # The connection closes halfway through the final image's data
+    truncate = len(body) - len(completed()) // 2
+    partials = []
+    client = ImageEditsClient(stream_server(body, truncate=truncate, chunked=chunked), "mock", max_retries=0)
+    with pytest.raises(UpstreamError):
+        client.edit_stream_to_file(
+            FILES, DATA, str(tmp_path / "result.png"), 2, lambda index, data: partials.append(index)
+        )
+    # Partials seen before the drop were still delivered; nothing half-written is left
+    assert partials == [0, 1]
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_error_event_fails_the_stream(stream_server, tmp_path):
+    body = (partial(0) + event("error", {"type": "error", "error": {"message": "Content filtered"}})).encode("utf-8")
+    with pytest.raises(UpstreamError, match="Content filtered"):
+        stream_to_file(stream_server(body), tmp_path)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,100 @@
+"""
+Thumbnail manifests: what a rebuild renders, skips and removes
+"""
+import json
+import os
+
+import pytest
+from PIL import Image
+
+from thumbnails import MANIFEST_FILENAME, THUMBNAIL_DIR_NAME, ThumbnailEngine
+
+SIZES = {"strip": (20, 20), "grid": (50, 50)}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = tmp_path / "clothing"
+    catalog.mkdir()
+    for name, color in (("red_dress.png", "red"), ("blue_shirt.png", "blue"), ("green_hat.jpg", "green")):
+        Image.new("RGB", (200, 100), color).save(catalog / name)
+    return catalog
+
+
+def engine():
+    return ThumbnailEngine(sizes=SIZES, image_format="JPEG")
+
+
+def rendition_mtimes(engine, catalog):
+    return {
+        path: os.stat(path).st_mtime_ns
+        for name in sorted(os.listdir(catalog)) if name.endswith((".png", ".jpg"))
+        for path in engine.thumbnail_paths(str(catalog / name)).values()
+    }
+
+
+def test_build_renders_every_size_once(catalog):
+    first = engine()
+    assert first.build_catalog(str(catalog), parallel=False)["built"] == 3
+    paths = first.thumbnail_paths(str(catalog / "red_dress.png"))
+    assert {name: Image.open(path).size for name, path in paths.items()} == {"strip": (20, 10), "grid": (50, 25)}
+    entry = first.manifest_entry(str(catalog / "red_dress.png"))
+    assert (entry["width"], entry["height"]) == (200, 100)
+    with open(catalog / THUMBNAIL_DIR_NAME / MANIFEST_FILENAME) as f:
+        assert sorted(json.load(f)) == ["blue_shirt.png", "green_hat.jpg", "red_dress.png"]
+
+    # A new process trusts the manifest and renders nothing
+    built = rendition_mtimes(first, catalog)
+    assert engine().build_catalog(str(catalog), parallel=False) == {
+        "built": 0, "fresh": 3, "fetched": 0, "failed": 0, "removed": 0
+    }
+    assert rendition_mtimes(first, catalog) == built
+
+
+def test_only_changed_sources_are_rebuilt(catalog):
+    builder = engine()
+    builder.build_catalog(str(catalog), parallel=False)
+    built = rendition_mtimes(builder, catalog)
+
+    # Touched but unchanged: the content hash matches, nothing is rendered
+    os.utime(catalog / "red_dress.png", ns=(1, 1))
+    # New content of the same size
+    Image.new("RGB", (200, 100), "navy").save(catalog / "blue_shirt.png")
+    # A rendition went missing
+    os.remove(builder.thumbnail_paths(str(catalog / "green_hat.jpg"))["strip"])
+
+    stats = builder.build_catalog(str(catalog), parallel=False)
+    assert (stats["built"], stats["fresh"]) == (2, 1)
+    after = rendition_mtimes(builder, catalog)
+    for path in builder.thumbnail_paths(str(catalog / "red_dress.png")).values():
+        assert after[path] == built[path]
+    assert builder.manifest_entry(str(catalog / "red_dress.png"))["mtime_ns"] == 1
+    assert Image.open(builder.thumbnail_paths(str(catalog / "blue_shirt.png"))["grid"]).getpixel((0, 0))[2] < 200
+
+
+def test_deleted_sources_lose_their_thumbnails(catalog):
+    builder = engine()
+    builder.build_catalog(str(catalog), parallel=False)
+    orphaned = builder.thumbnail_paths(str(catalog / "red_dress.png"))
+    os.remove(catalog / "red_dress.png")
+
+    assert builder.build_catalog(str(catalog), parallel=False)["removed"] == 1
+    assert not any(os.path.exists(path) for path in orphaned.values())
+    assert builder.manifest_entry(str(catalog / "red_dress.png")) is None
+
+
+def test_changed_sizes_or_format_rebuild(catalog):
+    engine().build_catalog(str(catalog), parallel=False)
+    resized = ThumbnailEngine(sizes=dict(SIZES, retina=(80, 80)), image_format="JPEG")
+    assert resized.build_catalog(str(catalog), parallel=False)["built"] == 3
+    assert resized.ensure(str(catalog / "red_dress.png")).keys() == {"strip", "grid", "retina"}
+    assert resized.ensure(str(catalog / "missing.png")) is None
+
+
+def test_parallel_build_matches_serial(catalog):
+    builder = ThumbnailEngine(sizes=SIZES, image_format="JPEG", max_workers=2)
+    progress = []
+    stats = builder.build_catalog(str(catalog), progress=lambda done, total: progress.append((done, total)))
+    assert stats["built"] == 3
+    assert progress[-1] == (3, 3)
+    assert all(os.path.exists(path) for path in rendition_mtimes(builder, catalog))
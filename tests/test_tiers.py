@@ -0,0 +1,68 @@
+"""
+Draft and HD renders of the same inputs, linked as one family
+"""
+import os
+
+import pytest
+from PIL import Image
+
+from tryon import TIER_DRAFT, TIER_HD, find_variants, generate_try_on, tier_quality
+from tryon_service import TryOnService
+
+
+@pytest.fixture
+def inputs(workdir, aoai_server):
+    os.makedirs("uploads/user_images")
+    os.makedirs("catalog/clothing")
+    Image.new("RGB", (48, 64), "white").save("uploads/user_images/person.png")
+    Image.new("RGB", (48, 48), "red").save("catalog/clothing/red_dress.png")
+    server, edits_url = aoai_server()
+    config = {
+        "imagegen_aoai_edits_url": edits_url,
+        "imagegen_aoai_api_key": "mock",
+        "imagegen_aoai_deployment": "mock",
+        "imagegen_aoai_requests_per_minute": 0,
+        "imagegen_partial_images": 0,
+        "storage_sweep_interval": 0,
+        "tryon_job_workers": 1,
+    }
+    return server, config, "uploads/user_images/person.png", ["catalog/clothing/red_dress.png"]
+
+
+def test_tiers_of_the_same_inputs_are_linked(inputs):
+    server, config, person, items = inputs
+    assert find_variants(config, person, items) == {}
+
+    draft = generate_try_on(config, person, items, quality="low")
+    assert find_variants(config, person, items) == {"low": draft["path"]}
+
+    hd = generate_try_on(config, person, items, quality="high")
+    assert not hd["cached"]
+    assert hd["path"] != draft["path"]
+    assert server.stats["requests"] == 2
+    assert find_variants(config, person, items) == {"low": draft["path"], "high": hd["path"]}
+
+    # Asking for a tier again is a cache hit
+    assert generate_try_on(config, person, items, quality="low")["cached"]
+    assert server.stats["requests"] == 2
+
+    # Other instructions make another family
+    assert find_variants(config, person, items, "Tuck the shirt in") == {}
+
+
+def test_service_reports_variants_by_tier(inputs):
+    server, config, person, items = inputs
+    service = TryOnService(config)
+    assert service.variants(person, items) == {TIER_DRAFT: None, TIER_HD: None}
+    draft = generate_try_on(config, person, items, quality=tier_quality(config, TIER_DRAFT))
+    assert service.variants(person, items) == {TIER_DRAFT: draft["path"], TIER_HD: None}
+
+    with pytest.raises(ValueError, match="Unknown render tier"):
+        service.submit(person, items, tier="ultra")
+
+
+def test_tier_qualities_are_configurable():
+    assert (tier_quality({}, TIER_DRAFT), tier_quality({}, TIER_HD)) == ("low", "high")
+    assert tier_quality({"draft_quality": "medium"}, TIER_DRAFT) == "medium"
+    with pytest.raises(ValueError):
+        tier_quality({}, "preview")
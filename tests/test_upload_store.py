@@ -0,0 +1,70 @@
+"""
+Content-addressed uploads: stored once, validated and normalized at ingest
+"""
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import upload_store
+from upload_store import UploadError, UploadStore, get_upload_store
+
+
+def image_bytes(color, size=(64, 48), format="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, format=format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(str(tmp_path / "uploads"), max_side=100)
+
+
+def test_same_bytes_are_stored_once(store, tmp_path, monkeypatch):
+    data = image_bytes("red")
+    path = store.save_bytes(data)
+    assert os.path.basename(path).startswith(upload_store.bytes_sha256(data)[:16])
+    mtime = os.stat(path).st_mtime_ns
+
+    # Every rerun uploads the same bytes again; nothing is decoded or written
+    monkeypatch.setattr(upload_store, "normalize_image", None)
+    assert store.save_bytes(data) == path
+    # A new process finds the stored file
+    assert UploadStore(store.save_dir, max_side=100).save_bytes(data) == path
+    assert os.stat(path).st_mtime_ns == mtime
+    assert os.listdir(store.save_dir) == [os.path.basename(path)]
+
+
+def test_uploads_are_normalized_at_ingest(store):
+    path = store.save_bytes(image_bytes("blue", size=(400, 200), format="WEBP"))
+    assert path.endswith(".jpg")
+    with Image.open(path) as img:
+        assert (img.format, img.size) == ("JPEG", (100, 50))
+    # Different content, different file
+    assert store.save_bytes(image_bytes("green")) != path
+    assert len(os.listdir(store.save_dir)) == 2
+
+
+@pytest.mark.parametrize("data, message", [
+    (b"not an image", "not a valid image"),
+    (image_bytes("red")[:60], "not a valid image"),
+    (image_bytes("red", format="GIF"), "Unsupported image format: GIF"),
+])
+def test_unusable_uploads_are_rejected(store, data, message):
+    with pytest.raises(UploadError, match=message):
+        store.save_bytes(data)
+    assert not os.path.exists(store.save_dir) or os.listdir(store.save_dir) == []
+
+
+def test_oversized_uploads_are_rejected_before_decoding(store, monkeypatch):
+    monkeypatch.setattr(upload_store, "MAX_UPLOAD_BYTES", 100)
+    with pytest.raises(UploadError, match="too large"):
+        store.save_bytes(image_bytes("red", size=(200, 200)))
+
+
+def test_stores_are_shared_per_directory(workdir):
+    store = get_upload_store("uploads/user_images")
+    assert get_upload_store("uploads/./user_images") is store
+    assert get_upload_store("uploads/user_items") is not store
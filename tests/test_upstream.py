@@ -0,0 +1,190 @@
+"""
+Retries, Retry-After handling and timeouts of the images/edits client, and
+decoding its responses straight to disk
+"""
+import base64
+import email.utils
+import io
+import json
+import os
+import time
+
+import pytest
+
+from mock_aoai_server import make_png
+from upstream import ImageEditsClient, UpstreamError, UpstreamTimeout, parse_retry_after, write_b64_json_image
+
+FILES = [("image[]", ("user.png", b"\x89PNG fake", "image/png"))]
+DATA = {"prompt": "try this on", "n": 1, "quality": "low"}
+
+
+def make_client(url, sleeps, **kwargs):
+    # Record backoff delays instead of sleeping through them
+    client = ImageEditsClient(url, "mock", **kwargs)
+    client._sleep = sleeps.append
+    return client
+
+
+def test_parse_retry_after():
+    assert parse_retry_after({}) is None
+    assert parse_retry_after({"Retry-After": "7"}) == 7.0
+    assert parse_retry_after({"Retry-After": "7", "retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"Retry-After": "-3"}) == 0.0
+    assert parse_retry_after({"Retry-After": "soon"}) is None
+    retry_at = email.utils.formatdate(time.time() + 60, usegmt=True)
+    assert 55 <= parse_retry_after({"Retry-After": retry_at}) <= 60
+
+
+def test_success_needs_one_request(aoai_server):
+    server, url = aoai_server()
+    sleeps = []
+    result = make_client(url, sleeps).edit(FILES, DATA)
+    assert result["data"][0]["b64_json"]
+    assert server.stats["requests"] == 1
+    assert sleeps == []
+
+
+def test_throttling_honors_retry_after(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=429, retry_after=2)
+    sleeps = []
+    client = make_client(url, sleeps, max_retries=2)
+    with pytest.raises(UpstreamError) as excinfo:
+        client.edit(FILES, DATA)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after == 2.0
+    assert server.stats["requests"] == 3
+    assert len(sleeps) == 2
+    # Retry-After plus a little jitter, never less than asked for
+    assert all(2.0 <= delay <= 2.3 for delay in sleeps)
+
+
+def test_long_retry_after_gives_up_without_waiting(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=429, retry_after=600)
+    sleeps = []
+    client = make_client(url, sleeps, max_retries=4, max_retry_after=60)
+    with pytest.raises(UpstreamError) as excinfo:
+        client.edit(FILES, DATA)
+    assert excinfo.value.status_code == 429
+    assert excinfo.value.retry_after == 600.0
+    assert server.stats["requests"] == 1
+    assert sleeps == []
+
+
+def test_transient_error_is_retried_until_it_clears(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=503)
+    sleeps = []
+
+    def recover(delay):
+        sleeps.append(delay)
+        server.error_rate = 0.0
+
+    client = ImageEditsClient(url, "mock", max_retries=3, backoff_base=1.0, backoff_max=30.0)
+    client._sleep = recover
+    result = client.edit(FILES, DATA)
+    assert result["data"][0]["b64_json"]
+    assert server.stats["requests"] == 2
+    assert server.stats["errors"] == 1
+    # Without Retry-After: jittered backoff within the first step
+    assert len(sleeps) == 1 and 0.0 <= sleeps[0] <= 1.0
+
+
+def test_backoff_grows_and_is_capped(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=500)
+    sleeps = []
+    client = make_client(url, sleeps, max_retries=4, backoff_base=1.0, backoff_max=3.0)
+    with pytest.raises(UpstreamError) as excinfo:
+        client.edit(FILES, DATA)
+    assert excinfo.value.status_code == 500
+    assert server.stats["requests"] == 5
+    for attempt, delay in enumerate(sleeps):
+        assert 0.0 <= delay <= min(3.0, 2 ** attempt)
+
+
+def test_client_errors_are_not_retried(aoai_server):
+    server, url = aoai_server(error_rate=1.0, error_status=400)
+    sleeps = []
+    with pytest.raises(UpstreamError) as excinfo:
+        make_client(url, sleeps).edit(FILES, DATA)
+    assert excinfo.value.status_code == 400
+    assert "Mock upstream error" in str(excinfo.value)
+    assert server.stats["requests"] == 1
+    assert sleeps == []
+
+
+def test_unreachable_service_is_retried_then_reported(closed_port):
+    sleeps = []
+    client = make_client(
+        f"http://127.0.0.1:{closed_port}/openai/deployments/mock/images/edits", sleeps,
+        max_retries=2, connect_timeout=1,
+    )
+    with pytest.raises(UpstreamError) as excinfo:
+        client.edit(FILES, DATA)
+    assert excinfo.value.status_code is None
+    assert not isinstance(excinfo.value, UpstreamTimeout)
+    assert len(sleeps) == 2
+
+
+def test_read_timeout_is_not_resent(aoai_server):
+    server, url = aoai_server(latency=1.0)
+    sleeps = []
+    client = make_client(url, sleeps, max_retries=3, read_timeout=0.2)
+    with pytest.raises(UpstreamTimeout):
+        client.edit(FILES, DATA)
+    assert server.stats["requests"] == 1
+    assert sleeps == []
+
+
+def test_edit_to_file_writes_the_image(aoai_server, tmp_path):
+    server, url = aoai_server(error_rate=1.0, error_status=502)
+    sleeps = []
+
+    def recover(delay):
+        sleeps.append(delay)
+        server.error_rate = 0.0
+
+    client = ImageEditsClient(url, "mock", max_retries=1)
+    client._sleep = recover
+    output_path = tmp_path / "out.png"
+    written = client.edit_to_file(FILES, DATA, str(output_path))
+    assert written == output_path.stat().st_size
+    assert output_path.read_bytes().startswith(b"\x89PNG")
+    assert [path.name for path in tmp_path.iterdir()] == ["out.png"]
+
+
+def edits_body(image, escape_slashes=False):
+    # A response shaped like the service's, with the image between other fields
+    encoded = base64.b64encode(image).decode("ascii")
+    body = json.dumps({"created": 1, "data": [{"b64_json": encoded}], "usage": {"total_tokens": 1}}, indent=1)
+    return body.replace("/", "\\/") if escape_slashes else body
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 4096])
+def test_b64_json_is_decoded_across_chunk_boundaries(chunk_size):
+    image = make_png(size=(40, 30)) + bytes(range(256))
+    body = edits_body(image, escape_slashes=True).encode("ascii")
+    out_file = io.BytesIO()
+    chunks = (body[offset:offset + chunk_size] for offset in range(0, len(body), chunk_size))
+    assert write_b64_json_image(chunks, out_file) == len(image)
+    assert out_file.getvalue() == image
+
+
+@pytest.mark.parametrize("body", [
+    b'{"data": []}',
+    b'{"data": [{"b64_json": "iVBORw0KGgo',
+    b'{"data": [{"b64_json": "iVBORw0KGgoAA"}]}',
+])
+def test_incomplete_b64_json_is_rejected(body):
+    with pytest.raises(UpstreamError, match="did not contain a complete image"):
+        write_b64_json_image([body], io.BytesIO())
+
+
+@pytest.mark.parametrize("chunked", [True, False])
+def test_edit_to_file_reports_a_dropped_response(stream_server, tmp_path, chunked):
+    # Split into pieces the scripted server sends one chunk at a time
+    body = edits_body(make_png(size=(200, 200))).replace(",\n", ",\n\n").encode("ascii") + b"\n\n"
+    url = stream_server(body, truncate=len(body) // 2, chunked=chunked)
+    client = ImageEditsClient(url, "mock", max_retries=0)
+    output_path = tmp_path / "out.png"
+    with pytest.raises(UpstreamError, match="interrupted" if chunked else "complete image"):
+        client.edit_to_file(FILES, DATA, str(output_path))
+    assert os.listdir(tmp_path) == []
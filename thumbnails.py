@@ -0,0 +1,458 @@
+import json
+import os
+import threading
+
+import metrics
+from cache_backend import pack, shared_cache, unpack
+from content_hash import file_sha256
+
+# Thumbnail renditions built for every catalog item: name -> max (width, height)
+THUMBNAIL_SIZES = {
+    "strip": (120, 120),   # selected-items strip
+    "grid": (300, 300),    # catalog grid
+    "retina": (600, 600),  # catalog grid on high-DPI screens
+}
+
+# Subdirectory (next to the originals) holding thumbnails and the manifest
+THUMBNAIL_DIR_NAME = "thumbnails"
+MANIFEST_FILENAME = "manifest.json"
+
+# Extensions treated as catalog images
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# Encoder settings; WebP keeps transparency, JPEG is the fallback
+WEBP_QUALITY = 80
+JPEG_QUALITY = 85
+
+
+_thumbnails_built = metrics.counter("thumbnails_built_total", "Images thumbnailed, one at a time or in bulk", ("mode",))
+_thumbnails_failed = metrics.counter("thumbnails_failed_total", "Images that could not be thumbnailed")
+
+def default_thumbnail_format():
+    """
+    Pick the most compact thumbnail format supported by this Pillow build
+
+    Returns:
+    - "WEBP" or "JPEG"
+    """
+    # PIL and the process pool are imported on first use, so importing this
+    # module for its constants and paths stays cheap on cold starts
+    from PIL import features
+
+    return "WEBP" if features.check("webp") else "JPEG"
+
+
+def render_thumbnails(image_path, targets, image_format):
+    """
+    Decode an image once and write every requested thumbnail size
+
+    Runs in worker processes, so it only takes plain arguments.
+
+    Parameters:
+    - image_path: Path to the original image
+    - targets: List of (output_path, (max_width, max_height)) tuples
+    - image_format: "WEBP" or "JPEG"
+
+    Returns:
+    - (width, height) of the original image
+    """
+    from PIL import Image
+
+    with Image.open(image_path) as img:
+        original_size = img.size
+        # Let JPEG decode at reduced scale when the thumbnails are much smaller
+        img.draft("RGB", max(size for _, size in targets))
+        write_thumbnails(img, targets, image_format)
+    return original_size
+
+
+def write_thumbnails(img, targets, image_format):
+    """
+    Write every requested thumbnail size of an already opened image
+
+    Parameters:
+    - img: PIL Image object (left unchanged)
+    - targets: List of (output_path, (max_width, max_height)) tuples
+    - image_format: "WEBP" or "JPEG"
+    """
+    from PIL import Image
+
+    work = img.convert("RGBA") if img.mode in ("RGBA", "LA", "P") else img.convert("RGB")
+    # Largest first so each step shrinks the previous result
+    for output_path, max_size in sorted(targets, key=lambda target: -max(target[1])):
+        work.thumbnail(max_size, Image.LANCZOS)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        tmp_path = f"{output_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if image_format == "WEBP":
+            work.save(tmp_path, format="WEBP", quality=WEBP_QUALITY, method=4)
+        else:
+            flattened = work
+            if work.mode == "RGBA":
+                # JPEG has no alpha channel; composite onto white
+                flattened = Image.new("RGB", work.size, (255, 255, 255))
+                flattened.paste(work, mask=work.getchannel("A"))
+            flattened.save(tmp_path, format="JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+        os.replace(tmp_path, output_path)
+
+
+def thumbnail_targets(image_path, sizes, extension):
+    """
+    Where each thumbnail of an image goes, next to the original
+
+    Parameters:
+    - image_path: Path to the original image
+    - sizes: Mapping of rendition name to max (width, height)
+    - extension: Thumbnail file extension (".webp" or ".jpg")
+
+    Returns:
+    - Dictionary mapping rendition name to (output_path, max_size)
+    """
+    catalog_dir, filename = os.path.split(image_path)
+    return {
+        name: (os.path.join(catalog_dir, THUMBNAIL_DIR_NAME, name, filename + extension), size)
+        for name, size in sizes.items()
+    }
+
+
+def _render_job(job):
+    # Pool-friendly wrapper that returns failures instead of raising
+    try:
+        return render_thumbnails(*job)
+    except Exception as e:
+        return e
+
+
+class ThumbnailEngine:
+    """
+    Builds and tracks multi-size thumbnails for catalog directories
+
+    Each catalog directory gets a manifest recording, per source image, the
+    size/mtime/content hash it was built from and the rendition paths.
+    Thumbnails are rebuilt only when the source actually changed, and whole
+    catalogs are rebuilt on a process pool. With a shared cache configured,
+    thumbnails another replica already rendered are downloaded instead.
+
+    Parameters:
+    - sizes: Mapping of rendition name to max (width, height)
+    - image_format: "WEBP" or "JPEG" (default: best supported)
+    - max_workers: Process pool size for catalog builds (default: CPU count)
+    """
+
+    def __init__(self, sizes=None, image_format=None, max_workers=None):
+        self.sizes = dict(sizes or THUMBNAIL_SIZES)
+        self.image_format = image_format or default_thumbnail_format()
+        self.extension = ".webp" if self.image_format == "WEBP" else ".jpg"
+        self.max_workers = max_workers
+        self._manifests = {}
+        self._lock = threading.Lock()
+
+    def thumbnail_paths(self, image_path):
+        """
+        Paths of every rendition for an image (whether built or not)
+
+        Parameters:
+        - image_path: Path to the original image
+
+        Returns:
+        - Dictionary mapping rendition name to path
+        """
+        targets = thumbnail_targets(image_path, self.sizes, self.extension)
+        return {name: path for name, (path, _) in targets.items()}
+
+    def manifest_entry(self, image_path):
+        """
+        Manifest record for an image (dimensions, content hash, renditions)
+
+        Parameters:
+        - image_path: Path to the original image
+
+        Returns:
+        - Copy of the manifest entry, or None if thumbnails were never built
+        """
+        catalog_dir, filename = os.path.split(image_path)
+        with self._lock:
+            entry = self._manifest_locked(catalog_dir).get(filename)
+            return dict(entry) if entry else None
+
+    def ensure(self, image_path):
+        """
+        Make sure all renditions of one image are built and current
+
+        Parameters:
+        - image_path: Path to the original image
+
+        Returns:
+        - Dictionary mapping rendition name to path, or None if the image is missing
+        """
+        try:
+            stat = os.stat(image_path)
+        except FileNotFoundError:
+            return None
+
+        catalog_dir, filename = os.path.split(image_path)
+        paths = self.thumbnail_paths(image_path)
+        with self._lock:
+            manifest = self._manifest_locked(catalog_dir)
+            entry = manifest.get(filename)
+        fresh, sha256 = self._is_fresh(entry, image_path, stat, paths)
+        if fresh:
+            if entry["mtime_ns"] != stat.st_mtime_ns:
+                # Touched but unchanged; remember the new mtime
+                self._record(catalog_dir, [(filename, self._entry(catalog_dir, stat, sha256, paths, entry["width"], entry["height"]))])
+            return paths
+
+        sha256 = sha256 or file_sha256(image_path)
+        size = self._fetch_shared(sha256, paths)
+        if size is None:
+            with metrics.span("thumbnails.render"):
+                size = render_thumbnails(image_path, self._targets(paths), self.image_format)
+            _thumbnails_built.inc(mode="single")
+            self._publish_shared(sha256, paths, size)
+        entry = self._entry(catalog_dir, stat, sha256, paths, *size)
+        self._record(catalog_dir, [(filename, entry)])
+        return paths
+
+    def build_catalog(self, catalog_path, parallel=True, progress=None):
+        """
+        Build missing or stale thumbnails for every image in a catalog directory
+
+        Parameters:
+        - catalog_path: Path to the catalog directory
+        - parallel: Render on a process pool (False renders in this thread)
+        - progress: Optional callable receiving (done, total) as images are rendered
+
+        Returns:
+        - Dictionary with built, fresh, fetched (from the shared cache),
+          failed and removed counts
+        """
+        stats = {"built": 0, "fresh": 0, "fetched": 0, "failed": 0, "removed": 0}
+        if not os.path.isdir(catalog_path):
+            return stats
+
+        with self._lock:
+            manifest = dict(self._manifest_locked(catalog_path))
+
+        # Work out which images need rendering
+        sources = set()
+        stale = []
+        touched = []
+        with os.scandir(catalog_path) as entries:
+            for dir_entry in entries:
+                if not dir_entry.is_file() or not dir_entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                stat = dir_entry.stat()
+                paths = self.thumbnail_paths(dir_entry.path)
+                sources.add(dir_entry.name)
+                entry = manifest.get(dir_entry.name)
+                fresh, sha256 = self._is_fresh(entry, dir_entry.path, stat, paths)
+                if fresh:
+                    stats["fresh"] += 1
+                    if entry["mtime_ns"] != stat.st_mtime_ns:
+                        touched.append((dir_entry.name, self._entry(catalog_path, stat, sha256, paths, entry["width"], entry["height"])))
+                else:
+                    stale.append((dir_entry.name, dir_entry.path, stat, sha256, paths))
+
+        updates = list(touched)
+        if stale and shared_cache("thumbnails"):
+            # Download what other replicas already rendered; render the rest
+            remaining = []
+            for filename, path, stat, sha256, paths in stale:
+                try:
+                    sha256 = sha256 or file_sha256(path)
+                except OSError:
+                    remaining.append((filename, path, stat, sha256, paths))
+                    continue
+                size = self._fetch_shared(sha256, paths)
+                if size is None:
+                    remaining.append((filename, path, stat, sha256, paths))
+                else:
+                    stats["fetched"] += 1
+                    updates.append((filename, self._entry(catalog_path, stat, sha256, paths, *size)))
+            stale = remaining
+        if stale:
+            jobs = [(path, self._targets(paths), self.image_format) for _, path, _, _, paths in stale]
+            with metrics.span("thumbnails.build_catalog"):
+                results = self._render_many(jobs, parallel, progress)
+            for (filename, path, stat, sha256, paths), result in zip(stale, results):
+                if isinstance(result, Exception):
+                    stats["failed"] += 1
+                    _thumbnails_failed.inc()
+                    continue
+                stats["built"] += 1
+                _thumbnails_built.inc(mode="bulk")
+                sha256 = sha256 or file_sha256(path)
+                self._publish_shared(sha256, paths, result)
+                updates.append((filename, self._entry(catalog_path, stat, sha256, paths, *result)))
+
+        # Forget thumbnails of images that were deleted
+        removed = [filename for filename in manifest if filename not in sources]
+        for filename in removed:
+            for path in manifest[filename].get("renditions", {}).values():
+                try:
+                    os.remove(os.path.join(catalog_path, path))
+                except OSError:
+                    pass
+        stats["removed"] = len(removed)
+
+        if updates or removed:
+            self._record(catalog_path, updates, removed)
+        return stats
+
+    def record_rendered(self, rendered):
+        """
+        Record thumbnails rendered outside the engine (e.g. during ingestion)
+
+        The renditions must already be at thumbnail_paths(image_path). They
+        are added to the manifests (one write per catalog directory) and
+        published to the shared cache, exactly as if the engine built them.
+
+        Parameters:
+        - rendered: List of (image_path, sha256, (width, height)) tuples
+        """
+        updates = {}
+        for image_path, sha256, size in rendered:
+            catalog_dir, filename = os.path.split(image_path)
+            try:
+                stat = os.stat(image_path)
+            except FileNotFoundError:
+                continue
+            paths = self.thumbnail_paths(image_path)
+            self._publish_shared(sha256, paths, size)
+            updates.setdefault(catalog_dir, []).append((filename, self._entry(catalog_dir, stat, sha256, paths, *size)))
+        for catalog_dir, entries in updates.items():
+            _thumbnails_built.inc(len(entries), mode="external")
+            self._record(catalog_dir, entries)
+
+    def _render_many(self, jobs, parallel, progress=None):
+        results = []
+        if not parallel or len(jobs) == 1:
+            for job in jobs:
+                results.append(_render_job(job))
+                if progress:
+                    progress(len(results), len(jobs))
+            return results
+
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        # Spawned workers avoid forking a multi-threaded server process;
+        # chunking keeps IPC overhead low for large catalogs
+        workers = self.max_workers or os.cpu_count() or 1
+        chunksize = max(1, min(64, len(jobs) // (workers * 4)))
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            for result in executor.map(_render_job, jobs, chunksize=chunksize):
+                results.append(result)
+                if progress:
+                    progress(len(results), len(jobs))
+        return results
+
+    def _targets(self, paths):
+        return [(paths[name], size) for name, size in self.sizes.items()]
+
+    def _shared_key(self, sha256):
+        sizes = ",".join(f"{name}={width}x{height}" for name, (width, height) in sorted(self.sizes.items()))
+        return f"{sha256}:{self.image_format}:{sizes}"
+
+    def _fetch_shared(self, sha256, paths):
+        # Write renditions from the shared cache; returns the original's
+        # (width, height), or None if they aren't there
+        shared = shared_cache("thumbnails")
+        value = shared.get(self._shared_key(sha256)) if shared else None
+        unpacked = unpack(value) if value else None
+        if unpacked is None:
+            return None
+        metadata, parts = unpacked
+        if set(parts) != set(paths) or not isinstance(metadata, dict) or "width" not in metadata:
+            return None
+        for name, path in paths.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(parts[name])
+            os.replace(tmp_path, path)
+        return metadata["width"], metadata["height"]
+
+    def _publish_shared(self, sha256, paths, size):
+        shared = shared_cache("thumbnails")
+        if not shared:
+            return
+        parts = {}
+        for name, path in paths.items():
+            with open(path, "rb") as f:
+                parts[name] = f.read()
+        shared.set(self._shared_key(sha256), pack({"width": size[0], "height": size[1]}, parts))
+
+    def _is_fresh(self, entry, image_path, stat, paths):
+        # Returns (fresh, sha256); sha256 is None when it wasn't needed
+        if entry is None or entry.get("format") != self.image_format:
+            return False, None
+        if set(entry.get("renditions", {})) != set(self.sizes):
+            return False, None
+        if not all(os.path.exists(path) for path in paths.values()):
+            return False, None
+        if entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            return True, entry["sha256"]
+        # Size or mtime changed; only rebuild if the content did too
+        sha256 = file_sha256(image_path)
+        return sha256 == entry["sha256"], sha256
+
+    def _entry(self, catalog_dir, stat, sha256, paths, width, height):
+        return {
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sha256": sha256,
+            "width": width,
+            "height": height,
+            "format": self.image_format,
+            "renditions": {name: os.path.relpath(path, catalog_dir) for name, path in paths.items()},
+        }
+
+    def _manifest_path(self, catalog_dir):
+        return os.path.join(catalog_dir, THUMBNAIL_DIR_NAME, MANIFEST_FILENAME)
+
+    def _manifest_locked(self, catalog_dir):
+        key = os.path.abspath(catalog_dir)
+        manifest = self._manifests.get(key)
+        if manifest is None:
+            try:
+                with open(self._manifest_path(catalog_dir), "r") as f:
+                    manifest = json.load(f)
+            except (FileNotFoundError, ValueError):
+                manifest = {}
+            self._manifests[key] = manifest
+        return manifest
+
+    def _record(self, catalog_dir, updates, removed=()):
+        with self._lock:
+            manifest = self._manifest_locked(catalog_dir)
+            for filename, entry in updates:
+                manifest[filename] = entry
+            for filename in removed:
+                manifest.pop(filename, None)
+            manifest_path = self._manifest_path(catalog_dir)
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+            tmp_path = f"{manifest_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(manifest, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, manifest_path)
+
+
+# Process-wide engine so manifests are loaded once
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_thumbnail_engine():
+    """
+    Get the process-wide thumbnail engine, creating it on first use
+
+    Returns:
+    - The shared ThumbnailEngine instance
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = ThumbnailEngine()
+    return _engine
@@ -0,0 +1,303 @@
+"""
+Try-on generation pipeline shared by the Streamlit app and batch runs
+
+Nothing in this module depends on Streamlit, so it can run on job workers,
+in batch_tryon.py or in any other process.
+"""
+import json
+import os
+import threading
+import uuid
+
+import metrics
+
+from result_cache import get_result_cache, make_cache_key
+from singleflight import get_single_flight
+
+# Base prompt for try-on
+BASE_PROMPT = """
+        Generate a high-quality, photorealistic image of the first person wearing the clothing/accessories shown in the other reference images. 
+        Maintain the exact facial features, skin tone, hairstyle, and body type of the first person. 
+        Only change their outfit to match the provided catalog items while keeping their identity intact.
+        The image should look natural and realistic, with appropriate lighting and background.
+        """
+
+# Output size (portrait orientation) and default quality
+DEFAULT_SIZE = "1024x1536"
+DEFAULT_QUALITY = "high"
+
+# Estimated USD per generated 1024x1536 image, by quality
+COST_PER_IMAGE = {"low": 0.016, "medium": 0.063, "high": 0.25}
+
+# Interactive render tiers: a fast, cheap draft while browsing combinations,
+# and an HD render of the same inputs on demand
+TIER_DRAFT = "draft"
+TIER_HD = "hd"
+DEFAULT_TIER_QUALITY = {TIER_DRAFT: "low", TIER_HD: "high"}
+
+# Directory holding generated images (also the result cache directory)
+GENERATED_DIR = "generated_images"
+
+# Partial images streamed per generation when a caller wants previews
+DEFAULT_PARTIAL_IMAGES = 2
+
+# Directory holding partial images shown while a generation is in progress
+PREVIEW_DIR = os.path.join(GENERATED_DIR, "previews")
+
+# Configuration parsed by get_config(), by path
+_configs = {}
+_configs_lock = threading.Lock()
+
+_result_cache_lookups = metrics.counter(
+    "tryon_result_cache_lookups_total", "Result cache lookups by outcome", ("result",)
+)
+
+
+def load_config(config_path=None):
+    """
+    Load the configuration from config.json, falling back to environment variables
+
+    Parameters:
+    - config_path: Path to the JSON config (default: config.json next to this module)
+
+    Returns:
+    - Configuration dictionary
+    """
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = config_path or os.path.join(base_dir, "config.json")
+    try:
+        with open(config_path, "r") as config_file:
+            return json.load(config_file)
+    except FileNotFoundError:
+        # Check for template file and provide guidance
+        template_path = os.path.join(base_dir, "config.template.json")
+        if os.path.exists(template_path):
+            print("⚠️ config.json not found! Please copy config.template.json to config.json and update with your credentials.")
+
+        # Use environment variables as fallback
+        return {
+            "imagegen_aoai_resource": os.getenv("imagegen_aoai_resource", ""),
+            "imagegen_aoai_endpoint": os.getenv("imagegen_aoai_endpoint", ""),
+            "imagegen_aoai_deployment": os.getenv("imagegen_aoai_deployment", ""),
+            "imagegen_aoai_api_key": os.getenv("imagegen_aoai_api_key", ""),
+            "tryon_job_workers": int(os.getenv("tryon_job_workers", "4")),
+            "result_cache_max_bytes": int(os.getenv("result_cache_max_bytes", str(512 * 1024 * 1024))),
+            "imagegen_aoai_requests_per_minute": float(os.getenv("imagegen_aoai_requests_per_minute", "20")),
+            "imagegen_aoai_max_in_flight": int(os.getenv("imagegen_aoai_max_in_flight", "4")),
+            "upload_max_side": int(os.getenv("upload_max_side", "1536")),
+            "storage_sweep_interval": int(os.getenv("storage_sweep_interval", "600")),
+            "storage_policies": json.loads(os.getenv("storage_policies", "{}")),
+            "tryon_api_url": os.getenv("tryon_api_url", ""),
+            "tryon_public_url": os.getenv("tryon_public_url", ""),
+            "imagegen_deployments": json.loads(os.getenv("imagegen_deployments", "[]")),
+            "imagegen_partial_images": int(os.getenv("imagegen_partial_images", str(DEFAULT_PARTIAL_IMAGES))),
+            "draft_quality": os.getenv("draft_quality", DEFAULT_TIER_QUALITY[TIER_DRAFT]),
+            "hd_quality": os.getenv("hd_quality", DEFAULT_TIER_QUALITY[TIER_HD]),
+            "metrics_enabled": os.getenv("metrics_enabled", "").lower() in ("1", "true", "yes"),
+            "metrics_port": int(os.getenv("metrics_port", "0")),
+            "metrics_file": os.getenv("metrics_file", ""),
+            "singleflight_lock_dir": os.getenv("singleflight_lock_dir", ""),
+            "shared_cache_url": os.getenv("shared_cache_url", ""),
+            "shared_cache_max_bytes": int(os.getenv("shared_cache_max_bytes", str(2 * 1024 * 1024 * 1024)))
+        }
+
+
+def get_config(config_path=None):
+    """
+    Configuration for this process, parsed on first use (see load_config())
+
+    Streamlit reruns the app script on every interaction; this keeps those
+    reruns from re-reading config.json.
+
+    Parameters:
+    - config_path: Path to the JSON config (default: config.json next to this module)
+
+    Returns:
+    - Configuration dictionary shared by all callers (do not modify it)
+    """
+    config = _configs.get(config_path)
+    if config is None:
+        with _configs_lock:
+            config = _configs.get(config_path)
+            if config is None:
+                config = _configs[config_path] = load_config(config_path)
+    return config
+
+
+def build_prompt(prompt_addon=""):
+    """
+    Full prompt for a try-on request
+
+    Parameters:
+    - prompt_addon: Optional extra instructions appended to the base prompt
+    """
+    prompt = BASE_PROMPT
+    if prompt_addon:
+        prompt += f"\n{prompt_addon}"
+    return prompt
+
+
+def estimated_cost(quality=DEFAULT_QUALITY):
+    """
+    Estimated USD cost of one uncached generation at a given quality
+    """
+    return COST_PER_IMAGE.get(quality, COST_PER_IMAGE[DEFAULT_QUALITY])
+
+
+def tier_quality(config, tier):
+    """
+    Image quality used for a render tier
+
+    Parameters:
+    - config: Configuration dictionary (draft_quality / hd_quality override
+      the defaults)
+    - tier: TIER_DRAFT or TIER_HD
+
+    Returns:
+    - Quality value sent to the deployment
+    """
+    if tier not in DEFAULT_TIER_QUALITY:
+        raise ValueError(f"Unknown render tier: {tier}")
+    return config.get(f"{tier}_quality") or DEFAULT_TIER_QUALITY[tier]
+
+
+def _request_keys(config, user_image_path, item_images, prompt, quality):
+    # The cache key identifies one render; the family key leaves out the
+    # quality, so every tier of the same inputs shares it. Deployments in a
+    # pool serve the same model, so the key names the top-level deployment
+    # whichever one generates the image.
+    params = {"n": 1, "size": DEFAULT_SIZE, "deployment": config.get("imagegen_aoai_deployment", "")}
+    cache_key = make_cache_key(user_image_path, item_images, prompt, dict(params, quality=quality))
+    family_key = make_cache_key(user_image_path, item_images, prompt, params)
+    return cache_key, family_key
+
+
+def find_variants(config, user_image_path, item_images, prompt_addon=""):
+    """
+    Previously generated renders of the same inputs, at any quality
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+    - user_image_path: Path to the user's photo
+    - item_images: List of paths to the catalog items
+    - prompt_addon: Optional extra instructions for the prompt
+
+    Returns:
+    - Dictionary mapping quality to image path
+    """
+    result_cache = get_result_cache(
+        cache_dir=GENERATED_DIR,
+        max_bytes=int(config.get("result_cache_max_bytes", 512 * 1024 * 1024))
+    )
+    _, family_key = _request_keys(config, user_image_path, item_images, build_prompt(prompt_addon), None)
+    return result_cache.variants(family_key)
+
+
+def generate_try_on(config, user_image_path, item_images, prompt_addon="", quality=DEFAULT_QUALITY, ticket=None,
+                    on_partial=None):
+    """
+    Generate a try-on image, or return a previous generation for identical inputs
+
+    Blocks until the image is written; call it from a worker thread.
+    Concurrent calls with identical inputs are coalesced: one of them calls
+    upstream and the others wait for its image (across processes too when
+    singleflight_lock_dir points at a shared directory).
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+    - user_image_path: Path to the user's photo
+    - item_images: List of paths to the catalog items
+    - prompt_addon: Optional extra instructions for the prompt
+    - quality: Image quality requested from the deployment
+    - ticket: Identifier shown in the upstream queue (e.g. a job ID)
+    - on_partial: Optional callable(index, png_bytes) run for each partial
+      image; when set (and imagegen_partial_images is not 0) the response is
+      streamed so a preview can be shown long before the final image
+
+    Returns:
+    - Dictionary with the image path, whether it came from the result
+      cache, whether it was shared with an identical call in flight
+      (coalesced), and the cache key
+    """
+    # Imported on first use: the HTTP client and image libraries are not
+    # needed to render the catalog
+    from deployment_router import get_deployment_router
+    from image_prep import get_payload_cache
+
+    # Shared router over the configured deployments (each with a pooled
+    # client and its own rate and concurrency limits)
+    router = get_deployment_router(config)
+    result_cache = get_result_cache(
+        cache_dir=GENERATED_DIR,
+        max_bytes=int(config.get("result_cache_max_bytes", 512 * 1024 * 1024))
+    )
+    payload_cache = get_payload_cache(max_side=int(config.get("upload_max_side", 1536)))
+    flights = get_single_flight(lock_dir=config.get("singleflight_lock_dir") or None)
+
+    prompt = build_prompt(prompt_addon)
+    data = {
+        "prompt": prompt,
+        "n": 1,
+        "size": DEFAULT_SIZE,
+        "quality": quality,
+    }
+
+    # Return a previous generation for identical inputs without calling upstream
+    with metrics.span("tryon.cache_lookup"):
+        cache_key, family_key = _request_keys(config, user_image_path, item_images, prompt, quality)
+        cached_path = result_cache.get(cache_key)
+    if cached_path:
+        _result_cache_lookups.inc(result="hit")
+        return {"path": cached_path, "cached": True, "coalesced": False, "cache_key": cache_key}
+    _result_cache_lookups.inc(result="miss")
+
+    def generate():
+        # An identical call may have finished between the lookup above and
+        # this one becoming the leader
+        cached_path = result_cache.get(cache_key)
+        if cached_path:
+            return {"path": cached_path, "cached": True, "cache_key": cache_key}
+        image_path = _generate_image(
+            config, router, payload_cache, user_image_path, item_images, data, ticket, on_partial
+        )
+        result_cache.put(cache_key, image_path, family=family_key, quality=quality)
+        return {"path": image_path, "cached": False, "cache_key": cache_key}
+
+    # Identical requests already in flight share one upstream call; a
+    # result from another process only counts if its image is still there
+    result, shared = flights.do(cache_key, generate, is_valid=lambda result: os.path.exists(result["path"]))
+    return dict(result, coalesced=shared)
+
+
+def _generate_image(config, router, payload_cache, user_image_path, item_images, data, ticket, on_partial):
+    from image_prep import prepare_upload_part
+
+    # Prepare the files: downscaled, metadata-free payloads held in memory so
+    # the request can be replayed on retry. Catalog items are normalized once
+    # and reused from the payload cache.
+    with metrics.span("tryon.prepare_upload"):
+        files = [prepare_upload_part(user_image_path, payload_cache)]
+        for item_path in item_images:
+            files.append(prepare_upload_part(item_path, payload_cache))
+
+    # Save location for the generated image
+    image_filename = f"generated_{str(uuid.uuid4())[:8]}.png"
+    os.makedirs(GENERATED_DIR, exist_ok=True)
+    image_path = os.path.join(GENERATED_DIR, image_filename)
+
+    # The router picks a deployment, whose governor queues calls fairly
+    # across callers and paces every attempt to its request quota, and fails
+    # over to another deployment on throttling or outages. The image is
+    # decoded from the streamed response straight into its output file.
+    partial_images = int(config.get("imagegen_partial_images", DEFAULT_PARTIAL_IMAGES))
+
+    def call(client, throttle):
+        if on_partial is not None and partial_images > 0:
+            return client.edit_stream_to_file(
+                files, data, image_path, partial_images, on_partial, before_attempt=throttle
+            )
+        return client.edit_to_file(files, data, image_path, before_attempt=throttle)
+
+    with metrics.span("tryon.upstream_call"):
+        router.call(call, ticket)
+    return image_path
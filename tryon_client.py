@@ -0,0 +1,186 @@
+"""
+Client for the try-on HTTP API (api_server.py)
+
+TryOnAPIClient has the same methods as tryon_service.TryOnService, so the
+Streamlit app can use either; get_tryon_client() picks one from the config.
+"""
+import threading
+import time
+from urllib.parse import quote
+
+from tryon import TIER_DRAFT
+from upload_store import UploadError
+
+# Seconds before an API request is abandoned
+DEFAULT_TIMEOUT = 30
+
+
+class TryOnAPIError(Exception):
+    """
+    Raised when the try-on API fails or can't be reached (5xx responses,
+    connection errors and timeouts)
+
+    Parameters:
+    - message: Error message from the API
+    - status_code: HTTP status of the response (None if there was none)
+    """
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class TryOnRequestError(TryOnAPIError, ValueError):
+    """
+    Raised when the try-on API rejects a request (4xx responses, e.g. an
+    unknown category or path); a ValueError, like the in-process service's
+    validation errors
+    """
+
+
+class TryOnAPIClient:
+    """
+    Remote implementation of the try-on operations over HTTP
+
+    Parameters:
+    - base_url: Root URL of the API (e.g. http://tryon-api:8080)
+    - timeout: Seconds before a request is abandoned
+    - public_url: Root URL of the same API as seen from users' browsers;
+      when set, images are linked there instead of being relayed through
+      the app
+    """
+
+    def __init__(self, base_url, timeout=DEFAULT_TIMEOUT, public_url=None):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.public_url = public_url.rstrip("/") if public_url else None
+        # Imported here so the in-process mode never loads an HTTP client
+        import requests
+
+        self.session = requests.Session()
+        self._connection_errors = requests.RequestException
+
+    def catalog_page(self, category, page=1, items_per_page=6):
+        return self._request("GET", f"/catalog/{category}", params={"page": page, "per_page": items_per_page})
+
+    def search(self, query="", category=None, filters=None, page=1, items_per_page=6):
+        params = [("q", query), ("page", page), ("per_page", items_per_page)]
+        if category:
+            params.append(("category", category))
+        for field, values in (filters or {}).items():
+            params.extend((field, value) for value in values)
+        return self._request("GET", "/search", params=params)
+
+    def similar_items(self, path, k=6):
+        return self._request("GET", "/similar", params={"path": path, "k": k})["items"]
+
+    def save_upload(self, data, kind="user_image"):
+        return self._request(
+            "POST", f"/uploads/{kind}", data=bytes(data),
+            headers={"Content-Type": "application/octet-stream"}
+        )["path"]
+
+    def sample_images(self):
+        return self._request("GET", "/samples")["paths"]
+
+    def submit(self, user_image_path, item_paths, prompt_addon="", tier=TIER_DRAFT):
+        return self._request("POST", "/jobs", json={
+            "user_image": user_image_path,
+            "items": list(item_paths),
+            "prompt": prompt_addon,
+            "tier": tier,
+        })["job_id"]
+
+    def variants(self, user_image_path, item_paths, prompt_addon=""):
+        return self._request("POST", "/variants", json={
+            "user_image": user_image_path,
+            "items": list(item_paths),
+            "prompt": prompt_addon,
+        })
+
+    def job(self, job_id):
+        try:
+            return self._request("GET", f"/jobs/{job_id}")
+        except TryOnAPIError as e:
+            if e.status_code == 404:
+                return None
+            raise
+
+    def reference(self, session_id, paths):
+        self._request("PUT", f"/sessions/{session_id}/references", json={"paths": [p for p in paths if p]})
+
+    def warmup_status(self):
+        return self.health()["warmup"]
+
+    def wait_for_first_page(self, timeout):
+        deadline = time.time() + timeout
+        while not self.warmup_status()["first_page_ready"] and time.time() < deadline:
+            time.sleep(0.5)
+
+    def health(self):
+        return self._request("GET", "/healthz")
+
+    def image_source(self, path, rendition=None):
+        # base_url is usually only reachable from the app, so browsers get
+        # the image bytes unless a public URL for the API is configured
+        if self.public_url:
+            return self.public_url + self._file_path(path, rendition)
+        return self.read_file(path, rendition)
+
+    def read_file(self, path, rendition=None):
+        return self._request("GET", self._file_path(path, rendition), raw=True)
+
+    def _file_path(self, path, rendition):
+        file_path = f"/files?path={quote(path)}"
+        if rendition:
+            file_path += f"&rendition={quote(rendition)}"
+        return file_path
+
+    def _request(self, method, path, raw=False, **kwargs):
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=self.timeout, **kwargs)
+        except self._connection_errors as e:
+            raise TryOnAPIError(f"Try-on API unavailable: {e}")
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("error", response.text)
+            except ValueError:
+                message = response.text
+            # Upload validation errors are shown to the user like local ones
+            if response.status_code in (400, 413) and path.startswith("/uploads/"):
+                raise UploadError(message)
+            if response.status_code < 500:
+                raise TryOnRequestError(message, response.status_code)
+            raise TryOnAPIError(message, response.status_code)
+        if raw:
+            return response.content
+        return response.json() if response.content else None
+
+
+# Remote clients keyed by base URL
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_tryon_client(config):
+    """
+    Get the try-on implementation for a configuration
+
+    Parameters:
+    - config: Configuration dictionary from tryon.load_config()
+
+    Returns:
+    - A TryOnAPIClient when tryon_api_url is set, otherwise the in-process
+      TryOnService
+    """
+    api_url = config.get("tryon_api_url")
+    if not api_url:
+        from tryon_service import get_tryon_service
+
+        return get_tryon_service(config)
+
+    with _clients_lock:
+        client = _clients.get(api_url)
+        if client is None:
+            client = _clients[api_url] = TryOnAPIClient(api_url, public_url=config.get("tryon_public_url"))
+        return client
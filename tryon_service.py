@@ -0,0 +1,478 @@
+"""
+Headless try-on service: catalog paging, uploads, jobs and results
+
+The Streamlit app (in-process) and the HTTP API (api_server.py) are both
+thin clients of this module; nothing here depends on Streamlit.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import cache_backend
+import metrics
+from catalog_index import get_catalog_index
+from catalog_search import get_catalog_search
+from catalog_warmup import start_catalog_warmup, warmup_in_progress
+from renditions import RENDITION_SIZES, get_rendition_cache
+from jobs import JOB_QUEUED, JOB_RUNNING, current_job_id, get_job_queue, set_current_job_preview
+from storage_lifecycle import get_storage_lifecycle, is_sample_image
+from thumbnails import IMAGE_EXTENSIONS, get_thumbnail_engine
+from tryon import (GENERATED_DIR, PREVIEW_DIR, TIER_DRAFT, DEFAULT_TIER_QUALITY, find_variants,
+                   generate_try_on, tier_quality)
+from upload_store import get_upload_store
+
+# Catalog categories and their directories
+CATALOG_PATHS = {
+    "clothing": "catalog/clothing",
+    "accessories": "catalog/accessories",
+}
+
+# Upload kinds and the directories they are stored in
+UPLOAD_DIRS = {
+    "user_image": "uploads/user_images",
+    "item": "uploads/user_items",
+}
+
+# Directories whose images may be used as try-on inputs
+INPUT_ROOTS = ("catalog", "uploads")
+
+# Directories whose images may be served to clients
+SERVED_ROOTS = ("catalog", "uploads", GENERATED_DIR)
+
+# Client sessions whose references are held at once; beyond this the least
+# recently seen session loses its references first
+MAX_SESSIONS = 10000
+
+# Job stages reported to clients while a job is in flight
+STAGE_QUEUED = "queued"
+STAGE_WAITING_UPSTREAM = "waiting_upstream"
+STAGE_GENERATING = "generating"
+
+
+def check_path(path, roots):
+    """
+    Validate that a client-supplied path is an existing image under one of the roots
+
+    Parameters:
+    - path: Relative path as returned by the service (e.g. catalog/clothing/x.png)
+    - roots: Directories (relative to the working directory) the path may be in
+
+    Returns:
+    - The normalized relative path
+
+    Raises:
+    - ValueError if the path escapes the roots, is not an image or does not exist
+    """
+    normalized = os.path.normpath(path)
+    real_path = os.path.realpath(normalized)
+    if not any(real_path.startswith(os.path.realpath(root) + os.sep) for root in roots):
+        raise ValueError(f"Path is not allowed: {path}")
+    if not normalized.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(real_path):
+        raise ValueError(f"Image not found: {path}")
+    return normalized
+
+
+def catalog_page(catalog_path, page=1, items_per_page=6):
+    """
+    Get a paginated list of catalog items with thumbnails
+
+    Parameters:
+    - catalog_path: Path to the catalog directory
+    - page: Current page number (1-indexed)
+    - items_per_page: Number of items per page
+
+    Returns:
+    - Dictionary with items and pagination info
+    """
+    with metrics.span("catalog.page_build"):
+        return _catalog_page(catalog_path, page, items_per_page)
+
+
+def _catalog_page(catalog_path, page, items_per_page):
+    index = get_catalog_index()
+    try:
+        index.refresh(catalog_path, light=warmup_in_progress())
+    except Exception as e:
+        print(f"Error loading catalog items: {e}")
+
+    # Only the requested page is read from the index
+    catalog_data = index.page(catalog_path, page, items_per_page)
+    _repair_thumbnails(catalog_data["items"])
+    return catalog_data
+
+
+def _repair_thumbnails(items):
+    # Rebuild thumbnails that went missing since the item was indexed
+    engine = get_thumbnail_engine()
+    for item in items:
+        if item["thumbnail_path"] != item["path"] and os.path.exists(item["thumbnail_path"]):
+            continue
+        try:
+            thumbnails = engine.ensure(item["path"])
+        except Exception as e:
+            print(f"Error creating thumbnail: {e}")
+            thumbnails = None
+        item["thumbnails"] = thumbnails or {}
+        item["thumbnail_path"] = item["thumbnails"].get("grid", item["path"])
+
+
+class TryOnService:
+    """
+    Process-local implementation of the try-on operations
+
+    Owns the shared job queue, deployment router, caches, upload stores,
+    storage sweeper and catalog warm-up for this process.
+
+    Parameters:
+    - config: Configuration dictionary from tryon.load_config()
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # Off unless metrics_enabled is set; starts any configured exporters
+        metrics.configure(config)
+        # Shared thumbnails, descriptors, payloads and results across
+        # replicas, when shared_cache_url is set
+        cache_backend.configure(config)
+        max_side = int(config.get("upload_max_side", 1536))
+
+        # Shared worker pool for try-on generations (one per process, not per session)
+        self.job_queue = get_job_queue(max_workers=int(config.get("tryon_job_workers", 4)))
+
+        # The deployment router (HTTP clients), the upload payload cache and
+        # the result cache index are set up by the first generation, not
+        # before the first page can render
+
+        # Content-addressed stores for uploads, normalized once at ingest
+        self.upload_stores = {
+            kind: get_upload_store(upload_dir, max_side=max_side)
+            for kind, upload_dir in UPLOAD_DIRS.items()
+        }
+
+        # Quotas and TTLs for uploads and generated images, swept in the background
+        self.lifecycle = get_storage_lifecycle(config.get("storage_policies"))
+        self.lifecycle.start(interval=int(config.get("storage_sweep_interval", 600)))
+        # Client session -> last reference() time, least recently seen first
+        self._sessions = OrderedDict()
+        self._sessions_lock = threading.Lock()
+
+        # Thumbnails and the catalog index are prepared in the background
+        self.warmup = start_catalog_warmup(list(CATALOG_PATHS.values()))
+
+    @property
+    def router(self):
+        """
+        Process-wide routing, rate limits and concurrency limits for the
+        image deployments, created on first use
+        """
+        from deployment_router import get_deployment_router
+
+        return get_deployment_router(self.config)
+
+    def catalog_page(self, category, page=1, items_per_page=6):
+        """
+        One page of a catalog category (see catalog_page())
+
+        Parameters:
+        - category: Key of CATALOG_PATHS ('clothing' or 'accessories')
+        - page: Page number (1-indexed)
+        - items_per_page: Number of items per page
+        """
+        if category not in CATALOG_PATHS:
+            raise ValueError(f"Unknown catalog category: {category}")
+        return catalog_page(CATALOG_PATHS[category], page, items_per_page)
+
+    def search(self, query="", category=None, filters=None, page=1, items_per_page=6):
+        """
+        Search the catalog by words and facets (see CatalogSearch.search())
+
+        Parameters:
+        - query: Words to match against item names and metadata
+        - category: Key of CATALOG_PATHS to search, or None for all of them
+        - filters: Optional dictionary mapping a facet to accepted values
+        - page: Page number (1-indexed)
+        - items_per_page: Number of items per page
+
+        Returns:
+        - Dictionary with items, pagination info and facet counts
+        """
+        if category is not None and category not in CATALOG_PATHS:
+            raise ValueError(f"Unknown catalog category: {category}")
+        catalog_paths = [CATALOG_PATHS[category]] if category else list(CATALOG_PATHS.values())
+
+        with metrics.span("catalog.search"):
+            index = get_catalog_index()
+            for catalog_path in catalog_paths:
+                try:
+                    index.refresh(catalog_path, light=warmup_in_progress())
+                except Exception as e:
+                    print(f"Error loading catalog items: {e}")
+            results = get_catalog_search().search(catalog_paths, query, filters, page, items_per_page)
+            _repair_thumbnails(results["items"])
+        return results
+
+    def similar_items(self, path, k=6):
+        """
+        Catalog items that look most like a catalog item
+
+        Parameters:
+        - path: Path of a catalog item (from catalog_page())
+        - k: Number of items to return
+
+        Returns:
+        - List of item dictionaries with a "similarity" score, best first
+
+        Raises:
+        - ValueError if the path is not a catalog image
+        """
+        path = check_path(path, ("catalog",))
+        return get_catalog_index().similar(path, max(1, min(int(k), 50)))
+
+    def save_upload(self, data, kind="user_image"):
+        """
+        Store an uploaded image
+
+        Parameters:
+        - data: Bytes-like object with the uploaded file contents
+        - kind: 'user_image' or 'item'
+
+        Returns:
+        - Path of the stored image
+
+        Raises:
+        - UploadError if the file is not a usable image
+        """
+        if kind not in self.upload_stores:
+            raise ValueError(f"Unknown upload kind: {kind}")
+        return self.upload_stores[kind].save_bytes(data)
+
+    def sample_images(self):
+        """
+        Photos offered by "Use Sample Photo"
+
+        Returns:
+        - Paths of the protected sample photos, or of any stored user photo
+          if there are none
+        """
+        sample_dir = UPLOAD_DIRS["user_image"]
+        os.makedirs(sample_dir, exist_ok=True)
+        samples = []
+        others = []
+        with os.scandir(sample_dir) as entries:
+            for entry in entries:
+                if entry.name.lower().endswith(('.png', '.jpg', '.jpeg')):
+                    path = os.path.join(sample_dir, entry.name)
+                    (samples if is_sample_image(path) else others).append(path)
+        return sorted(samples) or others
+
+    def submit(self, user_image_path, item_paths, prompt_addon="", tier=TIER_DRAFT):
+        """
+        Queue a try-on generation
+
+        Parameters:
+        - user_image_path: Path of the user's photo (from save_upload)
+        - item_paths: Paths of catalog or uploaded items
+        - prompt_addon: Optional extra instructions for the prompt
+        - tier: 'draft' (fast, low quality) or 'hd' (same inputs, high quality)
+
+        Returns:
+        - Job ID for job()
+
+        Raises:
+        - ValueError if an input path or the tier is invalid
+        """
+        if not item_paths:
+            raise ValueError("Select at least one item to try on")
+        quality = tier_quality(self.config, tier)
+        user_image_path = check_path(user_image_path, INPUT_ROOTS)
+        item_paths = [check_path(path, INPUT_ROOTS) for path in item_paths]
+        # Inputs stay protected from the sweeper while the job is queued or running
+        reference_id = f"job:{uuid.uuid4().hex}"
+        self.lifecycle.reference(reference_id, [user_image_path] + item_paths)
+        try:
+            return self.job_queue.submit(self._generate, user_image_path, item_paths, prompt_addon, quality, reference_id)
+        except Exception:
+            self.lifecycle.release(reference_id)
+            raise
+
+    def variants(self, user_image_path, item_paths, prompt_addon=""):
+        """
+        Renders of the same inputs already available, by tier
+
+        Parameters:
+        - user_image_path, item_paths, prompt_addon: As for submit()
+
+        Returns:
+        - Dictionary mapping each tier ('draft', 'hd') to an image path or None
+
+        Raises:
+        - ValueError if an input path is invalid
+        """
+        user_image_path = check_path(user_image_path, INPUT_ROOTS)
+        item_paths = [check_path(path, INPUT_ROOTS) for path in item_paths]
+        by_quality = find_variants(self.config, user_image_path, item_paths, prompt_addon)
+        return {tier: by_quality.get(tier_quality(self.config, tier)) for tier in DEFAULT_TIER_QUALITY}
+
+    def job(self, job_id):
+        """
+        Current state of a job
+
+        Parameters:
+        - job_id: ID returned by submit()
+
+        Returns:
+        - Dictionary with status, stage, position, result, preview (path of
+          the latest partial image), error and timestamps, or None if the job
+          is unknown or expired
+        """
+        job = self.job_queue.get(job_id)
+        if job is None:
+            return None
+
+        upstream_position = self.router.position(job_id)
+        job["stage"] = None
+        job["position"] = None
+        if job["status"] == JOB_QUEUED:
+            # Behind everyone already waiting for the image service
+            job["stage"] = STAGE_QUEUED
+            job["position"] = self.router.stats()["waiting"] + job["queue_position"]
+        elif upstream_position is not None:
+            job["stage"] = STAGE_WAITING_UPSTREAM
+            job["position"] = upstream_position
+        elif job["status"] == JOB_RUNNING:
+            job["stage"] = STAGE_GENERATING
+        return job
+
+    def reference(self, session_id, paths):
+        """
+        Protect a session's files from the storage sweeper
+
+        References expire once a session has been silent for the sweeper's
+        session TTL; only the MAX_SESSIONS most recently seen sessions keep
+        theirs.
+
+        Parameters:
+        - session_id: Stable identifier of the client session
+        - paths: Paths the session currently displays or will submit
+        """
+        now = time.time()
+        cutoff = now - self.lifecycle.session_ttl
+        dropped = []
+        with self._sessions_lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = now
+            while len(self._sessions) > MAX_SESSIONS or next(iter(self._sessions.values())) < cutoff:
+                dropped.append(self._sessions.popitem(last=False)[0])
+        for old_session_id in dropped:
+            self.lifecycle.release(old_session_id)
+        self.lifecycle.reference(session_id, paths)
+
+    def warmup_status(self):
+        """
+        Catalog warm-up status (see CatalogWarmup.status())
+        """
+        return self.warmup.status()
+
+    def wait_for_first_page(self, timeout):
+        """
+        Block until the first catalog page is ready, or the timeout passes
+        """
+        self.warmup.first_page_ready.wait(timeout=timeout)
+
+    def health(self):
+        """
+        Liveness and load information for monitoring
+        """
+        return {
+            "status": "ok",
+            "jobs": self.job_queue.stats(),
+            "upstream": self.router.stats(),
+            "warmup": self.warmup.status(),
+            "storage": self.lifecycle.stats(),
+        }
+
+    def image_source(self, path, rendition=None):
+        """
+        Something st.image() can display for a service path (here: a path)
+
+        Parameters:
+        - path: Catalog, upload or result path
+        - rendition: Optional name from RENDITION_SIZES ('strip', 'preview',
+          'full') to get a cached display-sized copy instead of the original
+        """
+        if rendition is None:
+            return path
+        return self.rendition(path, rendition)
+
+    def rendition(self, path, name):
+        """
+        Path to a display-sized rendition of a served image (see RenditionCache.get())
+
+        Parameters:
+        - path: Catalog, upload or result path
+        - name: Name from RENDITION_SIZES
+        """
+        if name not in RENDITION_SIZES:
+            raise ValueError(f"Unknown rendition: {name}")
+        return get_rendition_cache().get(check_path(path, SERVED_ROOTS), name)
+
+    def read_file(self, path):
+        """
+        Bytes of a served image (e.g. a result for the download button)
+        """
+        with open(check_path(path, SERVED_ROOTS), "rb") as f:
+            return f.read()
+
+    def _generate(self, user_image_path, item_paths, prompt_addon, quality, reference_id=None):
+        # Runs on a job worker thread, so errors are reported through the job
+        # status. The job ID is shown in the upstream queue.
+        job_id = current_job_id() or uuid.uuid4().hex
+
+        def on_partial(index, image_bytes):
+            # Partial images are published as the job's preview; they are
+            # left to the storage sweeper (see the generated_images/previews
+            # policy) so a client never loses the frame it is displaying
+            os.makedirs(PREVIEW_DIR, exist_ok=True)
+            path = os.path.join(PREVIEW_DIR, f"{job_id}_{index}.png")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(image_bytes)
+            os.replace(tmp_path, path)
+            set_current_job_preview(path)
+
+        try:
+            result = generate_try_on(
+                self.config, user_image_path, item_paths, prompt_addon, quality=quality, ticket=job_id,
+                on_partial=on_partial
+            )
+        finally:
+            # The result is new enough to be in the sweeper's grace window
+            # until the session references it
+            if reference_id:
+                self.lifecycle.release(reference_id)
+        return result["path"]
+
+
+# Process-wide service
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_tryon_service(config):
+    """
+    Get the process-wide try-on service, creating it on first use
+
+    Parameters:
+    - config: Configuration dictionary used when the service is first created
+
+    Returns:
+    - The shared TryOnService instance
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = TryOnService(config)
+    return _service
@@ -0,0 +1,139 @@
+import os
+import threading
+from io import BytesIO
+
+import metrics
+from content_hash import bytes_sha256
+from image_prep import DEFAULT_MAX_SIDE, normalize_image
+
+# Largest upload accepted, in bytes (25 MiB)
+MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+
+# Image formats accepted at ingest
+ALLOWED_FORMATS = ("JPEG", "PNG", "WEBP", "MPO")
+
+# Characters of the content hash used in stored filenames
+HASH_PREFIX_LENGTH = 16
+
+
+_uploads_total = metrics.counter("uploads_total", "Uploads by outcome (stored, duplicate, rejected)", ("result",))
+
+
+class UploadError(ValueError):
+    """
+    Raised when an upload is not a usable image
+    """
+
+
+class UploadStore:
+    """
+    Content-addressed store for user uploads
+
+    Files are named after the SHA-256 of the uploaded bytes, so saving the same
+    upload again (e.g. on every Streamlit rerun) is a no-op that returns the
+    existing path. New uploads are validated and normalized once, at ingest,
+    and written atomically.
+
+    Parameters:
+    - save_dir: Directory holding the stored files
+    - max_side: Longest side of stored images in pixels
+    """
+
+    def __init__(self, save_dir, max_side=DEFAULT_MAX_SIDE):
+        self.save_dir = save_dir
+        self.max_side = max_side
+        self._lock = threading.Lock()
+        self._known = {}
+
+    def save_bytes(self, data):
+        """
+        Store uploaded image bytes, or return the existing copy
+
+        Parameters:
+        - data: Bytes-like object with the uploaded file contents
+
+        Returns:
+        - Path to the stored (normalized) image
+        """
+        key = bytes_sha256(data)[:HASH_PREFIX_LENGTH]
+        existing = self._existing_path(key)
+        if existing:
+            _uploads_total.inc(result="duplicate")
+            return existing
+
+        try:
+            img = self._validate(data)
+        except UploadError:
+            _uploads_total.inc(result="rejected")
+            raise
+        with metrics.span("uploads.normalize"):
+            normalized, _, extension = normalize_image(img, self.max_side)
+
+        os.makedirs(self.save_dir, exist_ok=True)
+        path = os.path.join(self.save_dir, key + extension)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(normalized)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            self._known[key] = path
+        _uploads_total.inc(result="stored")
+        return path
+
+    def _existing_path(self, key):
+        with self._lock:
+            path = self._known.get(key)
+        if path and os.path.exists(path):
+            return path
+        for extension in (".jpg", ".png"):
+            path = os.path.join(self.save_dir, key + extension)
+            if os.path.exists(path):
+                with self._lock:
+                    self._known[key] = path
+                return path
+        return None
+
+    def _validate(self, data):
+        # PIL is only needed once someone uploads
+        from PIL import Image
+
+        if len(data) > MAX_UPLOAD_BYTES:
+            raise UploadError(f"Image is too large ({len(data) // (1024 * 1024)} MB); the limit is {MAX_UPLOAD_BYTES // (1024 * 1024)} MB")
+        try:
+            # verify() checks integrity but leaves the image unusable, so reopen
+            with Image.open(BytesIO(data)) as probe:
+                probe.verify()
+            img = Image.open(BytesIO(data))
+            img.load()
+        except Image.DecompressionBombError:
+            raise UploadError("Image dimensions are too large")
+        except Exception:
+            raise UploadError("The uploaded file is not a valid image")
+        if img.format not in ALLOWED_FORMATS:
+            raise UploadError(f"Unsupported image format: {img.format}")
+        return img
+
+
+# One store per directory, shared by all sessions
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_upload_store(save_dir, max_side=DEFAULT_MAX_SIDE):
+    """
+    Get the shared upload store for a directory, creating it on first use
+
+    Parameters:
+    - save_dir: Directory holding the stored files
+    - max_side: Longest side used when the store is first created
+
+    Returns:
+    - The shared UploadStore instance
+    """
+    key = os.path.normpath(save_dir)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = UploadStore(save_dir, max_side)
+        return store
@@ -0,0 +1,492 @@
+import base64
+import email.utils
+import json
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+# API version used for the images/edits endpoint
+API_VERSION = "2025-04-01-preview"
+
+# Status codes that are worth retrying
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# Default client settings (seconds unless noted)
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_READ_TIMEOUT = 180
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE = 1.0
+DEFAULT_BACKOFF_MAX = 30.0
+DEFAULT_MAX_RETRY_AFTER = 120
+DEFAULT_POOL_SIZE = 16
+
+# Bytes read at a time when streaming a response
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+# JSON key holding the generated image
+B64_JSON_MARKER = b'"b64_json"'
+
+# Server-sent event types of a streamed images/edits response
+EVENT_PARTIAL_IMAGE = "image_edit.partial_image"
+EVENT_COMPLETED = "image_edit.completed"
+
+# Partial images the service can stream before the final one
+MAX_PARTIAL_IMAGES = 3
+
+_requests_total = metrics.counter(
+    "upstream_requests_total", "images/edits attempts by HTTP status (or 'error')", ("status",)
+)
+_retries_total = metrics.counter("upstream_retries_total", "images/edits retries by reason", ("reason",))
+_bytes_uploaded = metrics.counter("upstream_bytes_uploaded_total", "Image bytes sent to images/edits")
+_bytes_downloaded = metrics.counter("upstream_image_bytes_total", "Decoded image bytes received")
+
+
+class UpstreamError(Exception):
+    """
+    Raised when the image-edits endpoint returns an error or cannot be reached
+
+    Parameters:
+    - message: Human readable description
+    - status_code: HTTP status code, or None for connection errors
+    - retry_after: Seconds the service asked callers to wait, if it did
+    """
+
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UpstreamTimeout(UpstreamError):
+    """
+    Raised when the service accepted a request but did not answer in time
+
+    The generation may still be running (and billed) upstream, so callers
+    should not resend the request elsewhere.
+    """
+
+
+def build_edits_url(config):
+    """
+    Build the images/edits URL for the configured Azure OpenAI deployment
+
+    The optional imagegen_aoai_edits_url key overrides the URL entirely, which
+    is how a local mock server is plugged in.
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+
+    Returns:
+    - Full URL of the images/edits endpoint
+    """
+    if config.get("imagegen_aoai_edits_url"):
+        return config["imagegen_aoai_edits_url"]
+    return (
+        f"https://{config['imagegen_aoai_resource']}.openai.azure.com/openai/deployments/"
+        f"{config['imagegen_aoai_deployment']}/images/edits?api-version={API_VERSION}"
+    )
+
+
+def parse_retry_after(headers):
+    """
+    Read the server's requested retry delay from response headers
+
+    Azure OpenAI sends retry-after-ms in addition to the standard Retry-After
+    header, which may be either a number of seconds or an HTTP date.
+
+    Parameters:
+    - headers: Response headers (case-insensitive mapping)
+
+    Returns:
+    - Delay in seconds, or None if the server did not ask for one
+    """
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("Retry-After")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def write_b64_json_image(chunks, out_file):
+    """
+    Decode the first b64_json field of a streamed JSON body into a file
+
+    Only the bytes between the field's quotes are decoded, a few kilobytes at
+    a time; everything else in the body is skipped.
+
+    Parameters:
+    - chunks: Iterable of bytes chunks making up the JSON response
+    - out_file: Binary file object to write the decoded image to
+
+    Returns:
+    - Number of decoded bytes written
+    """
+    state = "search"
+    buffer = b""
+    pending = b""
+    written = 0
+    for chunk in chunks:
+        if state == "done":
+            # Drain the rest so the connection can go back to the pool
+            continue
+        buffer += chunk
+
+        if state == "search":
+            index = buffer.find(B64_JSON_MARKER)
+            if index < 0:
+                # Keep just enough to match a marker split across chunks
+                buffer = buffer[-(len(B64_JSON_MARKER) - 1):]
+                continue
+            buffer = buffer[index + len(B64_JSON_MARKER):]
+            state = "value"
+
+        if state == "value":
+            # Skip the colon and whitespace up to the opening quote
+            index = buffer.find(b'"')
+            if index < 0:
+                continue
+            buffer = buffer[index + 1:]
+            state = "data"
+
+        if state == "data":
+            end = buffer.find(b'"')
+            encoded = buffer if end < 0 else buffer[:end]
+            # JSON may escape "/" as "\/"
+            encoded = pending + encoded.replace(b"\\", b"")
+            usable = len(encoded) - len(encoded) % 4
+            if usable:
+                decoded = base64.b64decode(encoded[:usable])
+                out_file.write(decoded)
+                written += len(decoded)
+            pending = encoded[usable:]
+            buffer = b""
+            if end >= 0:
+                state = "done"
+
+    if state != "done" or pending:
+        raise UpstreamError("Image service response did not contain a complete image")
+    return written
+
+
+def iter_sse_events(lines):
+    """
+    Parse a server-sent event stream into events
+
+    An event ends with a blank line; one cut off by the end of the stream
+    is dropped, as the event-stream format requires.
+
+    Parameters:
+    - lines: Iterable of decoded lines (without line endings)
+
+    Returns:
+    - Generator of (event_name, data) tuples; event_name is None when the
+      server did not send an "event:" field
+    """
+    event = None
+    data = []
+    for line in lines:
+        if not line:
+            # A blank line ends the event
+            if data:
+                yield event, "\n".join(data)
+            event = None
+            data = []
+        elif line.startswith(":"):
+            continue
+        elif line.startswith("event:"):
+            event = line[6:].strip()
+        elif line.startswith("data:"):
+            # Only the single space after the colon is part of the syntax
+            value = line[5:]
+            data.append(value[1:] if value.startswith(" ") else value)
+
+
+def write_streamed_image(lines, out_file, on_partial=None):
+    """
+    Consume a streamed images/edits response, reporting partial images as they
+    arrive and writing the final image to a file
+
+    Parameters:
+    - lines: Iterable of decoded lines of the event stream
+    - out_file: Binary file object to write the final image to
+    - on_partial: Optional callable(index, image_bytes) run for each partial image
+
+    Returns:
+    - Number of decoded bytes written
+    """
+    written = None
+    for event, data in iter_sse_events(lines):
+        if written is not None or data == "[DONE]":
+            # Drain the rest so the connection can go back to the pool
+            continue
+        try:
+            payload = json.loads(data)
+        except ValueError:
+            raise UpstreamError(f"Image service sent a malformed event: {data[:200]}")
+        event_type = payload.get("type") or event
+        if event_type == EVENT_PARTIAL_IMAGE:
+            if on_partial is not None:
+                on_partial(payload.get("partial_image_index", 0), base64.b64decode(payload["b64_json"]))
+        elif event_type == EVENT_COMPLETED:
+            image = base64.b64decode(payload["b64_json"])
+            out_file.write(image)
+            written = len(image)
+        elif event_type == "error" or "error" in payload:
+            error = payload.get("error") or {}
+            raise UpstreamError(f"Image service failed while streaming: {error.get('message', data[:500])}")
+    if written is None:
+        raise UpstreamError("Image service stream ended before the final image")
+    return written
+
+
+def _error_message(response):
+    # Prefer the service's own error message when it sends one
+    try:
+        return response.json()["error"]["message"]
+    except Exception:
+        return response.text[:500] or response.reason
+
+
+class ImageEditsClient:
+    """
+    Pooled HTTP client for the images/edits endpoint
+
+    A single requests.Session is shared by every caller so connections and TLS
+    sessions are reused. Throttling and transient failures are retried with
+    jittered exponential backoff, honoring Retry-After when the server sends it.
+
+    Parameters:
+    - url: Full images/edits URL (Azure deployment or a local mock server)
+    - api_key: Value for the api-key header
+    - connect_timeout: Seconds to wait for a connection
+    - read_timeout: Seconds to wait for the response
+    - max_retries: Retries after the first attempt
+    - backoff_base: Base delay for exponential backoff
+    - backoff_max: Upper bound for a single backoff delay
+    - max_retry_after: Give up instead of waiting when Retry-After exceeds this
+    - pool_size: Maximum number of pooled connections
+    """
+
+    def __init__(self, url, api_key, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=DEFAULT_READ_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, backoff_max=DEFAULT_BACKOFF_MAX,
+                 max_retry_after=DEFAULT_MAX_RETRY_AFTER, pool_size=DEFAULT_POOL_SIZE):
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_retry_after = max_retry_after
+
+        self.session = requests.Session()
+        # Retries are handled here so that Retry-After and jitter apply
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers["api-key"] = api_key
+
+    def edit(self, files, data, before_attempt=None):
+        """
+        Call the images/edits endpoint
+
+        Parameters:
+        - files: List of (field, (filename, bytes, content_type)) tuples; bytes
+          rather than open files so the request can be replayed on retry
+        - data: Form fields (prompt, n, size, quality...)
+        - before_attempt: Optional callable run before every attempt, e.g. a
+          rate limiter's throttle()
+
+        Returns:
+        - Decoded JSON response
+        """
+        response = self._post(files, data, before_attempt)
+        return response.json()
+
+    def edit_to_file(self, files, data, output_path, before_attempt=None):
+        """
+        Call the images/edits endpoint and write the generated image to a file
+
+        The response is streamed and its b64_json field is decoded in chunks
+        straight into the file, so the full JSON body, the base64 string and
+        the decoded image are never held in memory at the same time.
+
+        Parameters:
+        - files, data, before_attempt: As for edit()
+        - output_path: Where to write the image bytes (written atomically)
+
+        Returns:
+        - Number of image bytes written
+        """
+        response = self._post(files, data, before_attempt, stream=True)
+        tmp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        try:
+            # Download, base64 decode and write overlap, so they share a span
+            with metrics.span("upstream.download_decode"), response, open(tmp_path, "wb") as out_file:
+                written = write_b64_json_image(response.iter_content(RESPONSE_CHUNK_SIZE), out_file)
+            os.replace(tmp_path, output_path)
+        except requests.RequestException as e:
+            # The connection dropped partway through the body
+            raise UpstreamError(f"Image service response was interrupted: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _bytes_downloaded.inc(written)
+        return written
+
+    def edit_stream_to_file(self, files, data, output_path, partial_images, on_partial, before_attempt=None):
+        """
+        Call the images/edits endpoint in streaming mode, reporting partial
+        images while the final one is generated
+
+        Parameters:
+        - files, data, before_attempt: As for edit()
+        - output_path: Where to write the final image bytes (written atomically)
+        - partial_images: Number of partial images to request (1-3)
+        - on_partial: Callable(index, image_bytes) run for each partial image
+
+        Returns:
+        - Number of image bytes written
+        """
+        data = dict(data, stream="true", partial_images=min(max(1, int(partial_images)), MAX_PARTIAL_IMAGES))
+        response = self._post(files, data, before_attempt, stream=True)
+        tmp_path = f"{output_path}.{threading.get_ident()}.tmp"
+        try:
+            with metrics.span("upstream.stream"), response, open(tmp_path, "wb") as out_file:
+                # Event streams are UTF-8 whatever the Content-Type says
+                response.encoding = "utf-8"
+                lines = response.iter_lines(chunk_size=RESPONSE_CHUNK_SIZE, decode_unicode=True)
+                written = write_streamed_image(lines, out_file, on_partial)
+            os.replace(tmp_path, output_path)
+        except requests.RequestException as e:
+            # The connection dropped partway through the stream
+            raise UpstreamError(f"Image service stream was interrupted: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        _bytes_downloaded.inc(written)
+        return written
+
+    def _post(self, files, data, before_attempt, stream=False):
+        # Send the request, retrying throttled and transient failures, and
+        # return the first successful response
+        attempt = 0
+        upload_bytes = sum(len(part[1][1]) for part in files)
+        while True:
+            if before_attempt is not None:
+                before_attempt()
+            _bytes_uploaded.inc(upload_bytes)
+            try:
+                # Time to response headers (the body is streamed separately)
+                with metrics.span("upstream.request"):
+                    response = self.session.post(self.url, files=files, data=data, timeout=self.timeout, stream=stream)
+            except (requests.ConnectionError, requests.ConnectTimeout) as e:
+                _requests_total.inc(status="error")
+                if attempt >= self.max_retries:
+                    raise UpstreamError(f"Could not reach the image service: {e}")
+                _retries_total.inc(reason="connection")
+                self._sleep(self._backoff_delay(attempt))
+                attempt += 1
+                continue
+            except requests.Timeout as e:
+                _requests_total.inc(status="error")
+                # The request may already be running upstream; don't resend it
+                raise UpstreamTimeout(f"Timed out waiting for the image service: {e}")
+
+            _requests_total.inc(status=response.status_code)
+            if response.ok:
+                return response
+
+            if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= self.max_retries:
+                raise UpstreamError(
+                    f"Image service returned {response.status_code}: {_error_message(response)}",
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers)
+                )
+
+            delay = self._retry_delay(attempt, response)
+            if delay is None:
+                raise UpstreamError(
+                    f"Image service is throttling requests ({response.status_code}); please try again later",
+                    status_code=response.status_code,
+                    retry_after=parse_retry_after(response.headers)
+                )
+            response.close()
+            _retries_total.inc(reason=response.status_code)
+            self._sleep(delay)
+            attempt += 1
+
+    def close(self):
+        """
+        Close all pooled connections
+        """
+        self.session.close()
+
+    def _backoff_delay(self, attempt):
+        # Full jitter keeps retries from many sessions from lining up
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, attempt, response):
+        retry_after = parse_retry_after(response.headers)
+        if retry_after is None:
+            return self._backoff_delay(attempt)
+        if retry_after > self.max_retry_after:
+            return None
+        # Small jitter on top so waiting clients don't all return at once
+        return retry_after + random.uniform(0, min(1.0, retry_after * 0.1 + 0.1))
+
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+
+
+# Process-wide clients keyed by URL so every session shares one pool
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_upstream_client(config):
+    """
+    Get the shared images/edits client for a configuration, creating it on first use
+
+    Parameters:
+    - config: Configuration dictionary from load_config()
+
+    Returns:
+    - The shared ImageEditsClient for the configured endpoint
+    """
+    url = build_edits_url(config)
+    key = (url, config.get("imagegen_aoai_api_key", ""))
+    client = _clients.get(key)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = ImageEditsClient(
+                    url,
+                    config.get("imagegen_aoai_api_key", ""),
+                    connect_timeout=float(config.get("imagegen_aoai_connect_timeout", DEFAULT_CONNECT_TIMEOUT)),
+                    read_timeout=float(config.get("imagegen_aoai_read_timeout", DEFAULT_READ_TIMEOUT)),
+                    max_retries=int(config.get("imagegen_aoai_max_retries", DEFAULT_MAX_RETRIES)),
+                    max_retry_after=float(config.get("imagegen_aoai_max_retry_after", DEFAULT_MAX_RETRY_AFTER)),
+                )
+                _clients[key] = client
+    return client